@@ -0,0 +1,205 @@
+"""Response cache for the read-only API.
+
+Every GET under /api is a pure function of its path, its query string, the
+shape it is asked for (rows, columns or Arrow, see formats.py) and the
+database, so finished responses (the body, and any KEPT_HEADERS such as
+the next-page cursor) are kept in an in-process LRU keyed by path, sorted
+query params and shape, bounded by CACHE_MAX_BYTES of body. A repeat
+request is answered without touching DuckDB.
+
+The cache is tied to a fingerprint of the database: size and mtime of the
+DuckDB file and of run_pipeline.py's state file (rewritten by every pipeline
+run). When it changes, every entry is dropped, along with the sketch,
+scoring and search caches. A MotherDuck database has no local file, so
+there entries just expire after CACHE_TTL seconds.
+
+Each cached response carries a strong ETag (a hash of its body). A request
+whose If-None-Match matches gets a bodiless 304.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+from . import formats, keyset, scoring, search, sketches
+from .db import DB_PATH, _is_motherduck
+
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 3600))
+PIPELINE_STATE_PATH = os.environ.get("PIPELINE_STATE_PATH", DB_PATH + ".pipeline.json")
+
+# Paths that are not cached: liveness, debugging, and files served from disk
+UNCACHED = {"/api/health", "/api/providers/debug/oig", "/api/map/providers/arrow"}
+# Bodies above this share of the budget are served but not kept
+MAX_ENTRY_SHARE = 8
+# Response headers kept with the body (lower-case)
+KEPT_HEADERS = {keyset.NEXT_CURSOR.lower()}
+
+
+class _Entry:
+    __slots__ = ("body", "etag", "media_type", "headers")
+
+    def __init__(self, body, etag, media_type, headers=None):
+        self.body = body
+        self.etag = etag
+        self.media_type = media_type
+        self.headers = headers or {}
+
+
+class ResponseCache:
+    """LRU of response bodies, bounded by total bytes."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def check(self, fingerprint):
+        """Drop everything if the database changed since the last call."""
+        with self.lock:
+            if fingerprint == self.fingerprint:
+                return
+            self.entries.clear()
+            self.size = 0
+            self.fingerprint = fingerprint
+        sketches._load.cache_clear()
+        scoring._load.cache_clear()
+        search._load_providers.cache_clear()
+        search._load_procedures.cache_clear()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_bytes // MAX_ENTRY_SHARE:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self.entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+cache = ResponseCache()
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def db_fingerprint():
+    """Changes whenever the database or the pipeline run behind it does."""
+    if _is_motherduck():
+        return int(time.time() // CACHE_TTL)
+    return _stat(DB_PATH), _stat(DB_PATH + ".wal"), _stat(PIPELINE_STATE_PATH)
+
+
+def cache_key(request: Request):
+    """Path, query params sorted by name (repeats keep their order) and shape."""
+    params = sorted(request.query_params.multi_items(), key=lambda kv: kv[0])
+    return request.url.path, tuple(params), formats.negotiate(request.headers.get("accept", ""))
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [t.strip() for t in header.split(",")]
+    return "*" in candidates or tag in candidates
+
+
+def _respond(request, entry, status):
+    headers = {**entry.headers, "ETag": entry.etag, "X-Cache": status, "Vary": "Accept"}
+    if _matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type=entry.media_type, headers=headers)
+
+
+class CacheMiddleware:
+    """ASGI middleware serving GET /api requests from the cache.
+
+    Plain ASGI rather than @app.middleware("http"), which would hide client
+    disconnects from the endpoints (see executor.py).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (scope["type"] != "http" or scope["method"] != "GET"
+                or not path.startswith("/api/") or path in UNCACHED):
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        cache.check(db_fingerprint())
+        key = cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            return await _respond(request, entry, "HIT")(scope, receive, send)
+
+        # Buffer a 200 response in a formats.py shape to cache it; pass anything else straight on
+        start, chunks, passthrough = {}, [], False
+
+        async def capture(message):
+            nonlocal passthrough
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers", []))
+                media_type = headers.get(b"content-type", b"").decode("latin-1")
+                if message["status"] != 200 or not media_type.startswith(tuple(formats.SHAPES)):
+                    passthrough = True
+                    return await send(message)
+                start["media_type"] = media_type
+                start["headers"] = {
+                    name.decode("latin-1"): value.decode("latin-1")
+                    for name, value in headers.items() if name.decode("latin-1").lower() in KEPT_HEADERS
+                }
+            elif passthrough:
+                await send(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        if passthrough or not start:
+            return
+        body = b"".join(chunks)
+        entry = _Entry(body, etag(body), start["media_type"], start["headers"])
+        cache.put(key, entry)
+        await _respond(request, entry, "MISS")(scope, receive, send)
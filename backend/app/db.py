@@ -1,10 +1,30 @@
-"""DuckDB connection management for FastAPI."""
+"""DuckDB connection management for FastAPI.
+
+The database is opened once per process, so every request shares one
+buffer pool and one warm cache. Each route handler borrows a cursor (a
+connection to that same instance) from a pool of at most DB_POOL_SIZE
+while it runs (see executor.py), waiting up to DB_POOL_TIMEOUT seconds
+for one before answering 503. The pool records how long handlers waited.
+
+DUCKDB_MEMORY_LIMIT (e.g. "4GB") and DUCKDB_THREADS are passed to DuckDB
+when set. The app closes the pool and the database on shutdown.
+"""
+import asyncio
+import contextvars
+import os
 import threading
+import time
+
 import duckdb
-import os
 
 DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT")
+THREADS = os.environ.get("DUCKDB_THREADS")
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
 
+# Cursor borrowed by the running route handler (see executor.run)
+_request_cursor = contextvars.ContextVar("db_cursor", default=None)
 _local = threading.local()
 
 
@@ -12,11 +32,104 @@ def _is_motherduck() -> bool:
     return DB_PATH.startswith("md:")
 
 
+class CursorPool:
+    """One DuckDB instance and a bounded pool of cursors on it."""
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.con = None
+        self.idle = []
+        self.in_use = 0
+        self.slots = None
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def connection(self) -> duckdb.DuckDBPyConnection:
+        """The shared database connection, opened on first use."""
+        with self.lock:
+            if self.con is None:
+                config = {}
+                if MEMORY_LIMIT:
+                    config["memory_limit"] = MEMORY_LIMIT
+                if THREADS:
+                    config["threads"] = int(THREADS)
+                if _is_motherduck():
+                    self.con = duckdb.connect(self.path, config=config)
+                else:
+                    self.con = duckdb.connect(self.path, read_only=True, config=config)
+            return self.con
+
+    async def acquire(self, timeout=POOL_TIMEOUT) -> duckdb.DuckDBPyConnection:
+        """Wait for a free slot and return a cursor; raises TimeoutError."""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.size)
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.timeouts += 1
+            raise
+        wait = time.perf_counter() - t0
+        con = self.connection()
+        with self.lock:
+            cursor = self.idle.pop() if self.idle else None
+            self.in_use += 1
+            self.acquired += 1
+            if wait > 0.001:
+                self.waited += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        return cursor or con.cursor()
+
+    def release(self, cursor):
+        with self.lock:
+            self.in_use -= 1
+            if self.con is not None:
+                self.idle.append(cursor)
+        self.slots.release()
+
+    def close(self):
+        """Close every idle cursor and the database."""
+        with self.lock:
+            for cursor in self.idle:
+                cursor.close()
+            self.idle = []
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "size": self.size,
+                "open": len(self.idle) + self.in_use,
+                "in_use": self.in_use,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+
+pool = CursorPool()
+
+
 def get_db() -> duckdb.DuckDBPyConnection:
-    """Get a thread-local DuckDB connection (read-only)."""
-    if not hasattr(_local, "conn") or _local.conn is None:
-        if _is_motherduck():
-            _local.conn = duckdb.connect(DB_PATH)
-        else:
-            _local.conn = duckdb.connect(DB_PATH, read_only=True)
-    return _local.conn
+    """The running route handler's cursor (read-only).
+
+    Outside a request (scripts, startup), a cursor of the current thread.
+    """
+    cursor = _request_cursor.get()
+    if cursor is not None:
+        return cursor
+    con = pool.connection()
+    if getattr(_local, "con", None) is not con:
+        _local.con, _local.cursor = con, con.cursor()
+    return _local.cursor
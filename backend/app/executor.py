@@ -0,0 +1,162 @@
+"""Run route handlers off the event loop, with concurrency limits.
+
+Route handlers stay plain functions calling get_db(); @offload turns one
+into an async endpoint that awaits it on a worker thread. Handlers run in
+one of two lanes, each a fixed set of threads:
+
+  light  lookups (QUERY_THREADS, default 6)
+  heavy  analytic scans and aggregations (HEAVY_QUERY_THREADS, default 2)
+
+A burst of heavy requests queues for its own lane and leaves the light
+one free, so cheap lookups keep a low latency. A route can also cap how
+many of its own requests run at once (HEAVY_ROUTE_LIMIT for heavy routes
+by default). The two lanes together use at most DB_POOL_SIZE cursors, so
+a handler that got a thread never waits for a cursor; the module refuses
+to load if QUERY_THREADS + HEAVY_QUERY_THREADS exceeds DB_POOL_SIZE.
+
+A handler borrows its cursor only while it runs. While it runs, the
+endpoint polls for the client hanging up; if it does, the query is
+interrupted and the cursor goes back to the pool.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+from . import db, formats
+
+QUERY_THREADS = int(os.environ.get("QUERY_THREADS", 6))
+HEAVY_QUERY_THREADS = int(os.environ.get("HEAVY_QUERY_THREADS", 2))
+HEAVY_ROUTE_LIMIT = int(os.environ.get("HEAVY_ROUTE_LIMIT", 2))
+if QUERY_THREADS + HEAVY_QUERY_THREADS > db.POOL_SIZE:
+    raise ValueError(
+        f"QUERY_THREADS ({QUERY_THREADS}) + HEAVY_QUERY_THREADS ({HEAVY_QUERY_THREADS}) "
+        f"must not exceed DB_POOL_SIZE ({db.POOL_SIZE})"
+    )
+# Seconds between checks for a client that went away
+DISCONNECT_POLL = 0.1
+# Status for requests abandoned by the client (nginx's "client closed request")
+CLIENT_CLOSED = 499
+
+
+class _Limit:
+    """An asyncio semaphore created on first use, with queue counts."""
+
+    def __init__(self, size):
+        self.size = size
+        self.semaphore = None
+        self.running = 0
+        self.waiting = 0
+
+    async def __aenter__(self):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.size)
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    async def __aexit__(self, *exc):
+        self.running -= 1
+        self.semaphore.release()
+
+    def stats(self):
+        return {"limit": self.size, "running": self.running, "waiting": self.waiting}
+
+
+class _Lane:
+    def __init__(self, name, threads):
+        self.limit = _Limit(threads)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix=f"{name}-query")
+
+
+LANES = {"light": _Lane("light", QUERY_THREADS), "heavy": _Lane("heavy", HEAVY_QUERY_THREADS)}
+_routes = {}
+_cancelled = 0
+
+
+async def run(request: Request, call, lane: str = "light", limit: Optional[_Limit] = None):
+    """Await call() on a lane's thread with a pooled cursor for get_db().
+
+    Returns a 499 response instead if the client disconnects first, and a
+    503 if no cursor frees up within DB_POOL_TIMEOUT.
+    """
+    global _cancelled
+    lane = LANES[lane]
+    async with limit or contextlib.nullcontext(), lane.limit:
+        try:
+            cursor = await db.pool.acquire()
+        except asyncio.TimeoutError:
+            return JSONResponse({"detail": "Database busy, try again shortly."}, status_code=503)
+        context = contextvars.copy_context()
+        context.run(db._request_cursor.set, cursor)
+        context.run(formats._accept.set, request.headers.get("accept", ""))
+        future = asyncio.get_running_loop().run_in_executor(lane.executor, context.run, call)
+
+        def finished(future):
+            # Back to the pool only once the query has stopped, even if we
+            # stopped waiting; an interrupted query's error is expected
+            db.pool.release(cursor)
+            if not future.cancelled():
+                future.exception()
+
+        future.add_done_callback(finished)
+        try:
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL)
+                if done:
+                    return future.result()
+                if await request.is_disconnected():
+                    break
+        except asyncio.CancelledError:
+            cursor.interrupt()
+            _cancelled += 1
+            raise
+        cursor.interrupt()
+        _cancelled += 1
+        await asyncio.wait({future})
+        return Response(status_code=CLIENT_CLOSED)
+
+
+def offload(heavy: bool = False, limit: Optional[int] = None):
+    """Decorator making a sync route handler an async endpoint that awaits run().
+
+    heavy picks the heavy lane; limit caps the route's concurrent requests
+    (default HEAVY_ROUTE_LIMIT for heavy routes, none for light ones).
+    """
+    lane = "heavy" if heavy else "light"
+    if limit is None and heavy:
+        limit = HEAVY_ROUTE_LIMIT
+
+    def decorate(fn):
+        route_limit = _Limit(limit) if limit else None
+        if route_limit:
+            _routes[fn.__name__] = route_limit
+
+        @functools.wraps(fn)
+        async def endpoint(request: Request, **kwargs):
+            return await run(request, functools.partial(fn, **kwargs), lane, route_limit)
+
+        signature = inspect.signature(fn)
+        request_param = inspect.Parameter("request", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=Request)
+        endpoint.__signature__ = signature.replace(parameters=[request_param, *signature.parameters.values()])
+        return endpoint
+
+    return decorate
+
+
+def stats() -> dict:
+    return {
+        "lanes": {name: lane.limit.stats() for name, lane in LANES.items()},
+        "routes": {name: limit.stats() for name, limit in _routes.items()},
+        "cancelled": _cancelled,
+    }
@@ -0,0 +1,118 @@
+"""Response formats for the list endpoints: row JSON, columnar JSON or Arrow.
+
+A list endpoint hands its executed DuckDB query (or an Arrow table) to
+respond(), which reads it as Arrow and encodes it in the shape the
+request's Accept header prefers:
+
+  application/json                        rows, [{"npi": ..., ...}, ...]
+                                          (the default)
+  application/vnd.medicaid.columns+json   {"columns": [...], "data":
+                                          {"npi": [...], ...}}, each
+                                          column's values in row order
+  application/vnd.apache.arrow.stream     an Arrow IPC stream
+
+Column names are the keys, so the query's column aliases are the API's
+field names. Conversions are per column, not per value: integer sums come
+out of DuckDB as decimal128(38, 0) and are sent as int64, other decimals as
+float64, and in JSON dates and timestamps are ISO 8601 strings. Values are
+encoded with orjson rather than FastAPI's jsonable_encoder.
+
+executor.run makes the request's Accept header available to the handler.
+"""
+import contextvars
+
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+from fastapi import Response
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+COLUMNS_JSON = "application/vnd.medicaid.columns+json"
+# Media type -> shape, in order of preference when an Accept header ties
+SHAPES = {ARROW_STREAM: "arrow", COLUMNS_JSON: "columns", "application/json": "json"}
+
+# Accept header of the running route handler's request (see executor.run)
+_accept = contextvars.ContextVar("accept", default="")
+
+
+def _qualities(accept: str) -> dict:
+    """Media type -> q of the types an Accept header names."""
+    qualities = {}
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type:
+            qualities[media_type.lower()] = q
+    return qualities
+
+
+def negotiate(accept: str) -> str:
+    """'arrow', 'columns' or 'json': the shape the header prefers (json by default)."""
+    qualities = _qualities(accept)
+    best = max(SHAPES, key=lambda media_type: qualities.get(media_type, 0.0))
+    return SHAPES[best] if qualities.get(best, 0.0) > 0 else "json"
+
+
+def _numbers(table: pa.Table) -> pa.Table:
+    """table with decimals cast to JSON's number types."""
+    schema = pa.schema([
+        field.with_type(pa.int64() if field.type.scale == 0 else pa.float64())
+        if pa.types.is_decimal(field.type) else field
+        for field in table.schema
+    ])
+    return table.cast(schema) if schema != table.schema else table
+
+
+def _text(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Dates and timestamps as ISO 8601 strings; other columns as they are."""
+    if pa.types.is_date(column.type):
+        return column.cast(pa.string())
+    if pa.types.is_timestamp(column.type):
+        return pc.replace_substring(column.cast(pa.string()), " ", "T", max_replacements=1)
+    return column
+
+
+def _values(column: pa.ChunkedArray) -> list:
+    """column as a list of Python values, None for nulls."""
+    column = _text(column)
+    # numpy keeps nulls as None in strings and NaN (null to orjson) in floats,
+    # but would turn integers with nulls into floats
+    if column.null_count and not (pa.types.is_string(column.type) or pa.types.is_floating(column.type)):
+        return column.to_pylist()
+    return column.to_numpy(zero_copy_only=False).tolist()
+
+
+def _array(column: pa.ChunkedArray):
+    """column for orjson: a numpy array if it's numeric without nulls."""
+    if not column.null_count and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+        return column.to_numpy()
+    return _values(column)
+
+
+def respond(result) -> Response:
+    """result (an executed DuckDB query or an Arrow table) in the requested shape."""
+    table = _numbers(result if isinstance(result, pa.Table) else result.arrow())
+    shape = negotiate(_accept.get())
+    if shape == "arrow":
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW_STREAM)
+
+    names = table.column_names
+    if shape == "columns":
+        body = orjson.dumps(
+            {"columns": names, "data": {name: _array(table[name]) for name in names}},
+            option=orjson.OPT_SERIALIZE_NUMPY,
+        )
+        return Response(body, media_type=COLUMNS_JSON)
+    columns = [_values(column) for column in table.columns]
+    return Response(orjson.dumps([dict(zip(names, row)) for row in zip(*columns)]),
+                    media_type="application/json")
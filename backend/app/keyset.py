@@ -0,0 +1,62 @@
+"""Keyset pagination for the ranked lists.
+
+With LIMIT/OFFSET, DuckDB sorts and then discards every row before the
+page, so page 10,000 costs far more than page 1. Instead, a full page
+comes with an opaque token in its X-Next-Cursor header. The token holds
+the last row's sort value and its tie-breaking key (npi, npi_id,
+hcpcs_code or stored position). Sent back as `cursor`, it turns into a
+WHERE condition selecting the rows after that one, so each page is a
+filtered top-N the size of one page.
+
+`offset` still works, and with a cursor it counts from the cursor. A
+token only fits the sort_by it came from. A token for another sort, or
+one that doesn't decode, is a 400.
+"""
+import base64
+
+import orjson
+from fastapi import HTTPException
+
+from . import formats
+
+NEXT_CURSOR = "X-Next-Cursor"
+# Extra columns a paged query selects: each row's sort value and tie-breaking key
+SORT, KEY = "_sort", "_key"
+
+
+def encode(sort_by: str, value, key) -> str:
+    """Token for the rows after (value, key) in a list sorted by sort_by."""
+    return base64.urlsafe_b64encode(orjson.dumps([sort_by, value, key])).rstrip(b"=").decode()
+
+
+def decode(token: str, sort_by: str):
+    """(value, key) of a token, which must come from a list sorted by sort_by."""
+    try:
+        name, value, key = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not (value is None or isinstance(value, (int, float))) or not isinstance(key, (int, str)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if name != sort_by:
+        raise HTTPException(status_code=400, detail=f"Cursor is for sort_by={name}, not {sort_by}")
+    return value, key
+
+
+def after(token: str, sort_by: str, sort_expr: str, key_expr: str):
+    """SQL condition and params for the rows after the token's row, in
+    `sort_expr DESC NULLS LAST, key_expr` order."""
+    value, key = decode(token, sort_by)
+    if value is None:
+        return f"({sort_expr} IS NULL AND {key_expr} > ?)", [key]
+    condition = f"({sort_expr} < ? OR ({sort_expr} = ? AND {key_expr} > ?) OR {sort_expr} IS NULL)"
+    return condition, [value, value, key]
+
+
+def page(result, sort_by: str, limit: int):
+    """result as a formats.respond() response, without SORT and KEY, with a
+    NEXT_CURSOR header when the page is full."""
+    table = formats._numbers(result.arrow())
+    response = formats.respond(table.drop_columns([SORT, KEY]))
+    if limit > 0 and table.num_rows == limit:
+        response.headers[NEXT_CURSOR] = encode(sort_by, table[SORT][-1].as_py(), table[KEY][-1].as_py())
+    return response
@@ -1,12 +1,35 @@
 """FastAPI application for Medicaid Provider Spending Dashboard."""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
+from . import cache, db, executor, keyset, search
 from .routers import stats, providers, procedures, map_routes, analysis
 
-app = FastAPI(title="Medicaid Provider Spending API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the search indexes before serving; fingerprint first, or the first
+    # request's cache check would drop it again
+    cache.cache.check(cache.db_fingerprint())
+    try:
+        await asyncio.to_thread(search.warm)
+    except Exception as e:
+        logger.warning("search indexes not loaded: %s", e)
+    yield
+    db.pool.close()
+
+
+app = FastAPI(title="Medicaid Provider Spending API", version="1.0.0", lifespan=lifespan)
+
+# Registered before CORS so that CORS wraps it and cached responses get its headers too
+app.add_middleware(cache.CacheMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +43,7 @@ app.add_middleware(
     ],
     allow_methods=["GET"],
     allow_headers=["*"],
+    expose_headers=[keyset.NEXT_CURSOR],
 )
 
 app.include_router(stats.router, prefix="/api/stats", tags=["stats"])
@@ -36,4 +60,9 @@ if os.path.isdir(ARROW_DIR):
 
 @app.get("/api/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "cache": cache.cache.stats(),
+        "db_pool": db.pool.stats(),
+        "queries": executor.stats(),
+    }
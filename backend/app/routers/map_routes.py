@@ -3,6 +3,8 @@ from typing import Optional
 from fastapi import APIRouter, Query
 from fastapi.responses import FileResponse
 from ..db import get_db
+from ..executor import offload
+from .. import formats
 import os
 
 router = APIRouter()
@@ -26,6 +28,7 @@ def providers_arrow():
 
 
 @router.get("/providers")
+@offload(heavy=True)
 def providers_json(
     state: Optional[str] = None,
     month_from: Optional[str] = None,
@@ -33,7 +36,7 @@ def providers_json(
     limit: int = 5000,
     excluded_only: bool = False,
 ):
-    """Filtered provider map data as JSON (for filtered views)."""
+    """Filtered provider map data (for filtered views), as rows, columns or Arrow (see formats.py)."""
     from .providers import _has_oig_table
 
     db = get_db()
@@ -52,7 +55,7 @@ def providers_json(
     has_oig = _has_oig_table(db)
     oig_join = ""
     if excluded_only and has_oig:
-        oig_join = "JOIN (SELECT DISTINCT npi FROM oig_exclusions) o ON o.npi = map_providers.npi"
+        oig_join = "JOIN (SELECT DISTINCT npi_id FROM oig_exclusions) o ON o.npi_id = map_providers.npi_id"
 
     # If time filters are set, we need to re-aggregate from monthly data
     if month_from or month_to:
@@ -68,17 +71,17 @@ def providers_json(
 
         oig_join_t = ""
         if excluded_only and has_oig:
-            oig_join_t = "JOIN (SELECT DISTINCT npi FROM oig_exclusions) o ON o.npi = p.npi"
+            oig_join_t = "JOIN (SELECT DISTINCT npi_id FROM oig_exclusions) o ON o.npi_id = p.npi_id"
 
         # Rebuild from monthly aggregates with time filter
-        rows = db.execute(f"""
+        result = db.execute(f"""
             SELECT
                 p.npi, p.name, p.state, p.city, p.lat, p.lng,
                 SUM(m.total_paid) AS total_paid,
                 SUM(m.total_claims) AS total_claims,
                 SUM(m.total_beneficiaries) AS total_beneficiaries
             FROM map_providers p
-            JOIN agg_provider_monthly m ON m.npi = p.npi
+            JOIN agg_provider_monthly m ON m.npi_id = p.npi_id
             {oig_join_t}
             WHERE p.lat IS NOT NULL AND p.lng IS NOT NULL
                 AND {time_where}
@@ -86,34 +89,31 @@ def providers_json(
             GROUP BY p.npi, p.name, p.state, p.city, p.lat, p.lng
             ORDER BY total_paid DESC
             LIMIT ?
-        """, params + [limit]).fetchall()
+        """, params + [limit])
     else:
-        rows = db.execute(f"""
+        result = db.execute(f"""
             SELECT npi, name, state, city, lat, lng, total_paid, total_claims, total_beneficiaries
             FROM map_providers
             {oig_join}
             {where}
             ORDER BY total_paid DESC
             LIMIT ?
-        """, params + [limit]).fetchall()
+        """, params + [limit])
 
-    return [
-        {
-            "npi": r[0], "name": r[1], "state": r[2], "city": r[3],
-            "lat": r[4], "lng": r[5], "total_paid": r[6],
-            "total_claims": r[7], "total_beneficiaries": r[8],
-        }
-        for r in rows
-    ]
+    return formats.respond(result)
 
 
 @router.get("/providers/procedure/{code}")
+@offload(heavy=True)
 def providers_by_procedure(
     code: str,
     state: Optional[str] = None,
     limit: int = 2000,
 ):
-    """Providers performing a specific procedure, with location and spending."""
+    """Providers performing a specific procedure, with location and spending.
+
+    Rows, columns or an Arrow stream, as the client asks (see formats.py).
+    """
     db = get_db()
     params: list = [code]
     state_filter = ""
@@ -122,24 +122,17 @@ def providers_by_procedure(
         params.append(state)
     params.append(limit)
 
-    rows = db.execute(f"""
+    result = db.execute(f"""
         SELECT
             m.npi, m.name, m.state, m.city, m.lat, m.lng,
             p.total_paid, p.total_claims, p.total_beneficiaries
         FROM agg_provider_procedure p
-        JOIN map_providers m ON m.npi = p.npi
+        JOIN map_providers m ON m.npi_id = p.npi_id
         WHERE p.hcpcs_code = ?
           AND m.lat IS NOT NULL AND m.lng IS NOT NULL
           {state_filter}
         ORDER BY p.total_paid DESC
         LIMIT ?
-    """, params).fetchall()
-
-    return [
-        {
-            "npi": r[0], "name": r[1], "state": r[2], "city": r[3],
-            "lat": r[4], "lng": r[5], "total_paid": r[6],
-            "total_claims": r[7], "total_beneficiaries": r[8],
-        }
-        for r in rows
-    ]
+    """, params)
+
+    return formats.respond(result)
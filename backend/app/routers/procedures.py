@@ -2,23 +2,21 @@
 from typing import Optional
 from fastapi import APIRouter, Query
 from ..db import get_db
+from ..executor import offload
+from .. import formats, keyset, search, sketches
+from .stats import _month_filter
 
 router = APIRouter()
 
 
 @router.get("/search")
+@offload()
 def search_procedures(q: str = Query(..., min_length=1), limit: int = 20):
-    """Search HCPCS procedures by code or description."""
-    db = get_db()
-    rows = db.execute("""
-        SELECT hcpcs_code, short_description, unique_providers, total_paid
-        FROM hcpcs_codes
-        WHERE
-            hcpcs_code ILIKE ? OR
-            short_description ILIKE ?
-        ORDER BY total_paid DESC
-        LIMIT ?
-    """, [f"%{q}%", f"%{q}%", limit]).fetchall()
+    """Search HCPCS procedures by code prefix or description words.
+
+    Served from the in-memory index in search.py, highest spend first.
+    """
+    rows = search.procedures(q, limit) or []
     return [
         {
             "hcpcs_code": r[0],
@@ -31,54 +29,75 @@ def search_procedures(q: str = Query(..., min_length=1), limit: int = 20):
 
 
 @router.get("/top")
-def top_procedures(state: Optional[str] = None, limit: int = 25, offset: int = 0, sort_by: str = "total_paid"):
-    """Top procedures by total spending. Optionally filter by state."""
+@offload(heavy=True)
+def top_procedures(
+    state: Optional[str] = None,
+    limit: int = 25,
+    offset: int = 0,
+    sort_by: str = "total_paid",
+    cursor: Optional[str] = None,
+):
+    """Top procedures by total spending. Optionally filter by state.
+
+    Pages by offset, or by the cursor a full page sends (see keyset.py).
+    """
     allowed_sort = {"total_paid", "unique_providers", "total_claims"}
     if sort_by not in allowed_sort:
         sort_by = "total_paid"
 
     db = get_db()
     if state:
-        rows = db.execute(f"""
+        sort_key = {
+            "total_paid": "SUM(p.total_paid)",
+            "unique_providers": "COUNT(DISTINCT p.npi_id)",
+            "total_claims": "SUM(p.total_claims)",
+        }[sort_by]
+        # The cursor applies to the per-state totals, so it goes in HAVING
+        having, params = "", [state]
+        if cursor:
+            condition, values = keyset.after(cursor, sort_by, sort_key, "p.hcpcs_code")
+            having = f"HAVING {condition}"
+            params += values
+        result = db.execute(f"""
             SELECT
                 p.hcpcs_code,
                 COALESCE(NULLIF(h.short_description, ''), p.hcpcs_code) AS description,
-                COUNT(DISTINCT p.npi) AS unique_providers,
+                COUNT(DISTINCT p.npi_id) AS unique_providers,
                 SUM(p.total_paid) AS total_paid,
-                SUM(p.total_claims) AS total_claims
+                SUM(p.total_claims) AS total_claims,
+                {sort_key} AS _sort,
+                p.hcpcs_code AS _key
             FROM agg_provider_procedure p
-            JOIN map_providers m ON m.npi = p.npi
+            JOIN map_providers m ON m.npi_id = p.npi_id
             LEFT JOIN hcpcs_codes h ON h.hcpcs_code = p.hcpcs_code
             WHERE m.state = ?
             GROUP BY p.hcpcs_code, h.short_description
-            ORDER BY {sort_by} DESC, p.hcpcs_code
+            {having}
+            ORDER BY {sort_by} DESC NULLS LAST, p.hcpcs_code
             LIMIT ?
             OFFSET ?
-        """, [state, limit, offset]).fetchall()
+        """, params + [limit, offset])
     else:
         order_col = f"h.{sort_by}" if sort_by in ("total_paid", "unique_providers") else f"a.{sort_by}"
-        rows = db.execute(f"""
-            SELECT h.hcpcs_code, h.short_description, h.unique_providers, h.total_paid,
-                   a.total_claims
+        where, params = "", []
+        if cursor:
+            condition, params = keyset.after(cursor, sort_by, order_col, "h.hcpcs_code")
+            where = f"WHERE {condition}"
+        result = db.execute(f"""
+            SELECT h.hcpcs_code, h.short_description AS description, h.unique_providers, h.total_paid,
+                   a.total_claims, {order_col} AS _sort, h.hcpcs_code AS _key
             FROM hcpcs_codes h
             LEFT JOIN agg_procedure_summary a ON a.hcpcs_code = h.hcpcs_code
+            {where}
             ORDER BY {order_col} DESC NULLS LAST, h.hcpcs_code
             LIMIT ?
             OFFSET ?
-        """, [limit, offset]).fetchall()
-    return [
-        {
-            "hcpcs_code": r[0],
-            "description": r[1],
-            "unique_providers": r[2],
-            "total_paid": r[3],
-            "total_claims": r[4],
-        }
-        for r in rows
-    ]
+        """, params + [limit, offset])
+    return keyset.page(result, sort_by, limit)
 
 
 @router.get("/benchmarks")
+@offload(heavy=True)
 def procedure_benchmarks(codes: str, state: Optional[str] = None):
     """Return national and optional state avg $/claim for a list of procedure codes."""
     db = get_db()
@@ -105,7 +124,7 @@ def procedure_benchmarks(codes: str, state: Optional[str] = None):
             SELECT p.hcpcs_code,
                    SUM(p.total_paid) / NULLIF(SUM(p.total_claims), 0) AS avg_per_claim
             FROM agg_provider_procedure p
-            JOIN map_providers m ON m.npi = p.npi
+            JOIN map_providers m ON m.npi_id = p.npi_id
             WHERE p.hcpcs_code IN ({placeholders})
               AND m.state = ?
             GROUP BY p.hcpcs_code
@@ -123,9 +142,37 @@ def procedure_benchmarks(codes: str, state: Optional[str] = None):
 
 
 @router.get("/{code}/detail")
-def procedure_detail(code: str):
-    """Procedure summary info."""
+@offload()
+def procedure_detail(code: str, month_from: Optional[str] = None, month_to: Optional[str] = None):
+    """Procedure summary info.
+
+    With a month range, totals cover just those months and unique_providers
+    is a sketch estimate, within about ±unique_providers_error (relative).
+    """
     db = get_db()
+    if month_from or month_to:
+        info = db.execute("""
+            SELECT hcpcs_code, short_description FROM hcpcs_codes WHERE hcpcs_code = ?
+        """, [code]).fetchone()
+        if not info:
+            return {"error": "Procedure not found"}
+        conditions, params = _month_filter(month_from, month_to)
+        totals = db.execute(f"""
+            SELECT SUM(total_paid), SUM(total_claims), SUM(total_beneficiaries)
+            FROM agg_procedure_monthly
+            WHERE {" AND ".join(["hcpcs_code = ?"] + conditions)}
+        """, [code] + params).fetchone()
+        providers = sketches.distinct_providers("procedure", code, month_from, month_to)
+        return {
+            "hcpcs_code": info[0],
+            "description": info[1],
+            "unique_providers": providers["unique_providers"],
+            "unique_providers_error": providers["unique_providers_error"],
+            "total_paid": totals[0],
+            "total_claims": totals[1],
+            "total_beneficiaries": totals[2],
+        }
+
     row = db.execute("""
         SELECT h.hcpcs_code, h.short_description, h.unique_providers, h.total_paid,
                a.total_claims, a.total_beneficiaries
@@ -146,49 +193,57 @@ def procedure_detail(code: str):
 
 
 @router.get("/{code}/providers")
-def procedure_providers(code: str, limit: int = 25, offset: int = 0, sort_by: str = "total_paid"):
-    """Top providers for a given procedure by spending."""
+@offload(heavy=True)
+def procedure_providers(
+    code: str,
+    limit: int = 25,
+    offset: int = 0,
+    sort_by: str = "total_paid",
+    cursor: Optional[str] = None,
+):
+    """Top providers for a given procedure by spending.
+
+    Pages by offset, or by the cursor a full page sends (see keyset.py).
+    """
     allowed_sort = {"total_paid", "total_claims", "per_claim"}
     if sort_by not in allowed_sort:
         sort_by = "total_paid"
 
     if sort_by == "per_claim":
-        order_clause = "(p.total_paid / NULLIF(p.total_claims, 0)) DESC NULLS LAST, p.npi"
+        sort_key = "(p.total_paid / NULLIF(p.total_claims, 0))"
     else:
-        order_clause = f"p.{sort_by} DESC, p.npi"
+        sort_key = f"p.{sort_by}"
+
+    conditions, params = ["p.hcpcs_code = ?"], [code]
+    if cursor:
+        condition, values = keyset.after(cursor, sort_by, sort_key, "p.npi_id")
+        conditions.append(condition)
+        params += values
 
     db = get_db()
-    rows = db.execute(f"""
+    return keyset.page(db.execute(f"""
         SELECT
-            p.npi,
-            COALESCE(m.name, p.npi) AS name,
+            d.npi,
+            COALESCE(m.name, d.npi) AS name,
             m.state,
             m.city,
             p.total_beneficiaries,
             p.total_claims,
-            p.total_paid
+            p.total_paid,
+            {sort_key} AS _sort,
+            p.npi_id AS _key
         FROM agg_provider_procedure p
-        LEFT JOIN map_providers m ON m.npi = p.npi
-        WHERE p.hcpcs_code = ?
-        ORDER BY {order_clause}
+        JOIN dim_npi d ON d.npi_id = p.npi_id
+        LEFT JOIN map_providers m ON m.npi_id = p.npi_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {sort_key} DESC NULLS LAST, p.npi_id
         LIMIT ?
         OFFSET ?
-    """, [code, limit, offset]).fetchall()
-    return [
-        {
-            "npi": r[0],
-            "name": r[1],
-            "state": r[2],
-            "city": r[3],
-            "total_beneficiaries": r[4],
-            "total_claims": r[5],
-            "total_paid": r[6],
-        }
-        for r in rows
-    ]
+    """, params + [limit, offset]), sort_by, limit)
 
 
 @router.get("/{code}/avg-reimbursement")
+@offload(heavy=True)
 def procedure_avg_reimbursement(
     code: str,
     state: Optional[str] = None,
@@ -205,14 +260,15 @@ def procedure_avg_reimbursement(
 
     rows = db.execute(f"""
         SELECT
-            p.npi,
-            COALESCE(m.name, p.npi) AS name,
+            d.npi,
+            COALESCE(m.name, d.npi) AS name,
             m.state,
             p.total_paid / NULLIF(p.total_claims, 0) AS avg_per_claim,
             p.total_claims,
             p.total_paid
         FROM agg_provider_procedure p
-        LEFT JOIN map_providers m ON m.npi = p.npi
+        JOIN dim_npi d ON d.npi_id = p.npi_id
+        LEFT JOIN map_providers m ON m.npi_id = p.npi_id
         WHERE p.hcpcs_code = ?
           AND p.total_claims > 0
           {state_filter}
@@ -231,7 +287,7 @@ def procedure_avg_reimbursement(
         sa = db.execute("""
             SELECT SUM(p.total_paid) / NULLIF(SUM(p.total_claims), 0)
             FROM agg_provider_procedure p
-            JOIN map_providers m ON m.npi = p.npi
+            JOIN map_providers m ON m.npi_id = p.npi_id
             WHERE p.hcpcs_code = ? AND p.total_claims > 0 AND m.state = ?
         """, [code, state]).fetchone()
         state_avg = sa[0] if sa else None
@@ -254,21 +310,14 @@ def procedure_avg_reimbursement(
 
 
 @router.get("/{code}/timeseries")
-def procedure_timeseries(code: str):
+@offload()
+def procedure_timeseries(code: str, month_from: Optional[str] = None, month_to: Optional[str] = None):
     """Monthly spending for one procedure code."""
     db = get_db()
-    rows = db.execute("""
+    conditions, params = _month_filter(month_from, month_to)
+    return formats.respond(db.execute(f"""
         SELECT month, total_beneficiaries, total_claims, total_paid
         FROM agg_procedure_monthly
-        WHERE hcpcs_code = ?
+        WHERE {" AND ".join(["hcpcs_code = ?"] + conditions)}
         ORDER BY month
-    """, [code]).fetchall()
-    return [
-        {
-            "month": r[0],
-            "total_beneficiaries": r[1],
-            "total_claims": r[2],
-            "total_paid": r[3],
-        }
-        for r in rows
-    ]
+    """, [code] + params))
@@ -3,6 +3,8 @@ import logging
 from typing import Optional
 from fastapi import APIRouter, Query
 from ..db import get_db
+from ..executor import offload
+from .. import formats, keyset, search
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +27,14 @@ def _has_oig_table(db) -> bool:
         return False
 
 
+def _npi_id(db, npi: str) -> Optional[int]:
+    """Map a 10-digit NPI to the integer key the aggregate tables use."""
+    row = db.execute("SELECT npi_id FROM dim_npi WHERE npi = ?", [npi]).fetchone()
+    return row[0] if row else None
+
+
 @router.get("/debug/oig")
+@offload()
 def debug_oig():
     """Debug endpoint: check OIG table accessibility."""
     db = get_db()
@@ -43,49 +52,49 @@ def debug_oig():
 
 
 @router.get("/search")
+@offload()
 def search_providers(q: str = Query(..., min_length=2), limit: int = 20, offset: int = 0):
-    """Autocomplete search by provider name or NPI.
+    """Autocomplete search by provider name or NPI prefix.
 
-    Splits multi-word queries so 'Eric Lund' matches 'LUND, ERIC'.
+    Splits multi-word queries so 'Eric Lund' matches 'LUND, ERIC'. Served
+    from the in-memory index (search.py); without one, scans map_providers.
     """
+    table = search.providers(q, limit, offset)
+    if table is not None:
+        return formats.respond(table)
+
     db = get_db()
     words = q.strip().split()
     # Each word must appear somewhere in the name
     name_conditions = " AND ".join(["name ILIKE ?"] * len(words))
     name_params = [f"%{w}%" for w in words]
 
-    rows = db.execute(f"""
+    return formats.respond(db.execute(f"""
         SELECT npi, name, state, city, total_paid, total_claims
         FROM map_providers
         WHERE
-            npi ILIKE ? OR
+            npi LIKE ? OR
             ({name_conditions})
         ORDER BY total_paid DESC
         LIMIT ?
         OFFSET ?
-    """, [f"%{q}%"] + name_params + [limit, offset]).fetchall()
-    return [
-        {
-            "npi": r[0],
-            "name": r[1],
-            "state": r[2],
-            "city": r[3],
-            "total_paid": r[4],
-            "total_claims": r[5],
-        }
-        for r in rows
-    ]
+    """, [f"{q.strip()}%"] + name_params + [limit, offset]))
 
 
 @router.get("/top")
+@offload(heavy=True)
 def top_providers(
     state: Optional[str] = None,
     limit: int = 25,
     offset: int = 0,
     sort_by: str = "total_paid",
     excluded_only: bool = False,
+    cursor: Optional[str] = None,
 ):
-    """Top providers by spending. Optionally filter by state."""
+    """Top providers by spending. Optionally filter by state.
+
+    Pages by offset, or by the cursor a full page sends (see keyset.py).
+    """
     allowed_sort = {"total_paid", "total_claims", "total_beneficiaries", "per_claim"}
     if sort_by not in allowed_sort:
         sort_by = "total_paid"
@@ -93,55 +102,54 @@ def top_providers(
     db = get_db()
     has_oig = _has_oig_table(db)
 
-    oig_select = ", (o.npi IS NOT NULL) AS is_excluded" if has_oig else ", FALSE AS is_excluded"
+    # Exclusions are looked up for the page only, after ranking
+    if has_oig:
+        oig_select = "EXISTS (SELECT 1 FROM oig_exclusions o WHERE o.npi_id = page.npi_id) AS is_excluded"
+    else:
+        oig_select = "FALSE AS is_excluded"
     if excluded_only and has_oig:
-        oig_join = "JOIN (SELECT DISTINCT npi FROM oig_exclusions) o ON o.npi = mp.npi"
-    elif has_oig:
-        oig_join = "LEFT JOIN (SELECT DISTINCT npi FROM oig_exclusions) o ON o.npi = mp.npi"
+        oig_join = "JOIN (SELECT DISTINCT npi_id FROM oig_exclusions) o ON o.npi_id = mp.npi_id"
     else:
         oig_join = ""
 
     if sort_by == "per_claim":
-        order_clause = "(mp.total_paid / NULLIF(mp.total_claims, 0)) DESC NULLS LAST, mp.npi"
+        sort_key = "(mp.total_paid / NULLIF(mp.total_claims, 0))"
     else:
-        order_clause = f"mp.{sort_by} DESC, mp.npi"
+        sort_key = f"mp.{sort_by}"
 
     conditions = []
     params: list = []
     if state:
         conditions.append("mp.state = ?")
         params.append(state)
+    if cursor:
+        condition, values = keyset.after(cursor, sort_by, sort_key, "mp.npi")
+        conditions.append(condition)
+        params += values
 
     where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
     params += [limit, offset]
 
-    rows = db.execute(f"""
-        SELECT mp.npi, mp.name, mp.state, mp.city, mp.total_paid,
-               mp.total_claims, mp.total_beneficiaries
-               {oig_select}
-        FROM map_providers mp
-        {oig_join}
-        {where}
-        ORDER BY {order_clause}
-        LIMIT ?
-        OFFSET ?
-    """, params).fetchall()
-    return [
-        {
-            "npi": r[0],
-            "name": r[1],
-            "state": r[2],
-            "city": r[3],
-            "total_paid": r[4],
-            "total_claims": r[5],
-            "total_beneficiaries": r[6],
-            "is_excluded": bool(r[7]),
-        }
-        for r in rows
-    ]
+    return keyset.page(db.execute(f"""
+        SELECT npi, name, state, city, total_paid, total_claims, total_beneficiaries,
+               {oig_select}, _sort, _key
+        FROM (
+            SELECT mp.npi_id, mp.npi, mp.name, mp.state, mp.city, mp.total_paid,
+                   mp.total_claims, mp.total_beneficiaries,
+                   {sort_key} AS _sort, mp.npi AS _key
+            FROM map_providers mp
+            {oig_join}
+            {where}
+            ORDER BY {sort_key} DESC NULLS LAST, mp.npi
+            LIMIT ?
+            OFFSET ?
+        ) page
+        ORDER BY _sort DESC NULLS LAST, _key
+    """, params), sort_by, limit)
 
 
 @router.get("/{npi}")
+@offload()
 def provider_detail(npi: str):
     """Full provider detail including NPPES info and spending stats."""
     db = get_db()
@@ -150,7 +158,7 @@ def provider_detail(npi: str):
     summary = db.execute("""
         SELECT npi, name, state, city, zip, lat, lng,
                total_paid, total_claims, total_beneficiaries, unique_procedures,
-               first_month, last_month
+               first_month, last_month, geo_confidence
         FROM map_providers
         WHERE npi = ?
     """, [npi]).fetchone()
@@ -193,6 +201,7 @@ def provider_detail(npi: str):
         "zip": summary[4],
         "lat": summary[5],
         "lng": summary[6],
+        "geo_confidence": summary[13],
         "total_paid": summary[7],
         "total_claims": summary[8],
         "total_beneficiaries": summary[9],
@@ -223,38 +232,37 @@ def provider_detail(npi: str):
 
 
 @router.get("/{npi}/timeseries")
+@offload()
 def provider_timeseries(npi: str):
     """Monthly spending for one provider."""
     db = get_db()
-    rows = db.execute("""
+    npi_id = _npi_id(db, npi)
+    if npi_id is None:
+        return []
+    return formats.respond(db.execute("""
         SELECT month, total_beneficiaries, total_claims, total_paid
         FROM agg_provider_monthly
-        WHERE npi = ?
+        WHERE npi_id = ?
         ORDER BY month
-    """, [npi]).fetchall()
-    return [
-        {
-            "month": r[0],
-            "total_beneficiaries": r[1],
-            "total_claims": r[2],
-            "total_paid": r[3],
-        }
-        for r in rows
-    ]
+    """, [npi_id]))
 
 
 @router.get("/{npi}/procedure-timeseries")
+@offload()
 def provider_procedure_timeseries(npi: str, limit: int = 4):
     """Monthly spending broken out by top N procedures for a provider."""
     db = get_db()
+    npi_id = _npi_id(db, npi)
+    if npi_id is None:
+        return {"procedures": [], "series": []}
     # Get top procedures by total spend
     top = db.execute("""
         SELECT hcpcs_code
         FROM agg_provider_procedure
-        WHERE npi = ?
+        WHERE npi_id = ?
         ORDER BY total_paid DESC
         LIMIT ?
-    """, [npi, limit]).fetchall()
+    """, [npi_id, limit]).fetchall()
     top_codes = [r[0] for r in top]
     if not top_codes:
         return {"procedures": [], "series": []}
@@ -273,9 +281,9 @@ def provider_procedure_timeseries(npi: str, limit: int = 4):
     rows = db.execute(f"""
         SELECT month, hcpcs_code, total_paid
         FROM agg_provider_procedure_monthly
-        WHERE npi = ? AND hcpcs_code IN ({placeholders})
+        WHERE npi_id = ? AND hcpcs_code IN ({placeholders})
         ORDER BY month
-    """, [npi] + top_codes).fetchall()
+    """, [npi_id] + top_codes).fetchall()
 
     # Pivot into {month, code1, code2, ...} format
     months: dict = {}
@@ -296,39 +304,49 @@ def provider_procedure_timeseries(npi: str, limit: int = 4):
 
 
 @router.get("/{npi}/procedures")
-def provider_procedures(npi: str, limit: int = 20, offset: int = 0, sort_by: str = "total_paid"):
-    """Top procedures for one provider by spending."""
+@offload()
+def provider_procedures(
+    npi: str,
+    limit: int = 20,
+    offset: int = 0,
+    sort_by: str = "total_paid",
+    cursor: Optional[str] = None,
+):
+    """Top procedures for one provider by spending.
+
+    Pages by offset, or by the cursor a full page sends (see keyset.py).
+    """
     allowed_sort = {"total_paid", "total_claims", "per_claim"}
     if sort_by not in allowed_sort:
         sort_by = "total_paid"
 
     if sort_by == "per_claim":
-        order_clause = "(p.total_paid / NULLIF(p.total_claims, 0)) DESC NULLS LAST, p.hcpcs_code"
+        sort_key = "(p.total_paid / NULLIF(p.total_claims, 0))"
     else:
-        order_clause = f"p.{sort_by} DESC, p.hcpcs_code"
+        sort_key = f"p.{sort_by}"
 
     db = get_db()
-    rows = db.execute(f"""
+    npi_id = _npi_id(db, npi)
+    if npi_id is None:
+        return []
+    conditions, params = ["p.npi_id = ?"], [npi_id]
+    if cursor:
+        condition, values = keyset.after(cursor, sort_by, sort_key, "p.hcpcs_code")
+        conditions.append(condition)
+        params += values
+    return keyset.page(db.execute(f"""
         SELECT
             p.hcpcs_code,
             COALESCE(NULLIF(h.short_description, ''), p.hcpcs_code) AS description,
             p.total_beneficiaries,
             p.total_claims,
-            p.total_paid
+            p.total_paid,
+            {sort_key} AS _sort,
+            p.hcpcs_code AS _key
         FROM agg_provider_procedure p
         LEFT JOIN hcpcs_codes h ON h.hcpcs_code = p.hcpcs_code
-        WHERE p.npi = ?
-        ORDER BY {order_clause}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {sort_key} DESC NULLS LAST, p.hcpcs_code
         LIMIT ?
         OFFSET ?
-    """, [npi, limit, offset]).fetchall()
-    return [
-        {
-            "hcpcs_code": r[0],
-            "description": r[1],
-            "total_beneficiaries": r[2],
-            "total_claims": r[3],
-            "total_paid": r[4],
-        }
-        for r in rows
-    ]
+    """, params + [limit, offset]), sort_by, limit)
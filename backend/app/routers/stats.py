@@ -1,16 +1,68 @@
 """Overview stats and national time series endpoints."""
 from typing import Optional
 from fastapi import APIRouter
-from functools import lru_cache
 from ..db import get_db
+from ..executor import offload
+from .. import formats, sketches
 
 router = APIRouter()
 
 
+def _month_filter(month_from: Optional[str], month_to: Optional[str]):
+    """SQL conditions and params restricting `month` to a range."""
+    conditions, params = [], []
+    if month_from:
+        conditions.append("month >= ?")
+        params.append(month_from)
+    if month_to:
+        conditions.append("month <= ?")
+        params.append(month_to)
+    return conditions, params
+
+
 @router.get("/overview")
-def overview():
-    """KPIs: total paid, total claims, provider count, date range."""
+@offload()
+def overview(
+    state: Optional[str] = None,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+):
+    """KPIs: total paid, total claims, provider count, date range.
+
+    With a state or month range, totals come from the monthly tables and
+    total_providers is a sketch estimate, within about
+    ±total_providers_error (relative, one standard error).
+    """
     db = get_db()
+    if state or month_from or month_to:
+        conditions, params = _month_filter(month_from, month_to)
+        if state:
+            conditions.append("state = ?")
+            params.append(state)
+        table = "agg_state_monthly" if state else "agg_national_monthly"
+        row = db.execute(f"""
+            SELECT
+                SUM(total_paid),
+                SUM(total_claims),
+                SUM(total_beneficiaries),
+                MIN(month),
+                MAX(month)
+            FROM {table}
+            WHERE {" AND ".join(conditions)}
+        """, params).fetchone()
+        providers = sketches.distinct_providers(
+            "state" if state else "national", state, month_from, month_to
+        )
+        return {
+            "total_paid": row[0],
+            "total_claims": row[1],
+            "total_beneficiaries": row[2],
+            "total_providers": providers["unique_providers"],
+            "total_providers_error": providers["unique_providers_error"],
+            "first_month": row[3],
+            "last_month": row[4],
+        }
+
     row = db.execute("""
         SELECT
             SUM(total_paid) AS total_paid,
@@ -32,51 +84,46 @@ def overview():
 
 
 @router.get("/timeseries/national")
-def national_timeseries():
+@offload()
+def national_timeseries(month_from: Optional[str] = None, month_to: Optional[str] = None):
     """Monthly national spending totals for the time bar."""
     db = get_db()
-    rows = db.execute("""
+    conditions, params = _month_filter(month_from, month_to)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    return formats.respond(db.execute(f"""
         SELECT month, unique_providers, total_beneficiaries, total_claims, total_paid
         FROM agg_national_monthly
+        {where}
         ORDER BY month
-    """).fetchall()
-    return [
-        {
-            "month": r[0],
-            "unique_providers": r[1],
-            "total_beneficiaries": r[2],
-            "total_claims": r[3],
-            "total_paid": r[4],
-        }
-        for r in rows
-    ]
+    """, params))
 
 
 @router.get("/timeseries/state")
-def state_timeseries(state: Optional[str] = None):
-    """Monthly spending by state. Optionally filter to one state."""
+@offload(heavy=True)
+def state_timeseries(
+    state: Optional[str] = None,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+):
+    """Monthly spending by state. Optionally filter to one state.
+
+    Rows, columns or an Arrow stream, as the client asks (see formats.py).
+    """
     db = get_db()
+    conditions, params = _month_filter(month_from, month_to)
     if state:
-        rows = db.execute("""
+        result = db.execute(f"""
             SELECT state, month, unique_providers, total_beneficiaries, total_claims, total_paid
             FROM agg_state_monthly
-            WHERE state = ?
+            WHERE {" AND ".join(["state = ?"] + conditions)}
             ORDER BY month
-        """, [state]).fetchall()
+        """, [state] + params)
     else:
-        rows = db.execute("""
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        result = db.execute(f"""
             SELECT state, month, unique_providers, total_beneficiaries, total_claims, total_paid
             FROM agg_state_monthly
+            {where}
             ORDER BY state, month
-        """).fetchall()
-    return [
-        {
-            "state": r[0],
-            "month": r[1],
-            "unique_providers": r[2],
-            "total_beneficiaries": r[3],
-            "total_claims": r[4],
-            "total_paid": r[5],
-        }
-        for r in rows
-    ]
+        """, params)
+    return formats.respond(result)
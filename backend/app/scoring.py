@@ -0,0 +1,144 @@
+"""Fraud-risk scoring with request-supplied weights and thresholds.
+
+fraud_signals (built by data/scripts/06_fraud_signals.py) is ranked under
+the default scoring. For any other weights or thresholds the three signals
+are recomputed from the per-procedure ratios and prevalences it keeps as
+lists. The growth signal depends on max_yoy alone, so it is read as stored.
+
+Those lists are loaded on first use, flattened into NumPy arrays with each
+value's row number, and kept in an LRU cache. Rescoring every provider is
+then a few bincounts and elementwise ops, with no per-provider Python.
+"""
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+
+from .db import get_db
+
+
+@dataclass(frozen=True)
+class Scoring:
+    """Weights and thresholds of the composite score.
+
+    Defaults must match data/scripts/06_fraud_signals.py.
+    """
+    # Composite = sum of weight x 0-100 signal score
+    weight_billing_10x: float = 0.4
+    weight_yoy_growth: float = 0.3
+    weight_unusual_mix: float = 0.3
+    # A procedure is an outlier at this multiple of the state average $/claim
+    ratio_threshold: float = 10
+    # A procedure is rare when fewer than this share of the state's providers bill it
+    rare_threshold: float = 0.02
+    # Flag providers with at least this many signals firing and this composite
+    min_signals: int = 2
+    min_score: float = 20
+
+    def is_default(self) -> bool:
+        return self == DEFAULT
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+DEFAULT = Scoring()
+
+# Provider columns returned with each ranked row
+DETAILS = ["npi", "name", "state", "city", "total_paid", "total_claims"]
+# fraud_signals columns of a ranked row, in order
+COLUMNS = DETAILS + [
+    "composite_score",
+    "procs_10x", "max_ratio", "outlier_spend", "score_billing_10x",
+    "max_yoy", "years_3x", "score_yoy_growth",
+    "total_procs", "rare_procs", "score_unusual_mix",
+]
+
+
+def _flatten(column: pa.ChunkedArray):
+    """(values, row number of each value) of a list column."""
+    lists = column.combine_chunks()
+    values = lists.flatten().to_numpy(zero_copy_only=False).astype(np.float64)
+    lengths = np.diff(lists.offsets.to_numpy())
+    return values, np.repeat(np.arange(len(lists)), lengths)
+
+
+@lru_cache(maxsize=1)
+def _load():
+    """fraud_signals as NumPy arrays, plus the flattened signal lists."""
+    table = get_db().execute("""
+        SELECT
+            npi, name, state, city, total_paid,
+            CAST(total_claims AS BIGINT) AS total_claims,
+            max_ratio, max_yoy, years_3x, total_procs,
+            ratios, ratio_paid, prevalences
+        FROM fraud_signals
+        ORDER BY npi
+    """).arrow()
+    # Object arrays keep NULLs and Python types for the response rows
+    data = {name: np.array(table[name].to_pylist(), dtype=object) for name in DETAILS}
+    data["max_ratio"] = table["max_ratio"].to_numpy().astype(np.float64)
+    data["max_yoy"] = table["max_yoy"].to_numpy().astype(np.float64)
+    data["years_3x"] = table["years_3x"].to_numpy().astype(np.int64)
+    data["total_procs"] = table["total_procs"].to_numpy().astype(np.int64)
+    for name in ("ratios", "ratio_paid", "prevalences"):
+        data[name], data[name + "_row"] = _flatten(table[name])
+    return data
+
+
+def score(params: Scoring) -> dict:
+    """Signal values and scores of every provider under params, as arrays."""
+    data = _load()
+    n = len(data["npi"])
+
+    outlier = data["ratios"] >= params.ratio_threshold
+    procs_10x = np.bincount(data["ratios_row"], weights=outlier, minlength=n).astype(np.int64)
+    outlier_spend = np.bincount(data["ratios_row"], weights=np.where(outlier, data["ratio_paid"], 0), minlength=n)
+    rare_procs = np.bincount(
+        data["prevalences_row"], weights=data["prevalences"] < params.rare_threshold, minlength=n
+    ).astype(np.int64)
+
+    # Same normalizations as the pipeline: each signal 0-100
+    max_yoy, total_procs = data["max_yoy"], data["total_procs"]
+    score_billing = np.minimum(procs_10x * 20, 100)
+    score_growth = np.where(max_yoy > 1, np.minimum((max_yoy - 1) * 10, 100), 0)
+    score_mix = np.where(total_procs > 0, np.minimum(rare_procs / np.maximum(total_procs, 1) * 200, 100), 0)
+
+    active = (score_billing > 0).astype(np.int64) + (score_growth > 0) + (score_mix > 0)
+    composite = (score_billing * params.weight_billing_10x
+                 + score_growth * params.weight_yoy_growth
+                 + score_mix * params.weight_unusual_mix)
+    return {
+        "procs_10x": procs_10x,
+        "outlier_spend": outlier_spend,
+        "rare_procs": rare_procs,
+        "score_billing_10x": score_billing,
+        "score_yoy_growth": score_growth,
+        "score_unusual_mix": score_mix,
+        "composite_score": composite,
+        "flagged": (active >= params.min_signals) & (composite >= params.min_score),
+    }
+
+
+def rank(params: Scoring, limit: int, offset: int = 0, state: Optional[str] = None):
+    """(rows, total flagged) of the flagged providers ranked by composite score.
+
+    Rows are tuples of COLUMNS, like a query on fraud_signals would return.
+    """
+    data = _load()
+    scores = score(params)
+    flagged = scores["flagged"]
+    if state:
+        flagged = flagged & (data["state"] == state)
+    hits = np.flatnonzero(flagged)
+    # Rows are in npi order, so a stable sort on the score breaks ties by npi
+    hits = hits[np.argsort(-scores["composite_score"][hits], kind="stable")]
+    page = hits[offset:offset + limit] if offset >= 0 and limit > 0 else hits[:0]
+    columns = [scores[name] if name in scores else data[name] for name in COLUMNS]
+    rows = [
+        tuple(v.item() if isinstance(v, np.generic) else v for v in (column[i] for column in columns))
+        for i in page
+    ]
+    return rows, len(hits)
@@ -0,0 +1,250 @@
+"""In-memory search indexes for the provider and procedure autocompletes.
+
+Providers: the index built by data/scripts/07_search_index.py, providers in
+spend order, with their lower-cased names, and a posting list of spend
+ranks per 2- and 3-character piece of a name. A query matches a provider
+when each of its words appears somewhere in the name (in any order, so
+'Eric Lund' finds 'LUND, ERIC'), or when it is a prefix of the NPI.
+
+Candidates come from the shortest posting list among the query's pieces
+(a two-letter word is its own piece, longer ones are split into
+trigrams), in rank order. They are taken a chunk at a time, narrowed by
+the other postings and checked against the words, so a page of results
+usually takes one chunk. Chunks double in size for sparse queries.
+
+Procedures: built from hcpcs_codes (a few thousand rows) when first used.
+A prefix trie over the codes lists, at every node, the codes below it in
+spend order. Description words map to the codes using them, in spend
+order, and a query word matches every description word it is a prefix
+of. A code matches when the query is a prefix of it, or when every query
+word matches a word of its short or long description.
+"""
+import heapq
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Optional
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+
+from .db import get_db
+
+# Display columns of a provider search result, in order
+DETAILS = ["npi", "name", "state", "city", "total_paid", "total_claims"]
+# Candidates examined in the first step
+CHUNK = 512
+
+
+@lru_cache(maxsize=1)
+def _load_providers():
+    """The provider index, or None if the pipeline hasn't built it."""
+    db = get_db()
+    try:
+        table = db.execute(f"""
+            SELECT {", ".join(DETAILS)}, search_name
+            FROM provider_search
+            ORDER BY pos
+        """).arrow()
+        grams = db.execute("SELECT gram, positions FROM provider_ngrams").arrow()
+    except duckdb.CatalogException:
+        return None
+
+    npis = np.array(table["npi"].to_pylist(), dtype=str)
+    by_npi = np.argsort(npis, kind="stable")
+    positions = grams["positions"].combine_chunks()
+    # pos is 1-based; postings hold row numbers
+    flat = positions.flatten().to_numpy().astype(np.int32) - 1
+    offsets = positions.offsets.to_numpy()
+    return {
+        "details": table.select(DETAILS).combine_chunks(),
+        "names": table["search_name"].to_pylist(),
+        "npis": npis,
+        "by_npi": by_npi.astype(np.int32),
+        "npi_sorted": npis[by_npi],
+        "postings": {
+            gram: flat[offsets[i]:offsets[i + 1]]
+            for i, gram in enumerate(grams["gram"].to_pylist())
+        },
+    }
+
+
+class _Trie:
+    """Prefix trie of codes; each node lists the codes below it, in insertion order."""
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []
+
+    def add(self, key, i):
+        node = self
+        node.ids.append(i)
+        for ch in key:
+            node = node.children.setdefault(ch, _Trie())
+            node.ids.append(i)
+
+    def find(self, prefix):
+        node = self
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return node.ids
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+@lru_cache(maxsize=1)
+def _load_procedures():
+    """The procedure index, or None if hcpcs_codes doesn't exist."""
+    try:
+        rows = get_db().execute("""
+            SELECT hcpcs_code, short_description, long_description, unique_providers, total_paid
+            FROM hcpcs_codes
+            ORDER BY total_paid DESC NULLS LAST, hcpcs_code
+        """).fetchall()
+    except duckdb.CatalogException:
+        return None
+
+    codes, words, postings = _Trie(), [], {}
+    for i, (code, short, long, *_) in enumerate(rows):
+        codes.add(code.upper(), i)
+        words.append(tuple(set(_words(f"{short or ''} {long or ''}"))))
+        for word in words[-1]:
+            postings.setdefault(word, []).append(i)
+    return {
+        "rows": [(code, short, providers, paid) for code, short, _, providers, paid in rows],
+        "codes": codes,
+        "words": words,
+        "vocabulary": sorted(postings),
+        "postings": postings,
+    }
+
+
+def warm():
+    """Load both indexes now (at startup)."""
+    _load_providers()
+    _load_procedures()
+
+
+def _contains(sorted_ids, ids):
+    """Mask of ids present in the ascending array sorted_ids."""
+    at = np.searchsorted(sorted_ids, ids)
+    return sorted_ids[np.minimum(at, len(sorted_ids) - 1)] == ids
+
+
+def _chunks(total):
+    """(start, stop) ranges covering range(total), doubling in size."""
+    start, size = 0, CHUNK
+    while start < total:
+        yield start, min(start + size, total)
+        start, size = start + size, size * 2
+
+
+def _name_matches(index, words, need):
+    """First need rows (in rank order) whose name contains every word."""
+    postings = index["postings"]
+    grams = {w for w in words if len(w) == 2}
+    grams.update(w[i:i + 3] for w in words for i in range(len(w) - 2))
+    lists = []
+    for gram in grams:
+        ids = postings.get(gram)
+        if ids is None:
+            return []
+        lists.append(ids)
+    lists.sort(key=len)
+    if lists:
+        source, others = lists[0], lists[1:]
+    else:
+        source, others = None, []
+
+    names = index["names"]
+    total = len(source) if source is not None else len(names)
+    found = []
+    for start, stop in _chunks(total):
+        ids = source[start:stop] if source is not None else np.arange(start, stop)
+        for other in others:
+            ids = ids[_contains(other, ids)]
+            if not len(ids):
+                break
+        for i in ids.tolist():
+            name = names[i]
+            if all(w in name for w in words):
+                found.append(i)
+                if len(found) == need:
+                    return found
+    return found
+
+
+def _npi_matches(index, prefix, need):
+    """First need rows (in rank order) whose NPI starts with prefix."""
+    if not prefix.isdigit():
+        return []
+    npi_sorted = index["npi_sorted"]
+    lo = np.searchsorted(npi_sorted, prefix, side="left")
+    hi = np.searchsorted(npi_sorted, prefix + "\uffff", side="right")
+    if hi - lo <= 8 * CHUNK:
+        return np.sort(index["by_npi"][lo:hi])[:need].tolist()
+    # A short prefix matches much of the table, so its top ranks come quickly
+    npis, found = index["npis"], []
+    for start, stop in _chunks(len(npis)):
+        hits = np.flatnonzero(np.char.startswith(npis[start:stop], prefix))
+        found.extend((hits + start).tolist())
+        if len(found) >= need:
+            return found[:need]
+    return found
+
+
+def providers(q: str, limit: int, offset: int = 0) -> Optional[pa.Table]:
+    """DETAILS of the providers matching q, highest spend first; None if there's no index."""
+    index = _load_providers()
+    if index is None:
+        return None
+    need = offset + limit
+    if limit <= 0 or offset < 0:
+        return index["details"].slice(0, 0)
+    words = q.lower().split()
+    hits = set(_name_matches(index, words, need)) if words else set()
+    hits.update(_npi_matches(index, q.strip(), need))
+    page = np.array(sorted(hits)[offset:need], dtype=np.int64)
+    return index["details"].take(page)
+
+
+def _described(index, word):
+    """Codes with a description word starting with word, in rank order.
+
+    A code using several such words comes up once for each.
+    """
+    vocabulary, postings = index["vocabulary"], index["postings"]
+    lo = bisect_left(vocabulary, word)
+    hi = bisect_left(vocabulary, word + "\uffff", lo)
+    return heapq.merge(*(postings[w] for w in vocabulary[lo:hi]))
+
+
+def procedures(q: str, limit: int) -> Optional[list]:
+    """(code, short description, unique providers, total paid) rows for q,
+    highest spend first; None if there's no index."""
+    index = _load_procedures()
+    if index is None:
+        return None
+    hits = set(index["codes"].find(q.strip().upper())[:limit])
+    # Candidates come from the longest word (likely the rarest); the others
+    # are checked against each candidate's own words
+    first, *rest = sorted(set(_words(q)), key=len, reverse=True) or [None]
+    if first is not None:
+        described, found, last = index["words"], 0, None
+        for i in _described(index, first):
+            if i == last:
+                continue
+            last = i
+            if all(any(w.startswith(word) for w in described[i]) for word in rest):
+                hits.add(i)
+                found += 1
+                if found == limit:
+                    break
+    rows = index["rows"]
+    return [rows[i] for i in sorted(hits)[:limit]]
@@ -0,0 +1,78 @@
+"""Approximate distinct-provider counts over month ranges.
+
+The pipeline stores HyperLogLog registers for every month, state-month and
+procedure-month (sketch_* tables, built by 01_build_aggregates.py). Merging
+is a per-register MAX, so any month range can be answered from the monthly
+sketches without touching the provider tables.
+
+A key's sketches are loaded on first use into a months x registers uint8
+matrix (84 x 4096 bytes) and kept in an LRU cache; after that an estimate is
+a slice, a max and a sum over 4096 registers.
+"""
+import bisect
+import math
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from .db import get_db
+
+# Must match SKETCH_P in data/scripts/01_build_aggregates.py
+P = 12
+M = 1 << P
+# Relative standard error of an HLL estimate with M registers
+RELATIVE_ERROR = 1.04 / math.sqrt(M)
+_ALPHA = 0.7213 / (1 + 1.079 / M)
+
+# Sketch table and its key column; None for the national sketch
+TABLES = {
+    "national": ("sketch_national_monthly", None),
+    "state": ("sketch_state_monthly", "state"),
+    "procedure": ("sketch_procedure_monthly", "hcpcs_code"),
+}
+
+
+@lru_cache(maxsize=128)
+def _load(kind: str, key: Optional[str]):
+    """Sorted months and a months x M register matrix for one key."""
+    table, key_col = TABLES[kind]
+    where, params = (f"WHERE {key_col} = ?", [key]) if key_col else ("", [])
+    cols = get_db().execute(f"""
+        SELECT month, reg, rho FROM {table} {where}
+    """, params).fetchnumpy()
+    months = sorted(set(cols["month"].tolist()))
+    matrix = np.zeros((len(months), M), dtype=np.uint8)
+    rows = np.searchsorted(np.array(months, dtype=object), cols["month"])
+    matrix[rows, cols["reg"].astype(np.int64)] = cols["rho"]
+    return months, matrix
+
+
+def estimate(registers: np.ndarray) -> float:
+    """HyperLogLog cardinality estimate, with linear counting for small sets."""
+    raw = _ALPHA * M * M / np.exp2(-registers.astype(np.float64)).sum()
+    zeros = M - np.count_nonzero(registers)
+    if raw <= 2.5 * M and zeros:
+        return M * math.log(M / zeros)
+    return float(raw)
+
+
+def distinct_providers(kind: str, key: Optional[str] = None,
+                       month_from: Optional[str] = None,
+                       month_to: Optional[str] = None) -> dict:
+    """Approximate distinct billing providers for key over [month_from, month_to].
+
+    Either bound may be omitted. Returns the rounded estimate and its
+    relative standard error; about 95% of estimates land within twice that.
+    """
+    months, matrix = _load(kind, key)
+    lo = bisect.bisect_left(months, month_from) if month_from else 0
+    hi = bisect.bisect_right(months, month_to) if month_to else len(months)
+    if lo >= hi:
+        count = 0
+    else:
+        count = round(estimate(matrix[lo:hi].max(axis=0)))
+    return {
+        "unique_providers": count,
+        "unique_providers_error": round(RELATIVE_ERROR, 4),
+    }
@@ -0,0 +1,56 @@
+"""Fixtures for the API tests: a small synthetic database built by the real
+pipeline (data/scripts/gen_synthetic.py, then run_pipeline.py) and the app
+pointed at it."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCRIPTS_DIR = os.path.abspath(os.path.join(BACKEND_DIR, "..", "data", "scripts"))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope="session")
+def database(tmp_path_factory):
+    """Path of a pipeline-built database over 50K synthetic spending rows."""
+    out = tmp_path_factory.mktemp("synthetic")
+    generated = subprocess.run(
+        [sys.executable, "gen_synthetic.py", "--rows", "50K", "--out", str(out)],
+        cwd=SCRIPTS_DIR, check=True, capture_output=True, text=True,
+    ).stdout
+    # The generator prints the environment the pipeline should run with
+    env = dict(os.environ)
+    for line in generated.splitlines():
+        if line.strip().startswith("export "):
+            name, _, value = line.strip()[len("export "):].partition("=")
+            env[name] = value
+    subprocess.run(
+        [sys.executable, "run_pipeline.py"],
+        cwd=SCRIPTS_DIR, env=env, check=True, capture_output=True, text=True,
+    )
+    return env["DUCKDB_PATH"]
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    """A TestClient on the app, reading `database` with the response cache off.
+
+    The app modules read their settings at import, so they are imported here.
+    """
+    os.environ["DUCKDB_PATH"] = database
+    os.environ["CACHE_MAX_BYTES"] = "0"
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def db(client):
+    """A cursor on the app's database, as get_db() hands to a route."""
+    from app.db import get_db
+
+    return get_db()
@@ -0,0 +1,81 @@
+"""Walking the ranked lists by X-Next-Cursor against one page of everything."""
+import pytest
+
+NEXT_CURSOR = "X-Next-Cursor"
+EVERYTHING = 100_000
+
+# (path, query, page size); the synthetic database's most-billed NPI and code
+LISTS = [
+    ("/api/providers/top", {}, 37),
+    ("/api/providers/top", {"sort_by": "total_claims"}, 37),
+    ("/api/providers/top", {"sort_by": "total_beneficiaries", "state": "CA"}, 9),
+    ("/api/providers/top", {"sort_by": "per_claim"}, 37),
+    ("/api/providers/top", {"excluded_only": "true"}, 4),
+    ("/api/providers/1000123459/procedures", {}, 83),
+    ("/api/providers/1000123459/procedures", {"sort_by": "per_claim"}, 83),
+    ("/api/procedures/top", {}, 499),
+    ("/api/procedures/top", {"sort_by": "total_claims"}, 499),
+    ("/api/procedures/top", {"sort_by": "unique_providers", "state": "TX"}, 61),
+    ("/api/procedures/10000/providers", {}, 41),
+    ("/api/procedures/10000/providers", {"sort_by": "total_claims"}, 41),
+    ("/api/analysis/excluded-providers", {}, 4),
+]
+
+
+def rows(response):
+    body = response.json()
+    return body["providers"] if isinstance(body, dict) else body
+
+
+def walk(client, path, query, limit):
+    """Every row of a list, fetched one cursor page at a time."""
+    found, cursor, pages = [], None, 0
+    while True:
+        params = dict(query, limit=limit, **({"cursor": cursor} if cursor else {}))
+        response = client.get(path, params=params)
+        assert response.status_code == 200, response.text
+        page = rows(response)
+        assert len(page) <= limit
+        found += page
+        pages += 1
+        cursor = response.headers.get(NEXT_CURSOR)
+        if cursor is None:
+            return found, pages
+        assert pages < 1000, "the cursor does not advance"
+
+
+@pytest.mark.parametrize("path,query,limit", LISTS)
+def test_cursor_walk_matches_one_page(client, path, query, limit):
+    everything = rows(client.get(path, params=dict(query, limit=EVERYTHING)))
+    assert len(everything) > limit, "the list should span several pages"
+
+    walked, pages = walk(client, path, query, limit)
+    assert walked == everything
+    assert pages == len(everything) // limit + 1
+
+
+def test_offset_counts_from_the_cursor(client):
+    first = client.get("/api/providers/top", params={"limit": 10})
+    cursor = first.headers[NEXT_CURSOR]
+    skipped = client.get("/api/providers/top", params={"limit": 10, "offset": 5, "cursor": cursor})
+    assert rows(skipped) == rows(client.get("/api/providers/top", params={"limit": 10, "offset": 15}))
+
+
+def test_short_page_has_no_cursor(client):
+    response = client.get("/api/procedures/top", params={"limit": EVERYTHING})
+    assert NEXT_CURSOR not in response.headers
+    assert NEXT_CURSOR in client.get("/api/procedures/top", params={"limit": 5}).headers
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "W10", "WyJ0b3RhbF9wYWlkIiwgeyJ4IjogMX0sIDFd"])
+def test_malformed_cursor_is_400(client, cursor):
+    response = client.get("/api/providers/top", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_cursor_from_another_sort_is_400(client):
+    cursor = client.get("/api/providers/top", params={"limit": 5}).headers[NEXT_CURSOR]
+    response = client.get("/api/providers/top", params={"sort_by": "total_claims", "cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor is for sort_by=total_paid, not total_claims"
@@ -0,0 +1,61 @@
+"""On-the-fly scoring against the ranking 06_fraud_signals.py stores."""
+import dataclasses
+
+import pytest
+
+
+@pytest.fixture
+def scoring(client):
+    from app import scoring
+
+    scoring._load.cache_clear()
+    return scoring
+
+
+def stored(db, state=None):
+    from app import scoring
+
+    where, params = ("AND state = ?", [state]) if state else ("", [])
+    return db.execute(f"""
+        SELECT {", ".join(scoring.COLUMNS)}
+        FROM fraud_signals
+        WHERE flagged {where}
+        ORDER BY pos
+    """, params).fetchall()
+
+
+def assert_same_rows(ranked, expected):
+    assert [r[0] for r in ranked] == [r[0] for r in expected]
+    for got, want in zip(ranked, expected):
+        assert got == pytest.approx(want), want[0]
+
+
+def test_default_rank_matches_stored_positions(scoring, db):
+    expected = stored(db)
+    assert expected, "the synthetic data should flag some providers"
+    assert db.execute("SELECT COUNT(pos) FROM fraud_signals").fetchone()[0] == len(expected)
+
+    ranked, total = scoring.rank(scoring.DEFAULT, limit=len(expected) + 10)
+    assert total == len(expected)
+    assert_same_rows(ranked, expected)
+
+
+def test_default_rank_pages_and_states(scoring, db):
+    expected = stored(db)
+    first, _ = scoring.rank(scoring.DEFAULT, limit=10)
+    second, _ = scoring.rank(scoring.DEFAULT, limit=10, offset=10)
+    assert [r[0] for r in first + second] == [r[0] for r in expected[:20]]
+
+    state = expected[0][2]
+    ranked, total = scoring.rank(scoring.DEFAULT, limit=1000, state=state)
+    assert total == len(ranked) == len(stored(db, state))
+    assert_same_rows(ranked, stored(db, state))
+
+
+def test_thresholds_change_the_scores(scoring):
+    default = scoring.score(scoring.DEFAULT)
+    looser = scoring.score(dataclasses.replace(scoring.DEFAULT, ratio_threshold=1.5))
+    assert (looser["procs_10x"] >= default["procs_10x"]).all()
+    assert (looser["procs_10x"] > default["procs_10x"]).any()
+    assert (looser["composite_score"] >= default["composite_score"]).all()
+    assert looser["flagged"].sum() >= default["flagged"].sum()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Stream the raw spending CSV into month-partitioned Parquet.
+
+Reads medicaid-provider-spending.csv (~11 GB) with explicit column types and
+writes ZSTD-compressed Parquet, one directory per claim year and month:
+
+    spending/claim_year=2024/CLAIM_FROM_MONTH=2024-12/data_0.parquet
+
+`spending` then becomes a view over those files, so a filter on
+CLAIM_FROM_MONTH only opens the matching partitions. DuckDB streams the CSV
+through in chunks under --memory-limit; nothing holds the whole file.
+
+Re-ingesting an unchanged CSV is a no-op: the source fingerprint is kept in
+a manifest next to the Parquet files.
+"""
+import argparse
+import duckdb
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import run_report
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+DATA_DIR = "/Users/charl/Programming/medicaid/data"
+CSV_PATH = os.environ.get("SPENDING_CSV", os.path.join(DATA_DIR, "medicaid-provider-spending.csv"))
+PARQUET_DIR = os.environ.get("SPENDING_PARQUET_DIR", os.path.join(DATA_DIR, "spending"))
+MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT")
+
+REPORT = run_report.RunReport("00_ingest_spending")
+
+# Schema from DATA-SUMMARY.md; NPIs stay strings to keep leading digits intact
+COLUMNS = {
+    "BILLING_PROVIDER_NPI_NUM": "VARCHAR",
+    "SERVICING_PROVIDER_NPI_NUM": "VARCHAR",
+    "HCPCS_CODE": "VARCHAR",
+    "CLAIM_FROM_MONTH": "VARCHAR",
+    "TOTAL_UNIQUE_BENEFICIARIES": "BIGINT",
+    "TOTAL_CLAIMS": "BIGINT",
+    "TOTAL_PAID": "DOUBLE",
+}
+
+
+def manifest_path(parquet_dir):
+    return os.path.join(parquet_dir, "_manifest.json")
+
+
+def source_fingerprint(path):
+    """Size, mtime and a hash of the first and last MiB — cheap on 11 GB."""
+    st = os.stat(path)
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        h.update(f.read(1 << 20))
+        if st.st_size > 2 << 20:
+            f.seek(-(1 << 20), os.SEEK_END)
+            h.update(f.read())
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256_head_tail": h.hexdigest()}
+
+
+def read_manifest(parquet_dir):
+    try:
+        with open(manifest_path(parquet_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def create_view(con, parquet_dir):
+    """Point `spending` at the Parquet files, replacing a hand-loaded table."""
+    if con.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'spending'"
+    ).fetchone()[0]:
+        print("  Dropping the old spending table in favour of the Parquet view")
+        con.execute("DROP TABLE spending")
+    columns = ", ".join(COLUMNS)
+    con.execute(f"""
+        CREATE OR REPLACE VIEW spending AS
+        SELECT {columns}
+        FROM read_parquet('{parquet_dir}/**/*.parquet',
+            hive_partitioning = true,
+            hive_types = {{'claim_year': INTEGER, 'CLAIM_FROM_MONTH': VARCHAR}}
+        )
+    """)
+    print(f"  ✓ spending view -> {parquet_dir}")
+
+
+def ingest(con, csv_path=CSV_PATH, parquet_dir=PARQUET_DIR, force=False):
+    """Convert csv_path to partitioned Parquet (unless unchanged) and create the view."""
+    if not os.path.exists(csv_path):
+        if glob.glob(os.path.join(parquet_dir, "**", "*.parquet"), recursive=True):
+            print(f"No CSV at {csv_path}; using the Parquet files in {parquet_dir}.")
+            create_view(con, parquet_dir)
+            return
+        has_spending = con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'spending'"
+        ).fetchone()[0]
+        if has_spending:
+            print(f"No CSV at {csv_path}; keeping the existing spending table/view.")
+            return
+        raise FileNotFoundError(f"Spending CSV not found: {csv_path}")
+
+    fingerprint = source_fingerprint(csv_path)
+    manifest = read_manifest(parquet_dir)
+    if not force and manifest and manifest["source_fingerprint"] == fingerprint:
+        print(f"{csv_path} unchanged since {manifest['ingested_at']} — skipping ingest.")
+        create_view(con, parquet_dir)
+        return
+
+    size_gb = fingerprint["size"] / 1e9
+    print(f"Ingesting {csv_path} ({size_gb:.1f} GB) -> {parquet_dir}")
+    staging = parquet_dir + ".staging"
+    shutil.rmtree(staging, ignore_errors=True)
+
+    # Let DuckDB stream rows straight through instead of buffering for order.
+    # The setting is instance-wide, so put it back for later ORDER BY builds.
+    preserve = con.execute("SELECT current_setting('preserve_insertion_order')").fetchone()[0]
+    con.execute("SET preserve_insertion_order = false")
+    columns = ", ".join(f"'{name}': '{dtype}'" for name, dtype in COLUMNS.items())
+    try:
+        with REPORT.step(con, "csv_to_parquet") as step:
+            rows = con.execute(f"""
+                COPY (
+                    SELECT
+                        *,
+                        CAST(SUBSTR(CLAIM_FROM_MONTH, 1, 4) AS INTEGER) AS claim_year
+                    FROM read_csv('{csv_path}', header = true, columns = {{{columns}}})
+                ) TO '{staging}' (
+                    FORMAT parquet,
+                    COMPRESSION zstd,
+                    PARTITION_BY (claim_year, CLAIM_FROM_MONTH)
+                )
+            """).fetchone()[0]
+            step.rows_in = step.rows_out = rows
+    finally:
+        con.execute(f"SET preserve_insertion_order = {preserve}")
+    record = step.record
+    elapsed = record["wall_s"]
+
+    months = dict(con.execute(f"""
+        SELECT CLAIM_FROM_MONTH, COUNT(*)
+        FROM read_parquet('{staging}/**/*.parquet', hive_partitioning = true,
+                          hive_types = {{'CLAIM_FROM_MONTH': VARCHAR}})
+        GROUP BY 1 ORDER BY 1
+    """).fetchall())
+    out_bytes = sum(
+        os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(staging) for f in files
+    )
+    stats = {
+        "rows": rows,
+        "seconds": round(elapsed, 1),
+        "cpu_seconds": round(record["cpu_s"], 1),
+        "rows_per_second": record["rows_per_s"] or 0,
+        "peak_rss_mb": record["peak_rss_mb"],
+        "spill_bytes": record["spill_bytes"],
+        "parquet_bytes": out_bytes,
+    }
+    with open(manifest_path(staging), "w") as f:
+        json.dump({
+            "source": os.path.abspath(csv_path),
+            "source_fingerprint": fingerprint,
+            "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "stats": stats,
+            "months": months,
+        }, f, indent=2)
+
+    # Swap the new partitions in only once they are complete
+    previous = parquet_dir + ".previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(parquet_dir):
+        os.rename(parquet_dir, previous)
+    os.rename(staging, parquet_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+
+    print(f"  ✓ {rows:,} rows in {elapsed:.1f}s "
+          f"({stats['rows_per_second']:,.0f} rows/s, {size_gb * 1000 / max(elapsed, 1e-9):.0f} MB/s)")
+    print(f"  ✓ {len(months)} month partitions, {out_bytes / 1e9:.2f} GB Parquet "
+          f"({out_bytes / fingerprint['size']:.0%} of CSV)")
+    print(f"  Peak RSS: {stats['peak_rss_mb']:,.0f} MB")
+    create_view(con, parquet_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=CSV_PATH, help="raw spending CSV (default: $SPENDING_CSV)")
+    parser.add_argument("--out", default=PARQUET_DIR, help="Parquet output directory")
+    parser.add_argument("--memory-limit", default=MEMORY_LIMIT, help="DuckDB memory_limit, e.g. 4GB")
+    parser.add_argument("--force", action="store_true", help="re-ingest even if the CSV is unchanged")
+    args = parser.parse_args()
+
+    con = duckdb.connect(DB_PATH)
+    if args.memory_limit:
+        con.execute(f"SET memory_limit = '{args.memory_limit}'")
+    ingest(con, os.path.abspath(args.csv), os.path.abspath(args.out), force=args.force)
+    con.close()
+    REPORT.write()
+    print("\nIngest complete!")
+
+
+if __name__ == "__main__":
+    main()
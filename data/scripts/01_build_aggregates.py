@@ -1,36 +1,172 @@
 #!/usr/bin/env python3
 """Build aggregate tables from raw spending data.
 
-This is the heavy step — scans 227M rows multiple times.
-Takes ~10-30 minutes depending on hardware.
+This is the heavy step. It scans the 227M spending rows once into
+agg_provider_procedure_monthly (npi x hcpcs x month) and derives every
+other aggregate from that much smaller table.
+
+The original build scanned spending once per table (~10-30 minutes); its
+SQL is kept as BASELINE_SQL. Pass --compare to also build those tables into
+a scratch schema from the same input, check the new tables match them
+(rows and column types) and print the timings side by side.
+
+--incremental refreshes only new or restated months (--months, or every
+month in spending that agg_national_monthly doesn't have yet) instead of
+rebuilding from all 84. Rerun 02-05 afterwards as usual; they read the
+small summary tables.
+
+Provider tables are keyed on npi_id, a dense INTEGER from dim_npi, rather
+than the 10-digit NPI string; join through dim_npi to get the NPI back.
+
+Distinct providers over a month range can't be summed from the monthly
+unique_providers columns, so each build also stores HyperLogLog registers
+per month, state-month and procedure-month (sketch_* tables). Taking the
+per-register MAX over any set of months and estimating from that gives the
+distinct count to within ~1.6% (1.04 / sqrt(2^SKETCH_P)); see
+backend/app/sketches.py.
+
+agg_provider_procedure_monthly is the largest aggregate, so the build runs
+under --memory-limit and spills to --temp-dir rather than running out of
+memory. Each run writes a JSON report with per-table time, rows, peak memory
+and spill (see run_report.py).
+
+--layout decides each table's physical layout: sorted by its lookup key so
+zonemaps prune row groups, or in build order with ART indexes. The default
+takes whatever bench_layout.py measured to be fastest (see table_layout.py).
 """
+import argparse
 import duckdb
-import time
+import os
+import re
 import sys
 
-DB_PATH = "/Users/charl/Programming/medicaid/medicaid.duckdb"
+import run_report
+import table_layout
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+# DuckDB defaults to 80% of RAM when no limit is given
+MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT")
+TEMP_DIR = os.environ.get("DUCKDB_TEMP_DIR", DB_PATH + ".tmp")
+
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+# Aggregate tables and their key columns
+AGG_TABLES = {
+    "agg_national_monthly": ["month"],
+    "agg_provider_summary": ["npi_id"],
+    "agg_provider_monthly": ["npi_id", "month"],
+    "agg_provider_procedure": ["npi_id", "hcpcs_code"],
+    "agg_state_monthly": ["state", "month"],
+    "agg_procedure_summary": ["hcpcs_code"],
+    "agg_procedure_monthly": ["hcpcs_code", "month"],
+    "agg_provider_procedure_monthly": ["npi_id", "hcpcs_code", "month"],
+}
+
+
+# HyperLogLog sketches: 2^SKETCH_P registers per key and month
+SKETCH_P = 12
+SKETCH_TABLES = {
+    "sketch_national_monthly": ["month"],
+    "sketch_state_monthly": ["state", "month"],
+    "sketch_procedure_monthly": ["hcpcs_code", "month"],
+}
+
+# npi_id -> practice_state, one row per NPI. agg_state_monthly applies this
+# to the npi x month rollup, so nppes is joined per provider-month instead of
+# per spending row.
+NPI_STATES = """
+    SELECT d.npi_id, n.practice_state
+    FROM dim_npi d
+    JOIN nppes n ON CAST(n.npi AS VARCHAR) = d.npi
+"""
+
+
+# Per-table steps of every build in this process, filled in by run()
+REPORT = run_report.RunReport("01_build_aggregates")
 
 
 def run(con, name, sql):
     print(f"\n{'='*60}")
     print(f"Building {name}...")
-    t0 = time.time()
-    con.execute(f"DROP TABLE IF EXISTS {name}")
-    con.execute(sql)
-    count = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
-    elapsed = time.time() - t0
-    print(f"  ✓ {name}: {count:,} rows in {elapsed:.1f}s")
-    return count
+    with REPORT.step(con, name) as step:
+        con.execute(f"DROP TABLE IF EXISTS {name}")
+        step.execute(sql)
+        order_by = table_layout.sort_table(con, name)
+        step.rows_out = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+    print(f"  ✓ {name}: {step.rows_out:,} rows in {step.wall:.1f}s "
+          f"({step.record['rows_per_s'] or 0:,} rows/s)"
+          + (f", sorted by {order_by}" if order_by else ""))
+    return step.rows_out
 
 
-def main():
-    con = duckdb.connect(DB_PATH)
-    print(f"Connected to {DB_PATH}")
-    print(f"Spending rows: {con.execute('SELECT COUNT(*) FROM spending').fetchone()[0]:,}")
+def update_dim_npi(con, where=""):
+    """Give every billing NPI in spending (optionally filtered) an npi_id.
 
-    # 1. National monthly — tiny, fast
-    run(con, "agg_national_monthly", """
-        CREATE TABLE agg_national_monthly AS
+    dim_npi maps 10-digit NPI strings to dense INTEGER ids; the aggregate
+    tables store and join on the id. Existing ids are never renumbered, so
+    rebuilds and incremental refreshes only append. On a fresh database the
+    ids follow NPI order.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS dim_npi (
+            npi_id INTEGER PRIMARY KEY,
+            npi VARCHAR NOT NULL UNIQUE
+        )
+    """)
+    with REPORT.step(con, "dim_npi") as step:
+        step.rows_out = step.execute(f"""
+            INSERT INTO dim_npi
+            SELECT
+                (SELECT COALESCE(MAX(npi_id), 0) FROM dim_npi) + ROW_NUMBER() OVER (ORDER BY s.npi),
+                s.npi
+            FROM (
+                SELECT DISTINCT BILLING_PROVIDER_NPI_NUM AS npi
+                FROM spending
+                {where}
+            ) s
+            ANTI JOIN dim_npi d ON d.npi = s.npi
+            WHERE s.npi IS NOT NULL
+        """)[0][0]
+    total = con.execute("SELECT COUNT(*) FROM dim_npi").fetchone()[0]
+    print(f"  ✓ dim_npi: {step.rows_out:,} new NPIs, {total:,} total in {step.wall:.1f}s")
+
+
+def provider_procedure_monthly_sql(where=""):
+    """spending rolled up to npi_id x hcpcs_code x month.
+
+    Groups on the NPI string first and maps the (much smaller) result to
+    npi_id, rather than joining dim_npi against every spending row.
+    """
+    return f"""
+        SELECT
+            d.npi_id,
+            s.hcpcs_code,
+            s.month,
+            s.total_beneficiaries,
+            s.total_claims,
+            s.total_paid
+        FROM (
+            SELECT
+                BILLING_PROVIDER_NPI_NUM AS npi,
+                HCPCS_CODE AS hcpcs_code,
+                CLAIM_FROM_MONTH AS month,
+                CAST(SUM(TOTAL_UNIQUE_BENEFICIARIES) AS BIGINT) AS total_beneficiaries,
+                CAST(SUM(TOTAL_CLAIMS) AS BIGINT) AS total_claims,
+                SUM(TOTAL_PAID) AS total_paid
+            FROM spending
+            {where}
+            GROUP BY BILLING_PROVIDER_NPI_NUM, HCPCS_CODE, CLAIM_FROM_MONTH
+        ) s
+        LEFT JOIN dim_npi d ON d.npi = s.npi
+    """
+
+
+# The aggregates as the original build defined them: one full scan of
+# spending per table, keyed on the NPI string. --compare builds these into
+# BASELINE_SCHEMA and checks the single-scan tables against them.
+BASELINE_SCHEMA = "compare_baseline"
+BASELINE_SQL = {
+    "agg_national_monthly": """
         SELECT
             CLAIM_FROM_MONTH AS month,
             COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS unique_providers,
@@ -40,11 +176,8 @@ def main():
         FROM spending
         GROUP BY CLAIM_FROM_MONTH
         ORDER BY month
-    """)
-
-    # 2. Provider summary — one row per billing NPI
-    run(con, "agg_provider_summary", """
-        CREATE TABLE agg_provider_summary AS
+    """,
+    "agg_provider_summary": """
         SELECT
             BILLING_PROVIDER_NPI_NUM AS npi,
             MIN(CLAIM_FROM_MONTH) AS first_month,
@@ -55,11 +188,8 @@ def main():
             SUM(TOTAL_PAID) AS total_paid
         FROM spending
         GROUP BY BILLING_PROVIDER_NPI_NUM
-    """)
-
-    # 3. Provider monthly — for time series on provider click
-    run(con, "agg_provider_monthly", """
-        CREATE TABLE agg_provider_monthly AS
+    """,
+    "agg_provider_monthly": """
         SELECT
             BILLING_PROVIDER_NPI_NUM AS npi,
             CLAIM_FROM_MONTH AS month,
@@ -68,11 +198,8 @@ def main():
             SUM(TOTAL_PAID) AS total_paid
         FROM spending
         GROUP BY BILLING_PROVIDER_NPI_NUM, CLAIM_FROM_MONTH
-    """)
-
-    # 4. Provider procedure — for procedure breakdown on provider click
-    run(con, "agg_provider_procedure", """
-        CREATE TABLE agg_provider_procedure AS
+    """,
+    "agg_provider_procedure": """
         SELECT
             BILLING_PROVIDER_NPI_NUM AS npi,
             HCPCS_CODE AS hcpcs_code,
@@ -81,11 +208,8 @@ def main():
             SUM(TOTAL_PAID) AS total_paid
         FROM spending
         GROUP BY BILLING_PROVIDER_NPI_NUM, HCPCS_CODE
-    """)
-
-    # 5. State monthly — for choropleth
-    run(con, "agg_state_monthly", """
-        CREATE TABLE agg_state_monthly AS
+    """,
+    "agg_state_monthly": """
         SELECT
             n.practice_state AS state,
             s.CLAIM_FROM_MONTH AS month,
@@ -96,11 +220,8 @@ def main():
         FROM spending s
         JOIN nppes n ON CAST(n.npi AS VARCHAR) = s.BILLING_PROVIDER_NPI_NUM
         GROUP BY n.practice_state, s.CLAIM_FROM_MONTH
-    """)
-
-    # 6. Procedure summary — one row per HCPCS code
-    run(con, "agg_procedure_summary", """
-        CREATE TABLE agg_procedure_summary AS
+    """,
+    "agg_procedure_summary": """
         SELECT
             HCPCS_CODE AS hcpcs_code,
             COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS unique_providers,
@@ -109,11 +230,8 @@ def main():
             SUM(TOTAL_PAID) AS total_paid
         FROM spending
         GROUP BY HCPCS_CODE
-    """)
-
-    # 7. Procedure monthly — for procedure time series
-    run(con, "agg_procedure_monthly", """
-        CREATE TABLE agg_procedure_monthly AS
+    """,
+    "agg_procedure_monthly": """
         SELECT
             HCPCS_CODE AS hcpcs_code,
             CLAIM_FROM_MONTH AS month,
@@ -122,20 +240,648 @@ def main():
             SUM(TOTAL_PAID) AS total_paid
         FROM spending
         GROUP BY HCPCS_CODE, CLAIM_FROM_MONTH
+    """,
+    # Not one of the original tables; its definition, straight from spending
+    "agg_provider_procedure_monthly": """
+        SELECT
+            BILLING_PROVIDER_NPI_NUM AS npi,
+            HCPCS_CODE AS hcpcs_code,
+            CLAIM_FROM_MONTH AS month,
+            CAST(SUM(TOTAL_UNIQUE_BENEFICIARIES) AS BIGINT) AS total_beneficiaries,
+            CAST(SUM(TOTAL_CLAIMS) AS BIGINT) AS total_claims,
+            SUM(TOTAL_PAID) AS total_paid
+        FROM spending
+        GROUP BY BILLING_PROVIDER_NPI_NUM, HCPCS_CODE, CLAIM_FROM_MONTH
+    """,
+}
+
+
+def build_baseline(con, schema=BASELINE_SCHEMA):
+    """Build BASELINE_SQL's tables into schema; returns the step's record."""
+    con.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    con.execute(f"CREATE SCHEMA {schema}")
+    with REPORT.step(con, "baseline") as outer:
+        for table, sql in BASELINE_SQL.items():
+            print(f"\n{'='*60}")
+            print(f"Building {schema}.{table}...")
+            with REPORT.step(con, table) as step:
+                step.execute(f"CREATE TABLE {schema}.{table} AS {sql}")
+                step.rows_out = con.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+            print(f"  ✓ {table}: {step.rows_out:,} rows in {step.wall:.1f}s")
+    return outer.record
+
+
+def build_single_scan(con):
+    """Scan spending once, then derive every aggregate from the result.
+
+    The npi x hcpcs x month grain is the finest one any aggregate needs, so
+    all of the SUMs and COUNT(DISTINCT ...)s below come out the same as
+    computing them straight from spending.
+    """
+    update_dim_npi(con)
+
+    # The only full scan of spending — collapses the servicing-NPI dimension.
+    # Stored sorted by npi_id so a provider's rows sit in a few row groups and
+    # the zonemaps skip the rest. Counts fit in BIGINT at this grain, and
+    # BIGINT scans far faster than the HUGEINT that SUM() returns; the SUMs
+    # below widen back to HUGEINT, so every other table keeps its types.
+    run(con, "agg_provider_procedure_monthly", f"""
+        CREATE TABLE agg_provider_procedure_monthly AS
+        {provider_procedure_monthly_sql()}
+        ORDER BY npi_id, hcpcs_code, month
     """)
 
-    # Create indexes for common lookups
-    print("\nCreating indexes...")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_prov_summary_npi ON agg_provider_summary(npi)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_prov_monthly_npi ON agg_provider_monthly(npi)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_prov_proc_npi ON agg_provider_procedure(npi)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_proc_summary_code ON agg_procedure_summary(hcpcs_code)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_proc_monthly_code ON agg_procedure_monthly(hcpcs_code)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_state_monthly_state ON agg_state_monthly(state)")
+    run(con, "agg_provider_monthly", """
+        CREATE TABLE agg_provider_monthly AS
+        SELECT
+            npi_id,
+            month,
+            SUM(total_beneficiaries) AS total_beneficiaries,
+            SUM(total_claims) AS total_claims,
+            SUM(total_paid) AS total_paid
+        FROM agg_provider_procedure_monthly
+        GROUP BY npi_id, month
+    """)
+
+    run(con, "agg_provider_procedure", """
+        CREATE TABLE agg_provider_procedure AS
+        SELECT
+            npi_id,
+            hcpcs_code,
+            SUM(total_beneficiaries) AS total_beneficiaries,
+            SUM(total_claims) AS total_claims,
+            SUM(total_paid) AS total_paid
+        FROM agg_provider_procedure_monthly
+        GROUP BY npi_id, hcpcs_code
+    """)
+
+    run(con, "agg_procedure_monthly", """
+        CREATE TABLE agg_procedure_monthly AS
+        SELECT
+            hcpcs_code,
+            month,
+            SUM(total_beneficiaries) AS total_beneficiaries,
+            SUM(total_claims) AS total_claims,
+            SUM(total_paid) AS total_paid
+        FROM agg_provider_procedure_monthly
+        GROUP BY hcpcs_code, month
+    """)
+
+    run(con, "agg_provider_summary", """
+        CREATE TABLE agg_provider_summary AS
+        SELECT
+            npi_id,
+            MIN(month) AS first_month,
+            MAX(month) AS last_month,
+            COUNT(DISTINCT hcpcs_code) AS unique_procedures,
+            SUM(total_beneficiaries) AS total_beneficiaries,
+            SUM(total_claims) AS total_claims,
+            SUM(total_paid) AS total_paid
+        FROM agg_provider_procedure_monthly
+        GROUP BY npi_id
+    """)
+
+    # npi_id is unique within a month here, so COUNT(npi_id) == COUNT(DISTINCT npi_id)
+    run(con, "agg_national_monthly", """
+        CREATE TABLE agg_national_monthly AS
+        SELECT
+            month,
+            COUNT(npi_id) AS unique_providers,
+            SUM(total_beneficiaries) AS total_beneficiaries,
+            SUM(total_claims) AS total_claims,
+            SUM(total_paid) AS total_paid
+        FROM agg_provider_monthly
+        GROUP BY month
+        ORDER BY month
+    """)
+
+    # Likewise npi_id is unique per hcpcs_code in agg_provider_procedure
+    run(con, "agg_procedure_summary", """
+        CREATE TABLE agg_procedure_summary AS
+        SELECT
+            hcpcs_code,
+            COUNT(npi_id) AS unique_providers,
+            SUM(total_beneficiaries) AS total_beneficiaries,
+            SUM(total_claims) AS total_claims,
+            SUM(total_paid) AS total_paid
+        FROM agg_provider_procedure
+        GROUP BY hcpcs_code
+    """)
+
+    # A provider-month lands in exactly one state-month, so the state rollup
+    # only needs the npi x month grain, not npi x hcpcs x month
+    run(con, "agg_state_monthly", f"""
+        CREATE TABLE agg_state_monthly AS
+        SELECT
+            n.practice_state AS state,
+            s.month,
+            COUNT(DISTINCT s.npi_id) AS unique_providers,
+            SUM(s.total_beneficiaries) AS total_beneficiaries,
+            SUM(s.total_claims) AS total_claims,
+            SUM(s.total_paid) AS total_paid
+        FROM agg_provider_monthly s
+        JOIN ({NPI_STATES}) n ON n.npi_id = s.npi_id
+        GROUP BY n.practice_state, s.month
+    """)
+
+
+def sketch_sql(keys, source):
+    """HLL registers of npi_id for each combination of keys in source.
+
+    The top SKETCH_P bits of hash(npi_id) pick the register; rho is one more
+    than the number of trailing zeros in the remaining bits. Only non-empty
+    registers are stored, one (keys..., reg, rho) row each.
+    """
+    keys = ", ".join(keys)
+    rest_bits = 64 - SKETCH_P
+    mask = (1 << rest_bits) - 1
+    return f"""
+        SELECT {keys}, reg, MAX(rho) AS rho
+        FROM (
+            SELECT
+                {keys},
+                CAST(h >> {rest_bits} AS USMALLINT) AS reg,
+                h & {mask} AS w,
+                CAST(CASE WHEN w = 0 THEN {rest_bits + 1}
+                          ELSE bit_count(xor(w, w - 1)) END AS UTINYINT) AS rho
+            FROM (
+                SELECT {keys}, hash(npi_id) AS h
+                FROM ({source}) src
+                WHERE npi_id IS NOT NULL
+            )
+        )
+        GROUP BY {keys}, reg
+        ORDER BY {keys}, reg
+    """
+
+
+def sketch_sources(where=""):
+    """Rows (keys..., npi_id) for each sketch table, from the provider aggregates."""
+    return {
+        "sketch_national_monthly": f"SELECT month, npi_id FROM agg_provider_monthly {where}",
+        "sketch_state_monthly": f"""
+            SELECT n.practice_state AS state, s.month, s.npi_id
+            FROM agg_provider_monthly s
+            JOIN ({NPI_STATES}) n ON n.npi_id = s.npi_id
+            {where}
+        """,
+        "sketch_procedure_monthly": f"""
+            SELECT hcpcs_code, month, npi_id FROM agg_provider_procedure_monthly {where}
+        """,
+    }
+
+
+def build_sketches(con):
+    """Distinct-provider sketches per month, state-month and procedure-month."""
+    with REPORT.step(con, "sketches"):
+        for table, source in sketch_sources().items():
+            run(con, table, f"""
+                CREATE TABLE {table} AS
+                {sketch_sql(SKETCH_TABLES[table], source)}
+            """)
+
+
+def replace_month_partition(con, table, in_months, select_sql):
+    """Swap the given months of a monthly table for freshly computed rows."""
+    deleted = con.execute(f"DELETE FROM {table} WHERE month IN {in_months}").fetchone()[0]
+    inserted = con.execute(f"INSERT INTO {table} {select_sql}").fetchone()[0]
+    print(f"  ✓ {table}: -{deleted:,} +{inserted:,} rows")
+
+
+def merge_summary(con, table, keys, delta, set_clauses, insert_select):
+    """Apply a delta table to a summary table: update existing keys, insert new ones."""
+    on = " AND ".join(f"s.{k} IS NOT DISTINCT FROM d.{k}" for k in keys)
+    updated = con.execute(f"""
+        UPDATE {table} s SET {set_clauses}
+        FROM {delta} d
+        WHERE {on}
+    """).fetchone()[0]
+    inserted = con.execute(f"""
+        INSERT INTO {table}
+        SELECT {insert_select}
+        FROM {delta} d
+        WHERE NOT EXISTS (SELECT 1 FROM {table} s WHERE {on})
+    """).fetchone()[0]
+    return updated, inserted
+
+
+def new_months(con):
+    """Months present in spending but not yet in the aggregates."""
+    rows = con.execute("""
+        SELECT DISTINCT CLAIM_FROM_MONTH FROM spending
+        EXCEPT
+        SELECT month FROM agg_national_monthly
+    """).fetchall()
+    return sorted(r[0] for r in rows if r[0] is not None)
+
+
+def refresh_months(con, months):
+    """Incrementally refresh every aggregate for new or restated months.
+
+    Monthly tables have those month partitions replaced outright. Summary
+    tables get the difference between the new and old slices merged in:
+    sums are added and first/last month widened. COUNT(DISTINCT ...) stays
+    exact by tracking which (npi_id, hcpcs_code) pairs appear or disappear —
+    agg_provider_procedure holds exactly the pairs present in spending.
+    Only spending rows for the given months are read; NPIs seen for the
+    first time are appended to dim_npi.
+    """
+    bad = [m for m in months if not MONTH_RE.match(m)]
+    if bad:
+        raise ValueError(f"Months must look like YYYY-MM, got {bad}")
+    in_months = "(" + ", ".join(f"'{m}'" for m in months) + ")"
+    print(f"Refreshing {len(months)} month(s): {', '.join(months)}")
+
+    con.execute("BEGIN TRANSACTION")
+    month_filter = f"WHERE CLAIM_FROM_MONTH IN {in_months}"
+    update_dim_npi(con, month_filter)
+
+    # New slice from spending, old slice from the finest aggregate we keep
+    run(con, "_new", f"""
+        CREATE TEMP TABLE _new AS
+        {provider_procedure_monthly_sql(month_filter)}
+    """)
+    run(con, "_old", f"""
+        CREATE TEMP TABLE _old AS
+        SELECT * FROM agg_provider_procedure_monthly
+        WHERE month IN {in_months}
+    """)
+
+    # Per-pair change (new minus old), and whether the pair existed before
+    run(con, "_pairs", """
+        CREATE TEMP TABLE _pairs AS
+        SELECT
+            d.npi_id,
+            d.hcpcs_code,
+            SUM(d.sign * d.total_beneficiaries) AS total_beneficiaries,
+            SUM(d.sign * d.total_claims) AS total_claims,
+            SUM(d.sign * d.total_paid) AS total_paid,
+            BOOL_OR(d.sign = 1) AS in_new,
+            BOOL_OR(p.present IS NOT NULL) AS existed
+        FROM (
+            SELECT 1 AS sign, * FROM _new
+            UNION ALL
+            SELECT -1 AS sign, * FROM _old
+        ) d
+        LEFT JOIN (SELECT npi_id, hcpcs_code, TRUE AS present FROM agg_provider_procedure) p
+            ON p.npi_id IS NOT DISTINCT FROM d.npi_id
+           AND p.hcpcs_code IS NOT DISTINCT FROM d.hcpcs_code
+        GROUP BY d.npi_id, d.hcpcs_code
+    """)
+
+    print(f"\n{'='*60}")
+    print("Replacing month partitions...")
+    replace_month_partition(con, "agg_provider_procedure_monthly", in_months, """
+        SELECT * FROM _new ORDER BY npi_id, hcpcs_code, month
+    """)
+    replace_month_partition(con, "agg_provider_monthly", in_months, """
+        SELECT npi_id, month, SUM(total_beneficiaries), SUM(total_claims), SUM(total_paid)
+        FROM _new
+        GROUP BY npi_id, month
+    """)
+    replace_month_partition(con, "agg_procedure_monthly", in_months, """
+        SELECT hcpcs_code, month, SUM(total_beneficiaries), SUM(total_claims), SUM(total_paid)
+        FROM _new
+        GROUP BY hcpcs_code, month
+    """)
+    replace_month_partition(con, "agg_national_monthly", in_months, """
+        SELECT month, COUNT(DISTINCT npi_id), SUM(total_beneficiaries), SUM(total_claims), SUM(total_paid)
+        FROM _new
+        GROUP BY month
+        ORDER BY month
+    """)
+    replace_month_partition(con, "agg_state_monthly", in_months, f"""
+        SELECT n.practice_state, s.month, COUNT(DISTINCT s.npi_id),
+               SUM(s.total_beneficiaries), SUM(s.total_claims), SUM(s.total_paid)
+        FROM agg_provider_monthly s
+        JOIN ({NPI_STATES}) n ON n.npi_id = s.npi_id
+        WHERE s.month IN {in_months}
+        GROUP BY n.practice_state, s.month
+    """)
+    # A month's registers depend on that month alone, so sketches are
+    # replaced like any other monthly partition
+    for table, source in sketch_sources(f"WHERE month IN {in_months}").items():
+        replace_month_partition(con, table, in_months, sketch_sql(SKETCH_TABLES[table], source))
+
+    print(f"\n{'='*60}")
+    print("Merging deltas into summary tables...")
+    sums = """
+        total_beneficiaries = s.total_beneficiaries + d.total_beneficiaries,
+        total_claims = s.total_claims + d.total_claims,
+        total_paid = s.total_paid + d.total_paid"""
+
+    # Pairs that no longer appear in any month
+    con.execute("""
+        CREATE TEMP TABLE _removed_pairs AS
+        SELECT d.npi_id, d.hcpcs_code
+        FROM _pairs d
+        WHERE d.existed AND NOT d.in_new
+          AND NOT EXISTS (
+              SELECT 1 FROM agg_provider_procedure_monthly m
+              WHERE m.npi_id IS NOT DISTINCT FROM d.npi_id
+                AND m.hcpcs_code IS NOT DISTINCT FROM d.hcpcs_code
+          )
+    """)
+    con.execute("""
+        CREATE TEMP TABLE _pair_changes AS
+        SELECT npi_id, hcpcs_code, 1 AS change FROM _pairs WHERE NOT existed
+        UNION ALL
+        SELECT npi_id, hcpcs_code, -1 AS change FROM _removed_pairs
+    """)
+
+    updated, inserted = merge_summary(
+        con, "agg_provider_procedure", ["npi_id", "hcpcs_code"], "_pairs", sums,
+        "d.npi_id, d.hcpcs_code, d.total_beneficiaries, d.total_claims, d.total_paid",
+    )
+    deleted = con.execute("""
+        DELETE FROM agg_provider_procedure p
+        USING _removed_pairs r
+        WHERE p.npi_id IS NOT DISTINCT FROM r.npi_id
+          AND p.hcpcs_code IS NOT DISTINCT FROM r.hcpcs_code
+    """).fetchone()[0]
+    print(f"  ✓ agg_provider_procedure: {updated:,} updated, {inserted:,} inserted, {deleted:,} deleted")
+
+    # Provider summary: unique_procedures moves by the pairs gained or lost
+    con.execute("""
+        CREATE TEMP TABLE _npi_delta AS
+        SELECT
+            d.npi_id,
+            n.first_month,
+            n.last_month,
+            COALESCE(c.change, 0) AS unique_procedures,
+            d.total_beneficiaries,
+            d.total_claims,
+            d.total_paid
+        FROM (
+            SELECT npi_id, SUM(total_beneficiaries) AS total_beneficiaries,
+                   SUM(total_claims) AS total_claims, SUM(total_paid) AS total_paid
+            FROM _pairs
+            GROUP BY npi_id
+        ) d
+        LEFT JOIN (
+            SELECT npi_id, SUM(change) AS change
+            FROM _pair_changes
+            WHERE hcpcs_code IS NOT NULL
+            GROUP BY npi_id
+        ) c ON c.npi_id IS NOT DISTINCT FROM d.npi_id
+        LEFT JOIN (
+            SELECT npi_id, MIN(month) AS first_month, MAX(month) AS last_month
+            FROM _new
+            GROUP BY npi_id
+        ) n ON n.npi_id IS NOT DISTINCT FROM d.npi_id
+    """)
+    updated, inserted = merge_summary(
+        con, "agg_provider_summary", ["npi_id"], "_npi_delta",
+        "first_month = LEAST(s.first_month, d.first_month), "
+        "last_month = GREATEST(s.last_month, d.last_month), "
+        "unique_procedures = s.unique_procedures + d.unique_procedures," + sums,
+        "d.npi_id, d.first_month, d.last_month, d.unique_procedures, "
+        "d.total_beneficiaries, d.total_claims, d.total_paid",
+    )
+    # A restated month can drop a provider's first/last month, or the
+    # provider altogether; re-derive those few from agg_provider_monthly.
+    con.execute("""
+        CREATE TEMP TABLE _shrunk AS
+        SELECT DISTINCT o.npi_id
+        FROM _old o
+        WHERE NOT EXISTS (
+            SELECT 1 FROM _new n
+            WHERE n.npi_id IS NOT DISTINCT FROM o.npi_id AND n.month = o.month
+        )
+    """)
+    con.execute("""
+        UPDATE agg_provider_summary s
+        SET first_month = m.first_month, last_month = m.last_month
+        FROM (
+            SELECT a.npi_id, MIN(a.month) AS first_month, MAX(a.month) AS last_month
+            FROM agg_provider_monthly a
+            SEMI JOIN _shrunk x ON x.npi_id IS NOT DISTINCT FROM a.npi_id
+            GROUP BY a.npi_id
+        ) m
+        WHERE s.npi_id IS NOT DISTINCT FROM m.npi_id
+    """)
+    deleted = con.execute("""
+        DELETE FROM agg_provider_summary s
+        USING _shrunk x
+        WHERE s.npi_id IS NOT DISTINCT FROM x.npi_id
+          AND NOT EXISTS (
+              SELECT 1 FROM agg_provider_monthly a
+              WHERE a.npi_id IS NOT DISTINCT FROM x.npi_id
+          )
+    """).fetchone()[0]
+    print(f"  ✓ agg_provider_summary: {updated:,} updated, {inserted:,} inserted, {deleted:,} deleted")
+
+    # Procedure summary: unique_providers moves by the pairs gained or lost
+    con.execute("""
+        CREATE TEMP TABLE _code_delta AS
+        SELECT
+            d.hcpcs_code,
+            COALESCE(c.change, 0) AS unique_providers,
+            d.total_beneficiaries,
+            d.total_claims,
+            d.total_paid
+        FROM (
+            SELECT hcpcs_code, SUM(total_beneficiaries) AS total_beneficiaries,
+                   SUM(total_claims) AS total_claims, SUM(total_paid) AS total_paid
+            FROM _pairs
+            GROUP BY hcpcs_code
+        ) d
+        LEFT JOIN (
+            SELECT hcpcs_code, SUM(change) AS change
+            FROM _pair_changes
+            WHERE npi_id IS NOT NULL
+            GROUP BY hcpcs_code
+        ) c ON c.hcpcs_code IS NOT DISTINCT FROM d.hcpcs_code
+    """)
+    updated, inserted = merge_summary(
+        con, "agg_procedure_summary", ["hcpcs_code"], "_code_delta",
+        "unique_providers = s.unique_providers + d.unique_providers," + sums,
+        "d.hcpcs_code, d.unique_providers, d.total_beneficiaries, d.total_claims, d.total_paid",
+    )
+    deleted = con.execute("""
+        DELETE FROM agg_procedure_summary s
+        WHERE s.hcpcs_code IN (SELECT hcpcs_code FROM _removed_pairs)
+          AND NOT EXISTS (
+              SELECT 1 FROM agg_provider_procedure p
+              WHERE p.hcpcs_code IS NOT DISTINCT FROM s.hcpcs_code
+          )
+    """).fetchone()[0]
+    print(f"  ✓ agg_procedure_summary: {updated:,} updated, {inserted:,} inserted, {deleted:,} deleted")
+
+    for temp in ("_new", "_old", "_pairs", "_removed_pairs", "_pair_changes",
+                 "_npi_delta", "_shrunk", "_code_delta"):
+        con.execute(f"DROP TABLE {temp}")
+    con.execute("COMMIT")
+
+
+def configure(con, memory_limit, temp_dir):
+    """Bound DuckDB's memory use; sorts and aggregates spill to temp_dir."""
+    if memory_limit:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    os.makedirs(temp_dir, exist_ok=True)
+    con.execute(f"SET temp_directory = '{temp_dir}'")
+    limit = con.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+    print(f"Memory limit: {limit}, spilling to {temp_dir}")
+
+
+def create_indexes(con):
+    """Create the indexes for common lookups that each table's layout asks for."""
+    print(f"\nCreating indexes (layout: {table_layout.MODE})...")
+    with REPORT.step(con, "indexes"):
+        for table in AGG_TABLES:
+            if table in table_layout.INDEXED:
+                table_layout.index_table(con, table)
     print("  ✓ Indexes created")
 
+
+def timed_build(con):
+    """Run the single-scan build as a REPORT step; returns its record, tables nested."""
+    with REPORT.step(con, "single-scan") as step:
+        build_single_scan(con)
+    return step.record
+
+
+def build(con):
+    """Full rebuild of every aggregate table and sketch, then the indexes.
+
+    Returns the run report records of the build, for the pipeline's report
+    and state.
+    """
+    start = len(REPORT.steps)
+    record = timed_build(con)
+    print(f"\n  single-scan build: {record['wall_s']:.1f}s")
+    build_sketches(con)
+    create_indexes(con)
+    return REPORT.steps[start:]
+
+
+def column_types(con, schema, table):
+    """{column: type} of schema.table."""
+    return dict(con.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = ? AND table_name = ? ORDER BY ordinal_position",
+        [schema, table],
+    ).fetchall())
+
+
+def by_npi(table):
+    """main.<table> keyed on the NPI string like the baseline, rather than npi_id."""
+    if "npi_id" not in AGG_TABLES[table]:
+        return f"main.{table}"
+    return f"(SELECT d.npi, t.* EXCLUDE (npi_id) FROM main.{table} t LEFT JOIN dim_npi d USING (npi_id))"
+
+
+def diff_tables(con, schema, table):
+    """(mismatched rows, differing column types) of main.<table> against <schema>.<table>.
+
+    The baseline is keyed on the NPI string, so npi_id is mapped back through
+    dim_npi; every other column must keep its type. Keys and integer columns
+    must be identical. DOUBLE sums are compared with a 1e-9 relative
+    tolerance: floating-point addition order already differs between two
+    runs of the same parallel aggregate.
+    """
+    keys = ["npi" if k == "npi_id" else k for k in AGG_TABLES[table]]
+    expected = column_types(con, schema, table)
+    actual = column_types(con, "main", table)
+    types = [
+        f"{col} {actual.get(col)} (baseline {dtype})"
+        for col, dtype in expected.items()
+        if col not in keys and actual.get(col) != dtype
+    ]
+    on = " AND ".join(f"a.{k} IS NOT DISTINCT FROM b.{k}" for k in keys)
+    mismatches = ["a._present IS NULL", "b._present IS NULL"]
+    for col, dtype in expected.items():
+        if col in keys:
+            continue
+        if dtype in ("DOUBLE", "FLOAT"):
+            mismatches.append(
+                f"NOT (a.{col} IS NOT DISTINCT FROM b.{col} OR "
+                f"ABS(a.{col} - b.{col}) <= 1e-9 * GREATEST(ABS(a.{col}), ABS(b.{col}), 1))"
+            )
+        else:
+            mismatches.append(f"a.{col} IS DISTINCT FROM b.{col}")
+    rows = con.execute(f"""
+        SELECT COUNT(*)
+        FROM (SELECT *, 1 AS _present FROM {schema}.{table}) a
+        FULL OUTER JOIN (SELECT *, 1 AS _present FROM {by_npi(table)}) b ON {on}
+        WHERE {" OR ".join(mismatches)}
+    """).fetchone()[0]
+    return rows, types
+
+
+def compare(con):
+    """Build the baseline and the single-scan tables from the same spending and diff them."""
+    baseline = build_baseline(con)
+    single = timed_build(con)
+
+    print(f"\n{'='*60}")
+    print("Comparing single-scan output against the baseline...")
+    ok = True
+    for table in AGG_TABLES:
+        bad, types = diff_tables(con, BASELINE_SCHEMA, table)
+        ok = ok and bad == 0 and not types
+        print(f"  {'✓' if bad == 0 and not types else '✗'} {table}: {bad:,} mismatched rows"
+              + "".join(f"; {t}" for t in types))
+    con.execute(f"DROP SCHEMA {BASELINE_SCHEMA} CASCADE")
+
+    baseline_timings = run_report.timings(baseline["steps"])
+    single_timings = run_report.timings(single["steps"])
+    print(f"\n  {'':<32} {'baseline':>10} {'single-scan':>11}")
+    for table in AGG_TABLES:
+        print(f"  {table:<32} {baseline_timings[table]:9.1f}s {single_timings[table]:10.1f}s")
+    print(f"  {'total':<32} {baseline['wall_s']:9.1f}s {single['wall_s']:10.1f}s "
+          f"({baseline['wall_s'] / max(single['wall_s'], 1e-9):.1f}x)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compare", action="store_true",
+                        help="also build the baseline tables, diff against them and report timings")
+    parser.add_argument("--incremental", action="store_true",
+                        help="refresh only new or restated months instead of rebuilding")
+    parser.add_argument("--months",
+                        help="comma-separated YYYY-MM months for --incremental "
+                             "(default: months in spending missing from the aggregates)")
+    parser.add_argument("--memory-limit", default=MEMORY_LIMIT,
+                        help="DuckDB memory_limit, e.g. 8GB (default: $DUCKDB_MEMORY_LIMIT)")
+    parser.add_argument("--temp-dir", default=TEMP_DIR,
+                        help="where DuckDB spills when over the memory limit")
+    parser.add_argument("--layout", choices=table_layout.MODES, default=table_layout.MODE,
+                        help="row order / index layout of each table (default: $AGG_LAYOUT or auto, "
+                             "the bench_layout.py pick); see table_layout.py")
+    args = parser.parse_args()
+    table_layout.MODE = args.layout
+
+    con = duckdb.connect(DB_PATH)
+    print(f"Connected to {DB_PATH}")
+    configure(con, args.memory_limit, args.temp_dir)
+    print(f"Spending rows: {con.execute('SELECT COUNT(*) FROM spending').fetchone()[0]:,}")
+
+    if args.incremental:
+        months = args.months.split(",") if args.months else new_months(con)
+        if not months:
+            print("No new months to refresh.")
+        else:
+            with REPORT.step(con, "incremental") as step:
+                refresh_months(con, months)
+            print(f"\n  incremental refresh: {step.wall:.1f}s")
+        ok = True
+        create_indexes(con)
+    elif args.compare:
+        ok = compare(con)
+        build_sketches(con)
+        create_indexes(con)
+    else:
+        build(con)
+        ok = True
+
     con.close()
+    REPORT.write()
     print(f"\n{'='*60}")
+    if not ok:
+        print("✗ single-scan tables differ from the baseline!")
+        sys.exit(1)
     print("All aggregate tables built successfully!")
 
 
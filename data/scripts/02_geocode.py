@@ -1,19 +1,40 @@
 #!/usr/bin/env python3
 """Download ZIP code centroids and geocode providers.
 
-Uses Census Bureau ZCTA gazetteer file for ZIP→lat/lng mapping.
+Uses Census Bureau ZCTA gazetteer file for ZIP→lat/lng mapping. The
+gazetteer is downloaded once and cached in DATA_DIR; set GEOCODE_OFFLINE=1
+to never touch the network and fail instead if no cached copy is there.
+
+Not every ZIP is a ZCTA (PO-box-only and single-organisation ZIPs aren't),
+so zip_index maps all 100,000 five-digit ZIPs to the ZCTA to use for them,
+and each provider in map_providers gets a geo_confidence tier:
+
+  exact    practice ZIP is a ZCTA
+  mailing  mailing ZIP is a ZCTA (practice ZIP missing or not a ZCTA)
+  nearest  nearest ZCTA with the same 3-digit prefix as the practice ZIP,
+           or failing that the mailing ZIP
+  none     no usable ZIP; lat/lng are NULL
 """
 import duckdb
+import numpy as np
+import pyarrow as pa
 import urllib.request
 import zipfile
 import os
 import time
 
-DB_PATH = "/Users/charl/Programming/medicaid/medicaid.duckdb"
+import run_report
+import table_layout
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
 DATA_DIR = "/Users/charl/Programming/medicaid/data"
 GAZETTEER_URL = "https://www2.census.gov/geo/docs/maps-data/data/gazetteer/2023_Gazetteer/2023_Gaz_zcta_national.zip"
 GAZETTEER_ZIP = os.path.join(DATA_DIR, "gazetteer.zip")
-GAZETTEER_TXT = os.path.join(DATA_DIR, "2023_Gaz_zcta_national.txt")
+GAZETTEER_TXT = os.environ.get("GAZETTEER_TXT", os.path.join(DATA_DIR, "2023_Gaz_zcta_national.txt"))
+OFFLINE = os.environ.get("GEOCODE_OFFLINE", "") not in ("", "0")
+
+# Geocoding confidence tiers, best first
+CONFIDENCE = ["exact", "mailing", "nearest", "none"]
 
 
 def download_gazetteer():
@@ -21,9 +42,16 @@ def download_gazetteer():
         print(f"Gazetteer already exists at {GAZETTEER_TXT}")
         return
 
-    print(f"Downloading Census ZCTA gazetteer...")
-    urllib.request.urlretrieve(GAZETTEER_URL, GAZETTEER_ZIP)
-    print(f"  ✓ Downloaded to {GAZETTEER_ZIP}")
+    if os.path.exists(GAZETTEER_ZIP):
+        print(f"Using cached {GAZETTEER_ZIP}")
+    elif OFFLINE:
+        raise FileNotFoundError(
+            f"GEOCODE_OFFLINE is set but neither {GAZETTEER_TXT} nor {GAZETTEER_ZIP} exists"
+        )
+    else:
+        print(f"Downloading Census ZCTA gazetteer...")
+        urllib.request.urlretrieve(GAZETTEER_URL, GAZETTEER_ZIP)
+        print(f"  ✓ Downloaded to {GAZETTEER_ZIP}")
 
     with zipfile.ZipFile(GAZETTEER_ZIP, 'r') as z:
         z.extractall(DATA_DIR)
@@ -38,13 +66,15 @@ def download_gazetteer():
             break
 
 
-def main():
-    os.makedirs(DATA_DIR, exist_ok=True)
-    download_gazetteer()
+def load_zip_centroids(con, path=GAZETTEER_TXT):
+    """Load a gazetteer into zip_centroids and build zip_index from it.
 
-    con = duckdb.connect(DB_PATH)
+    The default gazetteer is downloaded first if it isn't cached.
+    """
+    if path == GAZETTEER_TXT:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        download_gazetteer()
 
-    # Load ZIP centroids
     print("\nLoading ZIP centroids into DuckDB...")
     con.execute("DROP TABLE IF EXISTS zip_centroids")
     con.execute(f"""
@@ -53,7 +83,7 @@ def main():
             LPAD(CAST(GEOID AS VARCHAR), 5, '0') AS zip,
             INTPTLAT AS latitude,
             INTPTLONG AS longitude
-        FROM read_csv('{GAZETTEER_TXT}',
+        FROM read_csv('{path}',
             delim='\t',
             header=true,
             auto_detect=true
@@ -61,21 +91,132 @@ def main():
     """)
     count = con.execute("SELECT COUNT(*) FROM zip_centroids").fetchone()[0]
     print(f"  ✓ zip_centroids: {count:,} rows")
+    build_zip_index(con)
+
+
+def build_zip_index(con):
+    """zip_index: the ZCTA centroid to use for every five-digit ZIP, 00000-99999.
+
+    A ZIP that is a ZCTA maps to itself. Any other ZIP maps to the
+    numerically nearest ZCTA sharing its 3-digit prefix (the lower one on a
+    tie). The prefix is a USPS sectional center, so that ZCTA is close by.
+    ZIPs whose prefix has no ZCTA at all map to NULL.
+    """
+    con.execute("DROP TABLE IF EXISTS zip_index")
+    con.execute("""
+        CREATE TABLE zip_index AS
+        WITH zctas AS (
+            SELECT DISTINCT CAST(zip AS INTEGER) AS zip, CAST(zip AS INTEGER) // 100 AS prefix
+            FROM zip_centroids
+            WHERE regexp_full_match(zip, '[0-9]{5}')
+        ),
+        zips AS (
+            SELECT CAST(range AS INTEGER) AS zip, CAST(range AS INTEGER) // 100 AS prefix
+            FROM range(100000)
+        ),
+        neighbours AS (
+            SELECT z.zip, below.zip AS below, above.zip AS above
+            FROM zips z
+            ASOF LEFT JOIN zctas below ON below.prefix = z.prefix AND z.zip >= below.zip
+            ASOF LEFT JOIN zctas above ON above.prefix = z.prefix AND z.zip <= above.zip
+        )
+        SELECT
+            n.zip,
+            n.zcta,
+            c.latitude,
+            c.longitude
+        FROM (
+            SELECT
+                zip,
+                CASE
+                    WHEN above IS NULL OR zip - below <= above - zip THEN below
+                    ELSE above
+                END AS zcta
+            FROM neighbours
+        ) n
+        LEFT JOIN zip_centroids c ON c.zip = LPAD(CAST(n.zcta AS VARCHAR), 5, '0')
+        ORDER BY n.zip
+    """)
+    exact, resolved = con.execute("""
+        SELECT COUNT(*) FILTER (zip = zcta), COUNT(zcta) FROM zip_index
+    """).fetchone()
+    print(f"  ✓ zip_index: {exact:,} ZCTAs, {resolved - exact:,} more ZIPs resolved to the nearest one")
+
+
+def zip_code(column):
+    """SQL for the first five characters of column as an INTEGER ZIP, or -1."""
+    return f"""
+        CASE WHEN regexp_full_match(SUBSTR({column}, 1, 5), '[0-9]{{5}}')
+             THEN CAST(SUBSTR({column}, 1, 5) AS INTEGER) ELSE -1 END
+    """
+
+
+def resolve_zips(index, practice, mailing):
+    """Pick the ZIP to geocode each provider by, and its confidence tier.
 
-    # Build map_providers — pre-joined provider locations + spending stats
+    index is zip_index as arrays indexed by ZIP; practice and mailing are
+    integer ZIP arrays with -1 for missing. Returns (zip, tier) arrays:
+    the chosen ZIP (-1 for none) and an index into CONFIDENCE.
+    """
+    zcta = index["zcta"]
+
+    def lookup(zips):
+        return np.where(zips >= 0, zcta[np.maximum(zips, 0)], -1)
+
+    practice_zcta, mailing_zcta = lookup(practice), lookup(mailing)
+    tier = np.select(
+        [(practice >= 0) & (practice_zcta == practice),
+         (mailing >= 0) & (mailing_zcta == mailing),
+         practice_zcta >= 0,
+         mailing_zcta >= 0],
+        [0, 1, 2, 2],
+        default=3,
+    )
+    use_mailing = (tier == 1) | ((tier == 2) & (practice_zcta < 0))
+    chosen = np.where(tier == 3, -1, np.where(use_mailing, mailing, practice))
+    return chosen, tier
+
+
+def geocode(con, source):
+    """Vectorized geocoding of source (npi_id, practice, mailing integer ZIPs).
+
+    Returns an Arrow table of npi_id, lat, lng and geo_confidence.
+    """
+    index = con.execute("""
+        SELECT COALESCE(zcta, -1) AS zcta,
+               COALESCE(latitude, 'NaN') AS latitude,
+               COALESCE(longitude, 'NaN') AS longitude
+        FROM zip_index
+        ORDER BY zip
+    """).fetchnumpy()
+    providers = con.execute(f"SELECT npi_id, practice, mailing FROM {source}").fetchnumpy()
+    chosen, tier = resolve_zips(index, providers["practice"], providers["mailing"])
+    found = chosen >= 0
+    at = np.maximum(chosen, 0)
+    return pa.table({
+        "npi_id": providers["npi_id"],
+        "lat": pa.array(index["latitude"][at], mask=~found),
+        "lng": pa.array(index["longitude"][at], mask=~found),
+        "geo_confidence": pa.array(np.array(CONFIDENCE)[tier]),
+    })
+
+
+def build_map_providers(con):
+    """Build map_providers — pre-joined provider locations + spending stats."""
     print("\nBuilding map_providers table...")
     t0 = time.time()
     con.execute("DROP TABLE IF EXISTS map_providers")
-    con.execute("""
-        CREATE TABLE map_providers AS
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _map_source AS
         SELECT
-            a.npi,
+            a.npi_id,
+            d.npi,
             COALESCE(n.org_name, CONCAT(n.last_name, ', ', n.first_name)) AS name,
             n.practice_state AS state,
             n.practice_city AS city,
             SUBSTR(COALESCE(n.practice_zip, n.mailing_zip), 1, 5) AS zip,
-            COALESCE(g.latitude, g2.latitude) AS lat,
-            COALESCE(g.longitude, g2.longitude) AS lng,
+            {zip_code("n.practice_zip")} AS practice,
+            {zip_code("n.mailing_zip")} AS mailing,
             a.total_paid,
             a.total_claims,
             a.total_beneficiaries,
@@ -83,19 +224,54 @@ def main():
             a.first_month,
             a.last_month
         FROM agg_provider_summary a
-        JOIN nppes n ON CAST(n.npi AS VARCHAR) = a.npi
-        LEFT JOIN zip_centroids g ON SUBSTR(n.practice_zip, 1, 5) = g.zip
-        LEFT JOIN zip_centroids g2 ON SUBSTR(n.mailing_zip, 1, 5) = g2.zip
+        JOIN dim_npi d ON d.npi_id = a.npi_id
+        JOIN nppes n ON CAST(n.npi AS VARCHAR) = d.npi
+    """)
+    con.register("_geo", geocode(con, "_map_source"))
+    con.execute("""
+        CREATE TABLE map_providers AS
+        SELECT
+            s.npi_id,
+            s.npi,
+            s.name,
+            s.state,
+            s.city,
+            s.zip,
+            g.lat,
+            g.lng,
+            s.total_paid,
+            s.total_claims,
+            s.total_beneficiaries,
+            s.unique_procedures,
+            s.first_month,
+            s.last_month,
+            g.geo_confidence
+        FROM _map_source s
+        JOIN _geo g ON g.npi_id = s.npi_id
     """)
+    con.execute("DROP TABLE _map_source")
+    con.unregister("_geo")
+    order_by = table_layout.sort_table(con, "map_providers")
     count = con.execute("SELECT COUNT(*) FROM map_providers").fetchone()[0]
     geocoded = con.execute("SELECT COUNT(*) FROM map_providers WHERE lat IS NOT NULL").fetchone()[0]
     elapsed = time.time() - t0
-    print(f"  ✓ map_providers: {count:,} rows ({geocoded:,} geocoded, {geocoded*100//count}%) in {elapsed:.1f}s")
+    print(f"  ✓ map_providers: {count:,} rows ({geocoded:,} geocoded, {geocoded*100//count}%) in {elapsed:.1f}s"
+          + (f", sorted by {order_by}" if order_by else ""))
+    tiers = dict(con.execute("SELECT geo_confidence, COUNT(*) FROM map_providers GROUP BY 1").fetchall())
+    print("    " + ", ".join(f"{tier}: {tiers.get(tier, 0):,}" for tier in CONFIDENCE))
+
+    table_layout.index_table(con, "map_providers")
 
-    con.execute("CREATE INDEX IF NOT EXISTS idx_map_prov_npi ON map_providers(npi)")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_map_prov_state ON map_providers(state)")
 
+def main():
+    con = duckdb.connect(DB_PATH)
+    report = run_report.RunReport("02_geocode")
+    with report.step(con, "zip_centroids", outputs=["zip_centroids", "zip_index"]):
+        load_zip_centroids(con)
+    with report.step(con, "map_providers", inputs=["agg_provider_summary"], outputs=["map_providers"]):
+        build_map_providers(con)
     con.close()
+    report.write()
     print("\nGeocoding complete!")
 
 
@@ -1,75 +1,181 @@
 #!/usr/bin/env python3
-"""Download HCPCS code descriptions.
+"""Build hcpcs_codes: every procedure code in our data, with descriptions.
 
-Tries to fetch HCPCS descriptions from CMS.
-Falls back to creating a table with just the codes from our data.
+Descriptions come from a local HCPCS/CPT reference file (HCPCS_FILE, or
+--file), bulk-loaded with DuckDB's CSV reader. Two formats are read:
+
+  fixed-width  the CMS HCPCS Level II annual file (HCPC20xx_..._ANWEB.txt):
+               one record per line, long descriptions continued over
+               several records of the same code (see FIXED_WIDTH)
+  CSV          any file ending in .csv with a header naming a code column
+               and a short and/or long description column (CODE_COLUMNS,
+               SHORT_COLUMNS, LONG_COLUMNS); CMS's own CSV export works,
+               continuation records included
+
+Without a reference file, the codes are loaded with empty descriptions.
+
+    python 03_hcpcs.py                                   # $HCPCS_FILE, if set
+    python 03_hcpcs.py --file HCPC2024_JAN_ANWEB_v3.txt
 """
+import argparse
 import duckdb
-import urllib.request
-import json
 import os
 import time
 
-DB_PATH = "/Users/charl/Programming/medicaid/medicaid.duckdb"
+import run_report
 
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+# Local HCPCS/CPT reference file to take descriptions from
+HCPCS_FILE = os.environ.get("HCPCS_FILE")
 
-def try_cms_api(con):
-    """Try to get HCPCS descriptions from data.cms.gov."""
-    # CMS publishes procedure code data via their API
-    # This endpoint has HCPCS codes with short descriptions
-    url = "https://data.cms.gov/provider-summary-by-type-of-service/medicare-physician-other-practitioners/medicare-physician-other-practitioners-by-provider-and-service/api"
-    # This won't easily give us all HCPCS codes. Skip for now.
-    return False
+# CMS record layout: field -> (1-based start, width)
+FIXED_WIDTH = {
+    "hcpcs_code": (1, 5),
+    "seqnum": (6, 5),
+    "recid": (11, 1),
+    "long_description": (12, 80),
+    "short_description": (92, 28),
+}
+# Record ids of procedure lines (3 = first line, 4 = continuation); 7/8 are modifiers
+PROCEDURE_RECORDS = ("3", "4")
 
+# CSV header names accepted per field, after DuckDB's normalize_names
+CODE_COLUMNS = ["hcpc", "hcpcs", "hcpcs_code", "cpt", "cpt_code", "code"]
+SHORT_COLUMNS = ["short_description", "short_desc", "short_descriptor", "description"]
+LONG_COLUMNS = ["long_description", "long_desc", "long_descriptor"]
+SEQ_COLUMNS = ["seqnum", "seq_num", "sequence"]
+RECID_COLUMNS = ["recid", "rec_id", "record_id"]
 
-def build_from_existing_data(con):
-    """Create hcpcs_codes table from codes present in our spending data."""
-    print("Building HCPCS table from existing spending data codes...")
-    con.execute("DROP TABLE IF EXISTS hcpcs_codes")
+
+def _read_fixed_width(con, path):
+    """SELECT over the fixed-width file's procedure records."""
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _hcpcs_lines AS
+        SELECT line
+        FROM read_csv(?, columns = {{'line': 'VARCHAR'}}, header = false, delim = chr(1),
+                      quote = '', escape = '', auto_detect = false, encoding = 'latin-1')
+    """, [path])
+    fields = ", ".join(
+        f"substr(line, {start}, {width}) AS {name}" for name, (start, width) in FIXED_WIDTH.items()
+    )
+    return f"SELECT {fields} FROM _hcpcs_lines WHERE substr(line, 11, 1) IN {PROCEDURE_RECORDS}"
+
+
+def _read_csv(con, path):
+    """SELECT over the CSV's records, mapped onto the fixed-width field names."""
     con.execute("""
-        CREATE TABLE hcpcs_codes AS
+        CREATE OR REPLACE TEMP TABLE _hcpcs_lines AS
+        SELECT * FROM read_csv(?, header = true, all_varchar = true, normalize_names = true)
+    """, [path])
+    columns = [r[0] for r in con.execute("DESCRIBE _hcpcs_lines").fetchall()]
+
+    def pick(candidates):
+        return next((c for c in candidates if c in columns), None)
+
+    code, short, long, seq, recid = (
+        pick(c) for c in (CODE_COLUMNS, SHORT_COLUMNS, LONG_COLUMNS, SEQ_COLUMNS, RECID_COLUMNS)
+    )
+    if code is None or (short is None and long is None):
+        raise ValueError(f"{path}: no code and description columns in {columns}")
+    code, short, long, seq, recid = (f'"{c}"' if c else None for c in (code, short, long, seq, recid))
+    where = f"WHERE {recid} IN {PROCEDURE_RECORDS}" if recid else ""
+    return f"""
         SELECT
-            hcpcs_code,
-            '' AS short_description,
-            '' AS long_description,
-            unique_providers,
-            total_paid
-        FROM agg_procedure_summary
-        ORDER BY total_paid DESC
+            {code} AS hcpcs_code,
+            {seq or "'0'"} AS seqnum,
+            {long or short} AS long_description,
+            {short or "NULL"} AS short_description
+        FROM _hcpcs_lines
+        {where}
+    """
+
+
+def load_reference(con, path):
+    """Load the reference file into temp table _hcpcs_ref; returns its code count.
+
+    One row per code: the first non-empty short description, and the long
+    description's records joined in sequence order.
+    """
+    t0 = time.time()
+    if path.lower().endswith(".csv"):
+        records = _read_csv(con, path)
+    else:
+        records = _read_fixed_width(con, path)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _hcpcs_ref AS
+        WITH records AS ({records})
+        SELECT
+            upper(trim(hcpcs_code)) AS hcpcs_code,
+            COALESCE(
+                arg_min(trim(short_description), TRY_CAST(trim(seqnum) AS INTEGER))
+                    FILTER (WHERE trim(short_description) <> ''),
+                ''
+            ) AS short_description,
+            COALESCE(
+                string_agg(NULLIF(trim(long_description), ''), ' ' ORDER BY TRY_CAST(trim(seqnum) AS INTEGER)),
+                ''
+            ) AS long_description
+        FROM records
+        WHERE trim(hcpcs_code) <> ''
+        GROUP BY 1
     """)
-    count = con.execute("SELECT COUNT(*) FROM hcpcs_codes").fetchone()[0]
-    print(f"  ✓ hcpcs_codes: {count:,} codes (descriptions will be added later)")
+    con.execute("DROP TABLE _hcpcs_lines")
+    count = con.execute("SELECT COUNT(*) FROM _hcpcs_ref").fetchone()[0]
+    print(f"  ✓ {os.path.basename(path)}: {count:,} reference codes in {time.time() - t0:.1f}s")
     return count
 
 
-def try_download_hcpcs_csv(con):
-    """Try to download a HCPCS reference file."""
-    # Try the CMS HCPCS file - this is a known public dataset
-    try:
-        url = "https://data.cms.gov/provider-summary-by-type-of-service/medicare-physician-other-practitioners/medicare-physician-other-practitioners-by-provider-and-service"
-        # The above is an HTML page, not useful directly.
-        # Instead, let's try the BETOS classification which has HCPCS mapping
-        print("Attempting to download HCPCS reference data...")
+def setup_hcpcs(con, path=HCPCS_FILE):
+    """Build hcpcs_codes from agg_procedure_summary, with descriptions from path."""
+    print("Building HCPCS table from existing spending data codes...")
+    if path:
+        load_reference(con, path)
+        descriptions = """
+            COALESCE(r.short_description, '') AS short_description,
+            COALESCE(r.long_description, '') AS long_description,
+        """
+        join = "LEFT JOIN _hcpcs_ref r ON r.hcpcs_code = upper(p.hcpcs_code)"
+    else:
+        descriptions = "'' AS short_description, '' AS long_description,"
+        join = ""
 
-        # Use the Medicare PUF which has HCPCS + description
-        # This is a simplified approach - download from a known endpoint
-        api_url = "https://data.cms.gov/data-api/v1/dataset/9767cb68-8ea9-4f0b-8179-9431abc89f11/data?size=0&offset=0"
-        # This likely won't work directly. Let's fall back.
-        return False
-    except Exception as e:
-        print(f"  Download failed: {e}")
-        return False
+    con.execute("DROP TABLE IF EXISTS hcpcs_codes")
+    con.execute(f"""
+        CREATE TABLE hcpcs_codes AS
+        SELECT
+            p.hcpcs_code,
+            {descriptions}
+            p.unique_providers,
+            p.total_paid
+        FROM agg_procedure_summary p
+        {join}
+        ORDER BY p.total_paid DESC
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_hcpcs_code ON hcpcs_codes(hcpcs_code)")
 
+    count, described = con.execute(
+        "SELECT COUNT(*), COUNT(*) FILTER (short_description <> '') FROM hcpcs_codes"
+    ).fetchone()
+    if path:
+        con.execute("DROP TABLE _hcpcs_ref")
+        print(f"  ✓ hcpcs_codes: {count:,} codes, {described:,} with descriptions")
+    else:
+        print(f"  ✓ hcpcs_codes: {count:,} codes (no HCPCS_FILE, so no descriptions)")
+    return count
 
-def main():
-    con = duckdb.connect(DB_PATH)
 
-    # Try to get descriptions, fall back to codes-only
-    if not try_download_hcpcs_csv(con):
-        build_from_existing_data(con)
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=HCPCS_FILE,
+                        help="HCPCS/CPT reference file, fixed-width or .csv (default: $HCPCS_FILE)")
+    args = parser.parse_args()
 
-    con.execute("CREATE INDEX IF NOT EXISTS idx_hcpcs_code ON hcpcs_codes(hcpcs_code)")
+    con = duckdb.connect(DB_PATH)
+    report = run_report.RunReport("03_hcpcs")
+    with report.step(con, "hcpcs", inputs=["agg_procedure_summary"], outputs=["hcpcs_codes"]):
+        setup_hcpcs(con, args.file)
     con.close()
+    report.write()
     print("\nHCPCS setup complete!")
 
 
@@ -3,23 +3,54 @@
 
 The Arrow file is loaded directly by deck.gl in the browser,
 avoiding sending 1M+ rows as JSON on page load.
+
+Two layouts (--mode, or ARROW_MODE):
+
+  plain    float64 coordinates and sums, VARCHAR npi, plain strings,
+           uncompressed
+  compact  float32 coordinates and total_paid, uint32 npi, int32 counts,
+           dictionary-encoded state and city, and IPC buffers compressed
+           with ARROW_COMPRESSION (zstd or lz4). Around a fifth of the size.
+           A browser reader needs that codec registered to decode it.
+
+--compare writes both next to ARROW_PATH and prints their size and decode
+time.
+
+Rows stream from DuckDB in record batches of ARROW_BATCH_ROWS straight into
+the writers, so memory stays flat however many providers there are. The
+same pass writes one file per state to ARROW_STATE_DIR (<state>.arrow,
+unknown.arrow for rows without one) plus a manifest.json listing each
+file's rows, bytes and bounding box. The state filter can then fetch just
+one partition.
 """
+import argparse
 import duckdb
+import json
 import os
+import statistics
+import time
+from datetime import datetime, timezone
 
-DB_PATH = "/Users/charl/Programming/medicaid/medicaid.duckdb"
-ARROW_PATH = "/Users/charl/Programming/medicaid/frontend/public/data/providers.arrow"
-
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
 
-def main():
-    os.makedirs(os.path.dirname(ARROW_PATH), exist_ok=True)
+import run_report
 
-    con = duckdb.connect(DB_PATH, read_only=True)
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+ARROW_PATH = os.environ.get("ARROW_PATH", "/Users/charl/Programming/medicaid/frontend/public/data/providers.arrow")
+ARROW_MODE = os.environ.get("ARROW_MODE", "plain")
+ARROW_COMPRESSION = os.environ.get("ARROW_COMPRESSION", "zstd")
+ARROW_STATE_DIR = os.environ.get("ARROW_STATE_DIR", os.path.join(os.path.dirname(ARROW_PATH), "providers"))
+ARROW_BATCH_ROWS = int(os.environ.get("ARROW_BATCH_ROWS", 65536))
+MANIFEST = "manifest.json"
 
-    print("Exporting map_providers to Arrow format...")
+# Only providers the map can place
+GEOCODED = "lat IS NOT NULL AND lng IS NOT NULL"
 
-    # Select only columns needed for the map to minimize file size
-    result = con.execute("""
+# Select only columns needed for the map to minimize file size
+EXPORT_SQL = {
+    "plain": f"""
         SELECT
             npi,
             name,
@@ -31,25 +62,218 @@ def main():
             total_claims,
             total_beneficiaries
         FROM map_providers
-        WHERE lat IS NOT NULL AND lng IS NOT NULL
-    """)
+        WHERE {GEOCODED}
+    """,
+    # float32 keeps ~1 m of precision at US latitudes and 7 significant
+    # digits of total_paid; the integer casts fail loudly rather than wrap
+    "compact": f"""
+        SELECT
+            CAST(npi AS UINTEGER) AS npi,
+            name,
+            state,
+            city,
+            CAST(lat AS FLOAT) AS lat,
+            CAST(lng AS FLOAT) AS lng,
+            CAST(total_paid AS FLOAT) AS total_paid,
+            CAST(total_claims AS INTEGER) AS total_claims,
+            CAST(total_beneficiaries AS INTEGER) AS total_beneficiaries
+        FROM map_providers
+        WHERE {GEOCODED}
+    """,
+}
+
+# Low-cardinality string columns and their dictionary index types
+DICTIONARY_COLUMNS = {"state": pa.int8(), "city": pa.int32()}
+
+
+def dictionaries(con):
+    """Every value of each DICTIONARY_COLUMNS column, so all batches share one dictionary."""
+    return {
+        name: pa.array([r[0] for r in con.execute(f"""
+            SELECT DISTINCT {name} FROM map_providers WHERE {GEOCODED} AND {name} IS NOT NULL ORDER BY 1
+        """).fetchall()], pa.string())
+        for name in DICTIONARY_COLUMNS
+    }
+
+
+def encoder(schema, dicts):
+    """(output schema, fn mapping a DuckDB batch to it) for the dictionary columns."""
+    fields = [
+        pa.field(f.name, pa.dictionary(DICTIONARY_COLUMNS[f.name], pa.string()))
+        if f.name in dicts else f
+        for f in schema
+    ]
+    out_schema = pa.schema(fields)
+
+    def encode(batch):
+        columns = []
+        for f, column in zip(schema, batch.columns):
+            if f.name in dicts:
+                indices = pc.index_in(column, value_set=dicts[f.name]).cast(DICTIONARY_COLUMNS[f.name])
+                column = pa.DictionaryArray.from_arrays(indices, dicts[f.name])
+            columns.append(column)
+        return pa.RecordBatch.from_arrays(columns, schema=out_schema)
+
+    return out_schema, encode
+
 
-    arrow_table = result.fetch_arrow_table()
-    print(f"  Rows: {arrow_table.num_rows:,}")
-    print(f"  Columns: {arrow_table.column_names}")
+class _Output:
+    """One Arrow IPC file being written: rows, lat/lng bounds, and a temp name until closed."""
 
-    import pyarrow as pa
-    import pyarrow.ipc as ipc
+    def __init__(self, path, schema, compression):
+        self.path = path
+        self.rows = 0
+        self.bounds = None
+        self.sink = pa.OSFile(path + ".tmp", "wb")
+        self.writer = ipc.new_file(self.sink, schema, options=ipc.IpcWriteOptions(compression=compression))
 
-    with pa.OSFile(ARROW_PATH, 'wb') as f:
-        writer = ipc.new_file(f, arrow_table.schema)
-        writer.write_table(arrow_table)
-        writer.close()
+    def write(self, batch):
+        if not batch.num_rows:
+            return
+        self.writer.write_batch(batch)
+        self.rows += batch.num_rows
+        lat, lng = pc.min_max(batch.column("lat")), pc.min_max(batch.column("lng"))
+        box = [lat["min"].as_py(), lng["min"].as_py(), lat["max"].as_py(), lng["max"].as_py()]
+        if self.bounds:
+            box = [min(self.bounds[0], box[0]), min(self.bounds[1], box[1]),
+                   max(self.bounds[2], box[2]), max(self.bounds[3], box[3])]
+        self.bounds = box
 
-    size_mb = os.path.getsize(ARROW_PATH) / (1024 * 1024)
-    print(f"  ✓ Written to {ARROW_PATH} ({size_mb:.1f} MB)")
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+        os.replace(self.path + ".tmp", self.path)
+        return {
+            "rows": self.rows,
+            "bytes": os.path.getsize(self.path),
+            # [min lat, min lng, max lat, max lng]
+            "bounds": [round(v, 6) for v in self.bounds] if self.bounds else None,
+        }
 
+
+def split_by_state(batch):
+    """(state, rows) pieces of a batch; state is None for rows without one."""
+    states = batch.column("state")
+    values = pc.unique(states).to_pylist()
+    if len(values) == 1:
+        return [(values[0], batch)]
+    return [
+        (s, batch.filter(pc.is_null(states) if s is None else pc.equal(states, s)))
+        for s in values
+    ]
+
+
+def decode_seconds(path, repeat=5):
+    """Median time to read path and materialise every column, as a client would."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        with pa.memory_map(path) as source:
+            table = ipc.open_file(source).read_all()
+            table.combine_chunks()
+        times.append(time.time() - t0)
+    return statistics.median(times)
+
+
+def export_arrow(con, path=ARROW_PATH, mode=ARROW_MODE, state_dir=ARROW_STATE_DIR):
+    """Stream the geocoded map_providers rows to path, and per state to state_dir.
+
+    Pass state_dir=None to skip the per-state files.
+    """
+    if mode not in EXPORT_SQL:
+        raise ValueError(f"ARROW_MODE must be one of {', '.join(EXPORT_SQL)}, got {mode!r}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compression = ARROW_COMPRESSION if mode == "compact" else None
+
+    print(f"Exporting map_providers to Arrow format ({mode})...")
+    # Before the stream starts: another query on con would cancel it
+    dicts = dictionaries(con) if mode == "compact" else {}
+    reader = con.execute(EXPORT_SQL[mode]).fetch_record_batch(ARROW_BATCH_ROWS)
+    schema, encode = encoder(reader.schema, dicts)
+    print(f"  Columns: {schema.names}")
+
+    combined = _Output(path, schema, compression)
+    states = {}
+    if state_dir is not None:
+        os.makedirs(state_dir, exist_ok=True)
+    for batch in reader:
+        combined.write(encode(batch))
+        if state_dir is None:
+            continue
+        for state, rows in split_by_state(batch):
+            if state not in states:
+                name = f"{state or 'unknown'}.arrow"
+                states[state] = _Output(os.path.join(state_dir, name), schema, compression)
+            states[state].write(encode(rows))
+
+    stats = combined.close()
+    print(f"  Rows: {stats['rows']:,}")
+    size_mb = stats["bytes"] / (1024 * 1024)
+    print(f"  ✓ Written to {path} ({size_mb:.1f} MB)")
+    if state_dir is not None:
+        write_manifest(state_dir, path, mode, compression, schema, stats, states)
+
+
+def write_manifest(state_dir, path, mode, compression, schema, stats, states):
+    """Close the per-state files and describe them in state_dir/manifest.json."""
+    files = []
+    for state in sorted(states, key=lambda s: (s is None, s or "")):
+        output = states[state]
+        files.append({"state": state, "path": os.path.basename(output.path), **output.close()})
+    written = {f["path"] for f in files}
+    for name in os.listdir(state_dir):
+        if name.endswith(".arrow") and name not in written:
+            os.remove(os.path.join(state_dir, name))
+
+    manifest = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "mode": mode,
+        "compression": compression,
+        "columns": {f.name: str(f.type) for f in schema},
+        "all": {"path": os.path.relpath(path, state_dir), **stats},
+        "states": files,
+    }
+    tmp = os.path.join(state_dir, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(state_dir, MANIFEST))
+    total_mb = sum(f["bytes"] for f in files) / (1024 * 1024)
+    print(f"  ✓ {len(files)} state files ({total_mb:.1f} MB) and {MANIFEST} in {state_dir}")
+
+
+def compare(con, repeat=5):
+    """Write every mode next to ARROW_PATH and print size and decode time."""
+    base, ext = os.path.splitext(ARROW_PATH)
+    results = []
+    for mode in EXPORT_SQL:
+        path = f"{base}.{mode}{ext}"
+        export_arrow(con, path, mode, state_dir=None)
+        results.append((mode, os.path.getsize(path), decode_seconds(path, repeat)))
+
+    plain_size, plain_time = results[0][1], results[0][2]
+    print(f"\n  {'':<10} {'size':>10} {'decode':>9}")
+    for mode, size, seconds in results:
+        print(f"  {mode:<10} {size / (1024 * 1024):7.1f} MB {seconds * 1000:7.1f}ms "
+              f"({size / plain_size:.0%} of plain size, {seconds / max(plain_time, 1e-9):.0%} of its decode time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=sorted(EXPORT_SQL), default=ARROW_MODE,
+                        help="file layout (default: $ARROW_MODE or plain)")
+    parser.add_argument("--compare", action="store_true",
+                        help="write every mode and compare size and decode time")
+    args = parser.parse_args()
+
+    con = duckdb.connect(DB_PATH, read_only=True)
+    report = run_report.RunReport("04_export_arrow")
+    with report.step(con, "arrow_export", inputs=["map_providers"]):
+        if args.compare:
+            compare(con)
+        else:
+            export_arrow(con, mode=args.mode)
     con.close()
+    report.write()
     print("\nArrow export complete!")
 
 
@@ -5,58 +5,157 @@ Source: https://oig.hhs.gov/exclusions/downloadables/UPDATED.csv
 The LEIE contains ~82K excluded individuals/entities. About 9K have valid NPIs.
 We filter to valid NPIs and join against our spending data to find excluded
 providers still receiving Medicaid payments.
+
+Each row of oig_exclusions carries a row_hash of its fields. A refresh
+stages the new CSV, deletes the rows whose hash is gone and inserts the
+new ones, so a monthly update touches a few hundred rows instead of
+reloading the table. --full (or a missing table) reloads from scratch.
+Rows with a reinstatement date are not exclusions any more and never make
+it into the table; a listed row that gains one is deleted.
+
+    python 05_load_oig.py                    # download CSV_URL, then refresh
+    python 05_load_oig.py --file UPDATED.csv # refresh from a local copy
+    python 05_load_oig.py --full             # reload everything
+
+oig_matched is a table of the excluded providers found in map_providers,
+sorted by total_paid with its rank in `pos`, and oig_summary holds their
+count and total. Both are rebuilt on every run; rerun this script after
+rebuilding map_providers (run_pipeline.py does).
 """
+import argparse
 import duckdb
 import os
+import time
 import urllib.request
 
+import run_report
+
 DB_PATH = os.environ.get(
     "DUCKDB_PATH",
     os.path.join(os.path.dirname(__file__), "..", "..", "medicaid.duckdb"),
 )
-CSV_URL = "https://oig.hhs.gov/exclusions/downloadables/UPDATED.csv"
+CSV_URL = os.environ.get("OIG_CSV_URL", "https://oig.hhs.gov/exclusions/downloadables/UPDATED.csv")
 CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "oig_exclusions.csv")
+# Load this local LEIE file instead of downloading CSV_URL
+CSV_FILE = os.environ.get("OIG_CSV_FILE")
 
+# oig_exclusions columns from the CSV, all trimmed VARCHAR
+COLUMNS = ["npi", "lastname", "firstname", "busname", "specialty", "excltype", "excldate", "reindate", "state"]
+# Rows of _leie still in force: no reinstatement date
+EXCLUDED = "COALESCE(reindate, '') IN ('', '00000000')"
 
-def main():
-    CSV_PATH_ABS = os.path.abspath(CSV_PATH)
 
-    # Download
+def download(path=CSV_PATH):
+    """Fetch CSV_URL to path; returns the absolute path."""
+    path = os.path.abspath(path)
     print(f"Downloading OIG LEIE from {CSV_URL} ...")
-    urllib.request.urlretrieve(CSV_URL, CSV_PATH_ABS)
-    size_mb = os.path.getsize(CSV_PATH_ABS) / (1024 * 1024)
-    print(f"  Downloaded {size_mb:.1f} MB to {CSV_PATH_ABS}")
+    urllib.request.urlretrieve(CSV_URL, path)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"  Downloaded {size_mb:.1f} MB to {path}")
+    return path
 
-    # Load into DuckDB
-    con = duckdb.connect(DB_PATH)
 
+def stage(con, path):
+    """Read the CSV into temp table _leie: COLUMNS plus a row_hash.
+
+    The hash covers every column and the row's ordinal among exact
+    duplicates, so identical rows in the list stay distinct.
+    """
+    fields = ", ".join(f"TRIM({c.upper()}) AS {c}" for c in COLUMNS)
+    struct = ", ".join(f"'{c}': {c}" for c in COLUMNS)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _leie AS
+        SELECT
+            {", ".join(COLUMNS)},
+            md5(to_json({{{struct}, 'dup': dup}})) AS row_hash
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY {", ".join(COLUMNS)}) AS dup
+            FROM (
+                SELECT {fields}
+                FROM read_csv('{path}', header=true, all_varchar=true)
+                WHERE TRIM(NPI) != '0000000000'
+                  AND TRIM(NPI) != ''
+                  AND NPI IS NOT NULL
+            )
+        )
+    """)
+
+
+def has_row_hash(con):
+    return con.execute("""
+        SELECT COUNT(*) FROM duckdb_columns()
+        WHERE table_name = 'oig_exclusions' AND column_name = 'row_hash'
+    """).fetchone()[0] > 0
+
+
+def reload_exclusions(con):
     con.execute("DROP TABLE IF EXISTS oig_exclusions")
     con.execute(f"""
         CREATE TABLE oig_exclusions AS
         SELECT
-            TRIM(NPI) AS npi,
-            TRIM(LASTNAME) AS lastname,
-            TRIM(FIRSTNAME) AS firstname,
-            TRIM(BUSNAME) AS busname,
-            TRIM(SPECIALTY) AS specialty,
-            TRIM(EXCLTYPE) AS excltype,
-            TRIM(EXCLDATE) AS excldate,
-            TRIM(REINDATE) AS reindate,
-            TRIM(STATE) AS state
-        FROM read_csv('{CSV_PATH_ABS}', header=true, all_varchar=true)
-        WHERE TRIM(NPI) != '0000000000'
-          AND TRIM(NPI) != ''
-          AND NPI IS NOT NULL
+            d.npi_id,
+            l.*
+        FROM _leie l
+        -- npi_id is NULL for excluded NPIs that never billed Medicaid
+        LEFT JOIN dim_npi d ON d.npi = l.npi
+        WHERE {EXCLUDED}
     """)
-
     count = con.execute("SELECT COUNT(*) FROM oig_exclusions").fetchone()[0]
     print(f"  Loaded {count:,} excluded providers with valid NPIs")
 
-    # Create view joining to spending data
-    con.execute("DROP VIEW IF EXISTS oig_matched")
+
+def refresh_exclusions(con):
+    """Apply the difference between _leie and oig_exclusions.
+
+    Deleted rows are either reinstated (the NPI is listed again with a
+    reinstatement date) or dropped from the list altogether.
+    """
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _excluded AS SELECT * FROM _leie WHERE {EXCLUDED}")
+    con.execute("BEGIN TRANSACTION")
+    try:
+        reinstated, delisted = con.execute(f"""
+            SELECT
+                COUNT(*) FILTER (npi IN (SELECT npi FROM _leie WHERE NOT {EXCLUDED})),
+                COUNT(*) FILTER (npi NOT IN (SELECT npi FROM _leie))
+            FROM oig_exclusions
+            WHERE row_hash NOT IN (SELECT row_hash FROM _excluded)
+        """).fetchone()
+        removed = con.execute("""
+            DELETE FROM oig_exclusions WHERE row_hash NOT IN (SELECT row_hash FROM _excluded)
+        """).fetchone()[0]
+        added = con.execute("""
+            INSERT INTO oig_exclusions
+            SELECT d.npi_id, l.*
+            FROM _excluded l
+            LEFT JOIN dim_npi d ON d.npi = l.npi
+            WHERE l.row_hash NOT IN (SELECT row_hash FROM oig_exclusions)
+        """).fetchone()[0]
+        # dim_npi may have gained NPIs since the rows were loaded
+        relinked = con.execute("""
+            UPDATE oig_exclusions o SET npi_id = d.npi_id
+            FROM dim_npi d
+            WHERE d.npi = o.npi AND o.npi_id IS DISTINCT FROM d.npi_id
+        """).fetchone()[0]
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.execute("DROP TABLE _excluded")
+    count = con.execute("SELECT COUNT(*) FROM oig_exclusions").fetchone()[0]
+    print(f"  Refreshed oig_exclusions: {added:,} added, {removed:,} removed "
+          f"({reinstated:,} reinstated, {delisted:,} no longer listed), {relinked:,} relinked ({count:,} rows)")
+
+
+def build_matched(con, source):
+    """Materialize oig_matched (ranked by total_paid) and oig_summary."""
+    # Older databases have oig_matched as a view
+    if con.execute("SELECT COUNT(*) FROM duckdb_views() WHERE view_name = 'oig_matched'").fetchone()[0]:
+        con.execute("DROP VIEW oig_matched")
     con.execute("""
-        CREATE VIEW oig_matched AS
+        CREATE OR REPLACE TABLE oig_matched AS
         SELECT
+            ROW_NUMBER() OVER (ORDER BY m.total_paid DESC NULLS LAST, o.npi, o.row_hash) AS pos,
             o.npi,
             COALESCE(m.name, o.lastname || ', ' || o.firstname) AS name,
             COALESCE(m.state, o.state) AS state,
@@ -69,15 +168,58 @@ def main():
             o.busname,
             o.specialty
         FROM oig_exclusions o
-        JOIN map_providers m ON m.npi = o.npi
+        JOIN map_providers m ON m.npi_id = o.npi_id
+        ORDER BY pos
     """)
+    con.execute("""
+        CREATE OR REPLACE TABLE oig_summary AS
+        SELECT
+            COUNT(*) AS matched,
+            SUM(total_paid) AS total_paid,
+            (SELECT COUNT(*) FROM oig_exclusions) AS listed,
+            ? AS source,
+            CAST(now() AS TIMESTAMP) AS refreshed_at
+        FROM oig_matched
+    """, [source])
 
-    matched = con.execute("SELECT COUNT(*) FROM oig_matched").fetchone()[0]
-    total_paid = con.execute("SELECT SUM(total_paid) FROM oig_matched").fetchone()[0]
+    matched, total_paid = con.execute("SELECT matched, total_paid FROM oig_summary").fetchone()
     print(f"  {matched:,} excluded providers found in spending data")
-    print(f"  Total paid to excluded providers: ${total_paid:,.2f}")
+    print(f"  Total paid to excluded providers: ${total_paid or 0:,.2f}")
 
+
+def load_oig(con, path=CSV_FILE, full=False):
+    """Load the LEIE into oig_exclusions and rebuild oig_matched.
+
+    path is a local CSV; without one, CSV_URL is downloaded first. The
+    table is refreshed in place unless full is set or it predates row_hash.
+    """
+    t0 = time.time()
+    path = os.path.abspath(path) if path else download()
+    print(f"Loading {path} ...")
+    stage(con, path)
+    if full or not has_row_hash(con):
+        reload_exclusions(con)
+    else:
+        refresh_exclusions(con)
+    con.execute("DROP TABLE _leie")
+    build_matched(con, path)
+    print(f"  ✓ oig_exclusions and oig_matched in {time.time() - t0:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=CSV_FILE,
+                        help="load this local LEIE CSV instead of downloading (default: $OIG_CSV_FILE)")
+    parser.add_argument("--full", action="store_true",
+                        help="reload oig_exclusions from scratch instead of refreshing it")
+    args = parser.parse_args()
+
+    con = duckdb.connect(DB_PATH)
+    report = run_report.RunReport("05_load_oig")
+    with report.step(con, "oig", outputs=["oig_exclusions", "oig_matched", "oig_summary"]):
+        load_oig(con, args.file, full=args.full)
     con.close()
+    report.write()
     print("\nOIG exclusion list loaded successfully!")
 
 
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Precompute the fraud-risk signals and composite scores per provider.
+
+Three signals, each normalized to a 0-100 score:
+
+  billing_10x   procedures billed at 10x+ the state average $/claim
+  yoy_growth    year-over-year spending growth (3x+)
+  unusual_mix   share of a provider's procedures that fewer than 2% of
+                providers in their state bill
+
+composite = 0.4 * billing_10x + 0.3 * yoy_growth + 0.3 * unusual_mix. A
+provider is flagged when at least two signals fire and the composite is
+20 or more.
+
+fraud_signals has one row per NPI with any signal: the raw signal values,
+the scores and the map_providers details. It is sorted flagged first, then
+by composite score, and `pos` ranks the flagged rows, so the API's
+fraud-risk ranking is a range read.
+
+Which NPIs have a signal doesn't depend on the thresholds, so each row also
+keeps the per-procedure $/claim ratios (and paid) and the rare-procedure
+prevalences as lists. The API rescores those with other weights and
+thresholds (backend/app/scoring.py).
+"""
+import duckdb
+import os
+import time
+
+import run_report
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+
+WEIGHTS = {"billing_10x": 0.4, "yoy_growth": 0.3, "unusual_mix": 0.3}
+MIN_SIGNALS = 2
+MIN_COMPOSITE = 20
+
+
+def billing_10x(con):
+    """_signal_billing: procedures at 10x+ the state average $/claim per NPI."""
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _signal_billing AS
+        WITH state_avgs AS (
+            SELECT
+                m.state,
+                p.hcpcs_code,
+                SUM(p.total_paid) / NULLIF(SUM(p.total_claims), 0) AS state_avg
+            FROM agg_provider_procedure p
+            JOIN map_providers m ON m.npi_id = p.npi_id
+            WHERE p.total_claims >= 10
+            GROUP BY m.state, p.hcpcs_code
+            HAVING COUNT(DISTINCT p.npi_id) >= 5
+        ),
+        ratios AS (
+            SELECT
+                p.npi_id,
+                p.hcpcs_code,
+                (p.total_paid / NULLIF(p.total_claims, 0)) / NULLIF(sa.state_avg, 0) AS ratio,
+                p.total_paid
+            FROM agg_provider_procedure p
+            JOIN map_providers m ON m.npi_id = p.npi_id
+            JOIN state_avgs sa ON sa.state = m.state AND sa.hcpcs_code = p.hcpcs_code
+            WHERE p.total_claims >= 10 AND sa.state_avg > 0
+        )
+        SELECT
+            npi_id,
+            COUNT(CASE WHEN ratio >= 10 THEN 1 END) AS procs_10x,
+            MAX(ratio) AS max_ratio,
+            SUM(CASE WHEN ratio >= 10 THEN total_paid ELSE 0 END) AS outlier_spend,
+            LIST(ratio ORDER BY hcpcs_code) AS ratios,
+            LIST(total_paid ORDER BY hcpcs_code) AS ratio_paid
+        FROM ratios
+        GROUP BY npi_id
+    """)
+
+
+def yoy_growth(con):
+    """_signal_growth: largest year-over-year spending growth per NPI."""
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _signal_growth AS
+        WITH yearly AS (
+            SELECT
+                npi_id,
+                SUBSTRING(month, 1, 4) AS year,
+                SUM(total_paid) AS annual_paid
+            FROM agg_provider_monthly
+            GROUP BY npi_id, SUBSTRING(month, 1, 4)
+        ),
+        yoy AS (
+            SELECT
+                y2.npi_id,
+                y2.year,
+                y2.annual_paid / NULLIF(y1.annual_paid, 0) AS growth
+            FROM yearly y2
+            JOIN yearly y1 ON y1.npi_id = y2.npi_id
+                AND CAST(y1.year AS INT) = CAST(y2.year AS INT) - 1
+            WHERE y1.annual_paid > 10000
+              AND y2.annual_paid > 50000
+        )
+        SELECT
+            npi_id,
+            MAX(growth) AS max_yoy,
+            COUNT(CASE WHEN growth >= 3 THEN 1 END) AS years_3x
+        FROM yoy
+        GROUP BY npi_id
+    """)
+
+
+def unusual_mix(con):
+    """_signal_mix: procedures billed and how many are rare in the NPI's state."""
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _signal_mix AS
+        WITH state_totals AS (
+            SELECT state, COUNT(DISTINCT npi_id) AS total_provs
+            FROM map_providers
+            GROUP BY state
+        ),
+        proc_prevalence AS (
+            SELECT
+                m.state,
+                p.hcpcs_code,
+                COUNT(DISTINCT p.npi_id) AS n_provs
+            FROM agg_provider_procedure p
+            JOIN map_providers m ON m.npi_id = p.npi_id
+            WHERE p.total_claims >= 5
+            GROUP BY m.state, p.hcpcs_code
+        )
+        SELECT
+            p.npi_id,
+            COUNT(DISTINCT p.hcpcs_code) AS total_procs,
+            COUNT(DISTINCT CASE
+                WHEN pp.n_provs * 1.0 / st.total_provs < 0.02 THEN p.hcpcs_code
+            END) AS rare_procs,
+            LIST(pp.n_provs * 1.0 / st.total_provs ORDER BY p.hcpcs_code) AS prevalences
+        FROM agg_provider_procedure p
+        JOIN map_providers m ON m.npi_id = p.npi_id
+        JOIN proc_prevalence pp ON pp.state = m.state AND pp.hcpcs_code = p.hcpcs_code
+        JOIN state_totals st ON st.state = m.state
+        WHERE p.total_claims >= 5
+        GROUP BY p.npi_id, m.state
+        HAVING COUNT(DISTINCT p.hcpcs_code) >= 3
+    """)
+
+
+def build_fraud_signals(con):
+    """Build fraud_signals from the three signal queries."""
+    print("Building fraud_signals...")
+    t0 = time.time()
+    for signal in (billing_10x, yoy_growth, unusual_mix):
+        t = time.time()
+        signal(con)
+        print(f"  {signal.__name__}: {time.time() - t:.1f}s")
+
+    con.execute(f"""
+        CREATE OR REPLACE TABLE fraud_signals AS
+        WITH signals AS (
+            SELECT
+                npi_id,
+                COALESCE(b.procs_10x, 0) AS procs_10x,
+                COALESCE(b.max_ratio, 0) AS max_ratio,
+                COALESCE(b.outlier_spend, 0) AS outlier_spend,
+                COALESCE(g.max_yoy, 0) AS max_yoy,
+                COALESCE(g.years_3x, 0) AS years_3x,
+                COALESCE(x.total_procs, 0) AS total_procs,
+                COALESCE(x.rare_procs, 0) AS rare_procs,
+                COALESCE(b.ratios, []) AS ratios,
+                COALESCE(b.ratio_paid, []) AS ratio_paid,
+                COALESCE(x.prevalences, []) AS prevalences
+            FROM _signal_billing b
+            FULL JOIN _signal_growth g USING (npi_id)
+            FULL JOIN _signal_mix x USING (npi_id)
+        ),
+        scored AS (
+            SELECT
+                *,
+                LEAST(procs_10x * 20, 100) AS score_billing_10x,
+                CASE WHEN max_yoy > 1 THEN LEAST((max_yoy - 1) * 10, 100) ELSE 0 END AS score_yoy_growth,
+                CASE WHEN total_procs > 0 THEN LEAST(rare_procs / total_procs * 200, 100) ELSE 0 END
+                    AS score_unusual_mix
+            FROM signals
+        ),
+        composite AS (
+            SELECT
+                *,
+                (score_billing_10x > 0)::INT + (score_yoy_growth > 0)::INT + (score_unusual_mix > 0)::INT
+                    AS signals_active,
+                score_billing_10x * {WEIGHTS["billing_10x"]}::DOUBLE
+                    + score_yoy_growth * {WEIGHTS["yoy_growth"]}::DOUBLE
+                    + score_unusual_mix * {WEIGHTS["unusual_mix"]}::DOUBLE AS composite_score
+            FROM scored
+        ),
+        flagged AS (
+            SELECT
+                *,
+                signals_active >= {MIN_SIGNALS} AND composite_score >= {MIN_COMPOSITE} AS flagged
+            FROM composite
+        )
+        SELECT
+            CASE WHEN f.flagged
+                THEN ROW_NUMBER() OVER (PARTITION BY f.flagged ORDER BY f.composite_score DESC, d.npi)
+            END AS pos,
+            d.npi,
+            m.name,
+            m.state,
+            m.city,
+            m.total_paid,
+            m.total_claims,
+            f.*
+        FROM flagged f
+        JOIN dim_npi d ON d.npi_id = f.npi_id
+        LEFT JOIN map_providers m ON m.npi_id = f.npi_id
+        ORDER BY f.flagged DESC, f.composite_score DESC, d.npi
+    """)
+    for name in ("_signal_billing", "_signal_growth", "_signal_mix"):
+        con.execute(f"DROP TABLE {name}")
+
+    count, flagged = con.execute("SELECT COUNT(*), COUNT(pos) FROM fraud_signals").fetchone()
+    print(f"  ✓ fraud_signals: {count:,} providers with a signal, {flagged:,} flagged "
+          f"in {time.time() - t0:.1f}s")
+
+
+def main():
+    con = duckdb.connect(DB_PATH)
+    report = run_report.RunReport("06_fraud_signals")
+    with report.step(con, "fraud_signals",
+                     inputs=["agg_provider_procedure", "agg_provider_monthly", "map_providers", "dim_npi"],
+                     outputs=["fraud_signals"]):
+        build_fraud_signals(con)
+    con.close()
+    report.write()
+    print("\nFraud signals built!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Build the provider search index behind the API's name/NPI autocomplete.
+
+Two tables, loaded into memory by backend/app/search.py:
+
+  provider_search    one row per map_providers NPI, ranked by total_paid
+                     (`pos`, 1 = highest spend), with the display columns
+                     and the lower-cased name that queries are matched on
+  provider_ngrams    every 2- and 3-character substring of those names
+                     (none containing a space) with the sorted list of
+                     `pos` values whose name contains it
+
+Since postings hold spend ranks in ascending order, a search walks its
+candidates highest-spend first and can stop after one page of matches.
+"""
+import duckdb
+import os
+import time
+
+import run_report
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+
+
+def build_provider_search(con):
+    """provider_search and provider_ngrams from map_providers."""
+    print("\nBuilding provider search index...")
+    t0 = time.time()
+
+    con.execute("""
+        CREATE OR REPLACE TABLE provider_search AS
+        SELECT
+            ROW_NUMBER() OVER (ORDER BY total_paid DESC NULLS LAST, npi)::INTEGER AS pos,
+            npi,
+            name,
+            state,
+            city,
+            total_paid,
+            total_claims,
+            lower(COALESCE(name, '')) AS search_name
+        FROM map_providers
+        ORDER BY pos
+    """)
+    con.execute("""
+        CREATE OR REPLACE TABLE provider_ngrams AS
+        WITH grams AS (
+            SELECT DISTINCT
+                pos,
+                unnest(
+                    list_transform(range(1, length(search_name)), i -> substr(search_name, i::INTEGER, 2))
+                    || list_transform(range(1, length(search_name) - 1), i -> substr(search_name, i::INTEGER, 3))
+                ) AS gram
+            FROM provider_search
+        )
+        SELECT gram, list(pos ORDER BY pos) AS positions
+        FROM grams
+        WHERE NOT contains(gram, ' ')
+        GROUP BY gram
+        ORDER BY gram
+    """)
+
+    providers = con.execute("SELECT COUNT(*) FROM provider_search").fetchone()[0]
+    grams, postings = con.execute(
+        "SELECT COUNT(*), COALESCE(SUM(len(positions)), 0) FROM provider_ngrams"
+    ).fetchone()
+    print(f"  ✓ provider_search: {providers:,} providers, {grams:,} n-grams, "
+          f"{postings:,} postings in {time.time() - t0:.1f}s")
+
+
+def main():
+    con = duckdb.connect(DB_PATH)
+    report = run_report.RunReport("07_search_index")
+    with report.step(con, "provider_search", inputs=["map_providers"],
+                     outputs=["provider_search", "provider_ngrams"]):
+        build_provider_search(con)
+    con.close()
+    report.write()
+    print("\nSearch index built!")
+
+
+if __name__ == "__main__":
+    main()
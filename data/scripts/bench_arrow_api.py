@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Benchmark the response shapes of the list endpoints.
+
+Calls the API in-process (no server, response cache off) with each Accept
+header formats.py answers: row JSON (the default), columnar JSON
+(application/vnd.medicaid.columns+json) and an Arrow IPC stream
+(application/vnd.apache.arrow.stream). Reports per endpoint the median
+wall and CPU time per request and the body size:
+
+  map providers      /api/map/providers at its default limit (5,000), at
+                     50,000, and re-aggregated over a year of months
+  map by procedure   /api/map/providers/procedure/{code} for the top code
+  state series       /api/stats/timeseries/state, all states
+
+The columnar and Arrow bodies are checked to carry the same rows as the
+JSON. Needs a database that has been through the pipeline.
+
+    python bench_arrow_api.py --repeat 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import duckdb
+import pyarrow as pa
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, "..", "..", "backend")
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+COLUMNS_JSON = "application/vnd.medicaid.columns+json"
+# Label -> Accept header of each shape; JSON first, the others are compared to it
+SHAPES = {"JSON": "application/json", "columns": COLUMNS_JSON, "Arrow": ARROW_STREAM}
+
+
+def endpoints(con):
+    """(label, path, query string) of each benchmarked request."""
+    code = con.execute("SELECT hcpcs_code FROM agg_procedure_summary ORDER BY total_paid DESC LIMIT 1").fetchone()[0]
+    last = con.execute("SELECT MAX(month) FROM agg_state_monthly").fetchone()[0]
+    first = f"{int(last[:4]) - 1}{last[4:]}"
+    return [
+        ("map providers", "/api/map/providers", ""),
+        ("map providers 50K", "/api/map/providers", "limit=50000"),
+        ("map providers, 12 months", "/api/map/providers", f"month_from={first}&month_to={last}"),
+        ("map by procedure", f"/api/map/providers/procedure/{code}", ""),
+        ("state series", "/api/stats/timeseries/state", ""),
+    ]
+
+
+async def get(app, path, query, accept):
+    """(status, headers, body) of a GET through the ASGI app."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": query.encode(),
+        "headers": [(b"host", b"bench"), (b"accept", accept.encode())],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    pending = [{"type": "http.request", "body": b"", "more_body": False}]
+    response = {"headers": {}, "body": b""}
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await asyncio.Event().wait()  # the client never hangs up
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode().lower(): v.decode() for k, v in message["headers"]}
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+async def measure(app, path, query, accept, repeat):
+    """(median wall ms, median CPU ms, content type, body) over repeat requests, after a warm-up."""
+    status, headers, body = await get(app, path, query, accept)
+    if status != 200:
+        raise RuntimeError(f"{path}?{query}: HTTP {status} {body[:200]!r}")
+    walls, cpus = [], []
+    for _ in range(repeat):
+        w0, c0 = time.perf_counter(), time.process_time()
+        _, _, body = await get(app, path, query, accept)
+        walls.append(time.perf_counter() - w0)
+        cpus.append(time.process_time() - c0)
+    return statistics.median(walls) * 1000, statistics.median(cpus) * 1000, headers["content-type"], body
+
+
+def decode(media_type, body):
+    """Rows of a response body, as dicts."""
+    if media_type == ARROW_STREAM:
+        return pa.ipc.open_stream(body).read_all().to_pylist()
+    if media_type == COLUMNS_JSON:
+        payload = json.loads(body)
+        data = [payload["data"][name] for name in payload["columns"]]
+        return [dict(zip(payload["columns"], row)) for row in zip(*data)]
+    return json.loads(body)
+
+
+async def run(app, requests, repeat):
+    print(f"{'endpoint':26} {'rows':>7}" + "".join(
+        f"  {label + ' ms':>10} {'CPU':>7} {'KB':>6}" for label in SHAPES
+    ))
+    for label, path, query in requests:
+        line, rows = "", None
+        for accept in SHAPES.values():
+            wall, cpu, media_type, body = await measure(app, path, query, accept, repeat)
+            if not media_type.startswith(accept):
+                raise RuntimeError(f"{path}: got {media_type} for {accept}")
+            decoded = decode(accept, body)
+            if rows is None:
+                rows = decoded
+            elif decoded != rows:
+                raise RuntimeError(f"{path}?{query}: {accept} rows differ from JSON")
+            line += f"  {wall:>10.1f} {cpu:>7.1f} {len(body) / 1024:>6,.0f}"
+        print(f"{label:26} {len(rows):>7,}{line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="requests per endpoint and format; the median is reported")
+    args = parser.parse_args()
+
+    # The app reads these at import: same database, nothing served from the cache
+    os.environ["DUCKDB_PATH"] = DB_PATH
+    os.environ["CACHE_MAX_BYTES"] = "0"
+    sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+    from app.main import app
+
+    con = duckdb.connect(DB_PATH, read_only=True)
+    requests = endpoints(con)
+    con.close()
+    asyncio.run(run(app, requests, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
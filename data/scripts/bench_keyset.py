@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Benchmark offset against cursor (keyset) paging on the ranked lists.
+
+Calls the API in-process (no server, response cache off) for one page at
+several depths of each list, once with `offset` and once with the cursor
+the previous page sent, and reports the median time per request:
+
+  top providers        /api/providers/top, by total_paid and by per_claim
+  procedure providers  /api/procedures/{code}/providers for the top code
+  provider procedures  /api/providers/{npi}/procedures for the provider
+                       billing the most codes
+  top procedures       /api/procedures/top
+
+Each cursor page is checked against its offset page. Needs a database
+that has been through the pipeline.
+
+    python bench_keyset.py --limit 25 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import duckdb
+
+from bench_arrow_api import get
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, "..", "..", "backend")
+# Page positions benchmarked, as shares of the list
+DEPTHS = [0.0, 0.1, 0.5, 0.9]
+
+
+def lists(con):
+    """(label, path, query string, rows in the list) of each benchmarked list."""
+    code, code_providers = con.execute("""
+        SELECT hcpcs_code, COUNT(*) FROM agg_provider_procedure
+        GROUP BY 1 ORDER BY SUM(total_paid) DESC LIMIT 1
+    """).fetchone()
+    npi, npi_codes = con.execute("""
+        SELECT d.npi, COUNT(*) FROM agg_provider_procedure p JOIN dim_npi d USING (npi_id)
+        GROUP BY 1 ORDER BY 2 DESC LIMIT 1
+    """).fetchone()
+    providers = con.execute("SELECT COUNT(*) FROM map_providers").fetchone()[0]
+    procedures = con.execute("SELECT COUNT(*) FROM hcpcs_codes").fetchone()[0]
+    return [
+        ("top providers", "/api/providers/top", "sort_by=total_paid", providers),
+        ("top providers $/claim", "/api/providers/top", "sort_by=per_claim", providers),
+        ("procedure providers", f"/api/procedures/{code}/providers", "sort_by=total_paid", code_providers),
+        ("provider procedures", f"/api/providers/{npi}/procedures", "sort_by=total_paid", npi_codes),
+        ("top procedures", "/api/procedures/top", "sort_by=total_paid", procedures),
+    ]
+
+
+async def timed(app, path, query, repeat):
+    """(median ms, headers, body) of a GET, after a warm-up."""
+    times = []
+    for _ in range(repeat + 1):
+        t0 = time.perf_counter()
+        status, headers, body = await get(app, path, query, "application/json")
+        times.append(time.perf_counter() - t0)
+        if status != 200:
+            raise RuntimeError(f"{path}?{query}: HTTP {status} {body[:200]!r}")
+    return statistics.median(times[1:]) * 1000, headers, body
+
+
+async def run(app, targets, limit, repeat):
+    print(f"{'list':24} {'rows':>9} {'depth':>6} {'offset':>9}  {'offset ms':>9} {'cursor ms':>9} {'speedup':>7}")
+    for label, path, query, rows in targets:
+        for depth in DEPTHS:
+            offset = int(rows * depth) // limit * limit
+            by_offset, _, expected = await timed(app, path, f"{query}&limit={limit}&offset={offset}", repeat)
+            if offset:
+                # The cursor the page before this one sends
+                _, headers, _ = await get(app, path, f"{query}&limit={limit}&offset={offset - limit}", "application/json")
+                cursor = headers["x-next-cursor"]
+                by_cursor, _, body = await timed(app, path, f"{query}&limit={limit}&cursor={cursor}", repeat)
+                if json.loads(body) != json.loads(expected):
+                    raise RuntimeError(f"{path}?{query}: cursor page at {offset:,} differs from offset page")
+            else:
+                by_cursor = by_offset
+            print(f"{label:24} {rows:>9,} {depth:>6.0%} {offset:>9,}  {by_offset:>9.1f} {by_cursor:>9.1f} "
+                  f"{by_offset / by_cursor:>6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=25, help="page size")
+    parser.add_argument("--repeat", type=int, default=5, help="requests per page; the median is reported")
+    args = parser.parse_args()
+
+    # The app reads these at import: same database, nothing served from the cache
+    os.environ["DUCKDB_PATH"] = DB_PATH
+    os.environ["CACHE_MAX_BYTES"] = "0"
+    sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+    from app.main import app
+
+    con = duckdb.connect(DB_PATH, read_only=True)
+    targets = lists(con)
+    con.close()
+    asyncio.run(run(app, targets, args.limit, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
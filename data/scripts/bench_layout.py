@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""Pick each aggregate table's physical layout by timing the API's queries.
+
+For every table in table_layout, builds candidate copies in a scratch
+database: unsorted or sorted by each candidate key, each with and without
+the table's ART indexes. Then times the router queries that read the table
+against every copy. Unsorted copies are shuffled, which is the order the
+hash aggregates and joins in 01/02 write in.
+
+Queries run once per sampled NPI, procedure code or state, --repeat times
+each, and the median counts. A candidate's score is the geometric mean of
+its slowdown against the fastest copy on each query, so 1.00 means fastest
+everywhere and a full scan doesn't drown out the point lookups. The lowest
+score wins, except that a smaller file within --tolerance of it wins
+instead.
+
+The picks go to table_layout.LAYOUT_PATH along with every measurement.
+01_build_aggregates.py and 02_geocode.py use them on their next full build.
+Needs a database that has been through 01-03.
+
+    python bench_layout.py --repeat 5
+    python bench_layout.py --tables agg_provider_procedure,map_providers --dry-run
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+
+import duckdb
+
+import table_layout
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+SCRATCH = "bench_layout"
+SCRATCH_PATH = DB_PATH + ".bench_layout.duckdb"
+
+# Sort keys tried besides table_layout.SORTED (None = unsorted)
+ALTERNATIVE_KEYS = {
+    "agg_provider_monthly": ["month, npi_id"],
+    "agg_provider_procedure": ["npi_id, total_paid DESC"],
+    "map_providers": ["npi_id", "total_paid DESC"],
+}
+
+# Router queries per table: (name, SQL, parameter sample). {t} is the copy
+# under test; every other table is read from the main database.
+QUERIES = {
+    "agg_provider_summary": [
+        ("overview", """
+            SELECT SUM(total_paid), SUM(total_claims), SUM(total_beneficiaries),
+                   COUNT(*), MIN(first_month), MAX(last_month)
+            FROM {t}
+        """, "none"),
+    ],
+    "agg_provider_monthly": [
+        ("provider timeseries", """
+            SELECT month, total_beneficiaries, total_claims, total_paid
+            FROM {t}
+            WHERE npi_id = ?
+            ORDER BY month
+        """, "npi_id"),
+        ("map, month range", """
+            SELECT p.npi, p.name, p.state, p.city, p.lat, p.lng,
+                   SUM(m.total_paid) AS total_paid, SUM(m.total_claims), SUM(m.total_beneficiaries)
+            FROM map_providers p
+            JOIN {t} m ON m.npi_id = p.npi_id
+            WHERE p.lat IS NOT NULL AND p.lng IS NOT NULL
+              AND m.month >= ? AND m.month <= ? AND p.state = ?
+            GROUP BY p.npi, p.name, p.state, p.city, p.lat, p.lng
+            ORDER BY total_paid DESC
+            LIMIT 5000
+        """, "months_state"),
+        ("fraud-risk: yoy growth", """
+            WITH yearly AS (
+                SELECT npi_id, SUBSTRING(month, 1, 4) AS year, SUM(total_paid) AS annual_paid
+                FROM {t}
+                GROUP BY npi_id, SUBSTRING(month, 1, 4)
+            )
+            SELECT y2.npi_id, MAX(y2.annual_paid / NULLIF(y1.annual_paid, 0))
+            FROM yearly y2
+            JOIN yearly y1 ON y1.npi_id = y2.npi_id
+                AND CAST(y1.year AS INT) = CAST(y2.year AS INT) - 1
+            WHERE y1.annual_paid > 10000 AND y2.annual_paid > 50000
+            GROUP BY y2.npi_id
+        """, "none"),
+    ],
+    "agg_provider_procedure": [
+        ("provider procedures", """
+            SELECT p.hcpcs_code, COALESCE(NULLIF(h.short_description, ''), p.hcpcs_code),
+                   p.total_beneficiaries, p.total_claims, p.total_paid
+            FROM {t} p
+            LEFT JOIN hcpcs_codes h ON h.hcpcs_code = p.hcpcs_code
+            WHERE p.npi_id = ?
+            ORDER BY p.total_paid DESC, p.hcpcs_code
+            LIMIT 20
+        """, "npi_id"),
+        ("procedure providers", """
+            SELECT d.npi, COALESCE(m.name, d.npi), m.state, m.city,
+                   p.total_beneficiaries, p.total_claims, p.total_paid
+            FROM {t} p
+            JOIN dim_npi d ON d.npi_id = p.npi_id
+            LEFT JOIN map_providers m ON m.npi_id = p.npi_id
+            WHERE p.hcpcs_code = ?
+            ORDER BY p.total_paid DESC, p.npi_id
+            LIMIT 25
+        """, "code"),
+        ("map, procedure providers", """
+            SELECT m.npi, m.name, m.state, m.city, m.lat, m.lng,
+                   p.total_paid, p.total_claims, p.total_beneficiaries
+            FROM {t} p
+            JOIN map_providers m ON m.npi_id = p.npi_id
+            WHERE p.hcpcs_code = ? AND m.lat IS NOT NULL AND m.lng IS NOT NULL
+            ORDER BY p.total_paid DESC
+            LIMIT 2000
+        """, "code"),
+        ("procedure national avg", """
+            SELECT SUM(total_paid) / NULLIF(SUM(total_claims), 0)
+            FROM {t}
+            WHERE hcpcs_code = ? AND total_claims > 0
+        """, "code"),
+        ("procedure benchmarks", """
+            SELECT hcpcs_code, SUM(total_paid) / NULLIF(SUM(total_claims), 0)
+            FROM {t}
+            WHERE hcpcs_code IN (?, ?, ?, ?, ?)
+            GROUP BY hcpcs_code
+        """, "codes"),
+        ("top procedures, state", """
+            SELECT p.hcpcs_code, COUNT(DISTINCT p.npi_id), SUM(p.total_paid) AS total_paid
+            FROM {t} p
+            JOIN map_providers m ON m.npi_id = p.npi_id
+            WHERE m.state = ?
+            GROUP BY p.hcpcs_code
+            ORDER BY total_paid DESC, p.hcpcs_code
+            LIMIT 25
+        """, "state"),
+    ],
+    "agg_procedure_summary": [
+        ("top procedures", """
+            SELECT h.hcpcs_code, h.short_description, h.unique_providers, h.total_paid, a.total_claims
+            FROM hcpcs_codes h
+            LEFT JOIN {t} a ON a.hcpcs_code = h.hcpcs_code
+            ORDER BY h.total_paid DESC NULLS LAST, h.hcpcs_code
+            LIMIT 25
+        """, "none"),
+        ("procedure detail", """
+            SELECT h.hcpcs_code, h.short_description, h.unique_providers, h.total_paid,
+                   a.total_claims, a.total_beneficiaries
+            FROM hcpcs_codes h
+            LEFT JOIN {t} a ON a.hcpcs_code = h.hcpcs_code
+            WHERE h.hcpcs_code = ?
+        """, "code"),
+    ],
+    "agg_procedure_monthly": [
+        ("procedure timeseries", """
+            SELECT month, total_beneficiaries, total_claims, total_paid
+            FROM {t}
+            WHERE hcpcs_code = ?
+            ORDER BY month
+        """, "code"),
+        ("procedure detail, month range", """
+            SELECT SUM(total_paid), SUM(total_claims), SUM(total_beneficiaries)
+            FROM {t}
+            WHERE hcpcs_code = ? AND month >= ? AND month <= ?
+        """, "code_months"),
+    ],
+    "agg_state_monthly": [
+        ("state timeseries", """
+            SELECT state, month, unique_providers, total_beneficiaries, total_claims, total_paid
+            FROM {t}
+            WHERE state = ?
+            ORDER BY month
+        """, "state"),
+        ("overview, state and months", """
+            SELECT SUM(total_paid), SUM(total_claims), SUM(total_beneficiaries), MIN(month), MAX(month)
+            FROM {t}
+            WHERE state = ? AND month >= ? AND month <= ?
+        """, "state_months"),
+        ("all states", """
+            SELECT state, month, unique_providers, total_beneficiaries, total_claims, total_paid
+            FROM {t}
+            ORDER BY state, month
+        """, "none"),
+    ],
+    "map_providers": [
+        ("provider detail", """
+            SELECT npi, name, state, city, zip, lat, lng, total_paid, total_claims,
+                   total_beneficiaries, unique_procedures, first_month, last_month
+            FROM {t}
+            WHERE npi = ?
+        """, "npi"),
+        ("map", """
+            SELECT npi, name, state, city, lat, lng, total_paid, total_claims, total_beneficiaries
+            FROM {t}
+            WHERE lat IS NOT NULL AND lng IS NOT NULL
+            ORDER BY total_paid DESC
+            LIMIT 5000
+        """, "none"),
+        ("map, state", """
+            SELECT npi, name, state, city, lat, lng, total_paid, total_claims, total_beneficiaries
+            FROM {t}
+            WHERE lat IS NOT NULL AND lng IS NOT NULL AND state = ?
+            ORDER BY total_paid DESC
+            LIMIT 5000
+        """, "state"),
+        ("top providers, state", """
+            SELECT npi, name, state, city, total_paid, total_claims, total_beneficiaries
+            FROM {t}
+            WHERE state = ?
+            ORDER BY total_paid DESC, npi
+            LIMIT 25
+        """, "state"),
+        ("map, procedure providers", """
+            SELECT m.npi, m.name, m.state, m.city, m.lat, m.lng,
+                   p.total_paid, p.total_claims, p.total_beneficiaries
+            FROM agg_provider_procedure p
+            JOIN {t} m ON m.npi_id = p.npi_id
+            WHERE p.hcpcs_code = ? AND m.lat IS NOT NULL AND m.lng IS NOT NULL
+            ORDER BY p.total_paid DESC
+            LIMIT 2000
+        """, "code"),
+        ("fraud-risk enrichment", """
+            SELECT npi_id, npi, name, state, city, total_paid, total_claims
+            FROM {t}
+            WHERE npi_id IN (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, "npi_ids"),
+    ],
+}
+
+
+def sample(con, table, key, n):
+    """n keys of table: the n/2 with the most spending, the rest pseudo-random."""
+    return [r[0] for r in con.execute(f"""
+        (SELECT {key} FROM {table} ORDER BY total_paid DESC, {key} LIMIT {n // 2})
+        UNION
+        (SELECT {key} FROM {table} ORDER BY hash({key}) LIMIT {n - n // 2})
+        ORDER BY 1
+    """).fetchall()]
+
+
+def chunks(values, size):
+    """values in groups of exactly size (the last one padded by wrapping)."""
+    return [
+        [values[(i + j) % len(values)] for j in range(size)]
+        for i in range(0, len(values), size)
+    ]
+
+
+def sample_params(con, n):
+    """Parameter lists for each kind of query, sampled from the main tables."""
+    npi_ids = sample(con, "agg_provider_summary", "npi_id", n)
+    npis = [r[0] for r in con.execute(
+        f"SELECT npi FROM dim_npi WHERE npi_id IN ({', '.join(map(str, npi_ids))})"
+    ).fetchall()]
+    codes = sample(con, "agg_procedure_summary", "hcpcs_code", n)
+    states = [r[0] for r in con.execute(f"""
+        SELECT state FROM map_providers WHERE state IS NOT NULL
+        GROUP BY state ORDER BY hash(state) LIMIT {n}
+    """).fetchall()]
+    # The last year of data, as a typical time-bar selection
+    last = con.execute("SELECT MAX(month) FROM agg_national_monthly").fetchone()[0]
+    year, month = map(int, last.split("-"))
+    first = f"{year - 1:04d}-{month:02d}" if month == 12 else f"{year - 1:04d}-{month + 1:02d}"
+    return {
+        "none": [[]],
+        "npi_id": [[i] for i in npi_ids],
+        "npi": [[npi] for npi in npis],
+        "npi_ids": chunks(npi_ids, 10),
+        "code": [[c] for c in codes],
+        "codes": chunks(codes, 5),
+        "code_months": [[c, first, last] for c in codes],
+        "state": [[s] for s in states],
+        "state_months": [[s, first, last] for s in states],
+        "months_state": [[first, last, s] for s in states],
+    }
+
+
+def candidates(table):
+    """(order_by, indexes) pairs to try for table."""
+    keys = [None, table_layout.SORTED[table]] + ALTERNATIVE_KEYS.get(table, [])
+    return [(key, indexes) for key in keys for indexes in ({}, table_layout.INDEXED[table])]
+
+
+def label(order_by, indexes):
+    sort = f"sorted by {order_by}" if order_by else "unsorted"
+    return f"{sort} + indexes" if indexes else sort
+
+
+def build_candidate(con, table, order_by, indexes, path):
+    """Copy table into a fresh scratch database; returns (build seconds, bytes)."""
+    if os.path.exists(path):
+        os.remove(path)
+    con.execute(f"ATTACH '{path}' AS {SCRATCH}")
+    t0 = time.time()
+    con.execute(f"""
+        CREATE TABLE {SCRATCH}.{table} AS
+        SELECT * FROM main.{table}
+        ORDER BY {order_by or "hash(rowid)"}
+    """)
+    table_layout.create_indexes(con, f"{SCRATCH}.{table}", indexes)
+    con.execute(f"CHECKPOINT {SCRATCH}")
+    elapsed = time.time() - t0
+    return elapsed, os.path.getsize(path)
+
+
+def time_queries(con, table, params, repeat):
+    """{query name: seconds}, summed over the sampled parameters."""
+    timings = {}
+    for name, sql, kind in QUERIES[table]:
+        sql = sql.format(t=f"{SCRATCH}.{table}")
+        total = 0.0
+        for args in params[kind]:
+            con.execute(sql, args).fetchall()  # warm the buffer pool
+            times = []
+            for _ in range(repeat):
+                t0 = time.time()
+                con.execute(sql, args).fetchall()
+                times.append(time.time() - t0)
+            total += statistics.median(times)
+        timings[name] = total
+    return timings
+
+
+def bench_table(con, table, params, repeat, path):
+    """Measure every candidate layout of table; returns their result dicts."""
+    results = []
+    for order_by, indexes in candidates(table):
+        try:
+            build_s, size = build_candidate(con, table, order_by, indexes, path)
+            queries = time_queries(con, table, params, repeat)
+        finally:
+            con.execute(f"DETACH DATABASE IF EXISTS {SCRATCH}")
+        results.append({
+            "order_by": order_by,
+            "indexes": indexes,
+            "build_s": round(build_s, 3),
+            "size_mb": round(size / 1e6, 2),
+            "queries": {name: round(s, 5) for name, s in queries.items()},
+        })
+    best = {
+        name: max(min(r["queries"][name] for r in results), 1e-6)
+        for name in results[0]["queries"]
+    }
+    for r in results:
+        slowdowns = [max(r["queries"][name], 1e-6) / best[name] for name in best]
+        r["score"] = round(math.exp(sum(map(math.log, slowdowns)) / len(slowdowns)), 3)
+    return results
+
+
+def pick(results, tolerance):
+    """Lowest score; a smaller file within tolerance of it beats it."""
+    best = min(r["score"] for r in results)
+    close = [r for r in results if r["score"] <= best * (1 + tolerance)]
+    return min(close, key=lambda r: (r["size_mb"], r["score"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", help="comma-separated tables to benchmark (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query; the median is used")
+    parser.add_argument("--samples", type=int, default=20, help="NPIs, codes and states to query")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="take a smaller layout if its score is within this fraction of the best")
+    parser.add_argument("--dry-run", action="store_true",
+                        help=f"print the results without writing {table_layout.LAYOUT_PATH}")
+    args = parser.parse_args()
+
+    tables = args.tables.split(",") if args.tables else list(QUERIES)
+    unknown = set(tables) - set(QUERIES)
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(sorted(unknown))}")
+
+    con = duckdb.connect(DB_PATH)
+    print(f"Connected to {DB_PATH}")
+    params = sample_params(con, args.samples)
+
+    layouts = table_layout.chosen()
+    try:
+        for table in tables:
+            rows = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            print(f"\n{'='*60}\n{table} ({rows:,} rows)")
+            results = bench_table(con, table, params, args.repeat, SCRATCH_PATH)
+            winner = pick(results, args.tolerance)
+            print(f"  {'':<50} {'build':>7} {'size':>9} {'queries':>8} {'score':>6}")
+            for r in results:
+                mark = "✓" if r is winner else " "
+                print(f"  {mark} {label(r['order_by'], r['indexes']):<48} {r['build_s']:6.2f}s "
+                      f"{r['size_mb']:6.1f} MB {sum(r['queries'].values()):7.3f}s {r['score']:6.2f}")
+            layouts[table] = {
+                "order_by": winner["order_by"],
+                "indexes": winner["indexes"],
+                "rows": rows,
+                "candidates": results,
+            }
+    finally:
+        con.close()
+        for path in (SCRATCH_PATH, SCRATCH_PATH + ".wal"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    print(f"\n{'='*60}")
+    for table in tables:
+        print(f"  {table:<32} {label(layouts[table]['order_by'], layouts[table]['indexes'])}")
+    if args.dry_run:
+        return
+    with open(table_layout.LAYOUT_PATH, "w") as f:
+        json.dump({
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "db_path": DB_PATH,
+            "repeat": args.repeat,
+            "samples": args.samples,
+            "tolerance": args.tolerance,
+            "tables": layouts,
+        }, f, indent=2)
+    print(f"\n✓ Layouts written to {table_layout.LAYOUT_PATH}")
+    print("  Rebuild (01_build_aggregates.py, then 02_geocode.py) to apply them.")
+
+
+if __name__ == "__main__":
+    main()
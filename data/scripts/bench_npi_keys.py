@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Benchmark integer npi_id keys against the old VARCHAR npi keys.
+
+Rebuilds the provider tables the way they were before dim_npi (keyed on the
+10-digit NPI string) in a scratch schema, then times the same queries
+against both layouts:
+
+  state build    agg_state_monthly from agg_provider_procedure_monthly
+  fraud-risk     the three signal queries behind /api/analysis/fraud-risk
+  indexes        ART index builds on the provider key columns
+
+Also reports the in-memory size of each key column. Needs a database that
+has been through 01 and 02.
+
+    python bench_npi_keys.py --repeat 5
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import time
+
+import duckdb
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+SCHEMA = "bench_varchar"
+
+_spec = importlib.util.spec_from_file_location(
+    "pipeline_build_aggregates", os.path.join(SCRIPTS_DIR, "01_build_aggregates.py"))
+aggregates = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(aggregates)
+
+# Tables rebuilt with a VARCHAR npi column in place of npi_id
+KEYED_TABLES = [
+    "agg_provider_procedure_monthly",
+    "agg_provider_procedure",
+    "agg_provider_monthly",
+    "map_providers",
+]
+
+# {s} is the schema, {k} the provider key column; {states} joins key -> state
+STATE_BUILD = """
+    SELECT
+        n.practice_state AS state,
+        s.month,
+        COUNT(DISTINCT s.{k}) AS unique_providers,
+        SUM(s.total_beneficiaries) AS total_beneficiaries,
+        SUM(s.total_claims) AS total_claims,
+        SUM(s.total_paid) AS total_paid
+    FROM {s}.agg_provider_procedure_monthly s
+    JOIN ({states}) n ON n.{k} = s.{k}
+    GROUP BY n.practice_state, s.month
+"""
+
+FRAUD_SIGNALS = {
+    "fraud-risk: billing 10x": """
+        WITH state_avgs AS (
+            SELECT m.state, p.hcpcs_code,
+                   SUM(p.total_paid) / NULLIF(SUM(p.total_claims), 0) AS state_avg
+            FROM {s}.agg_provider_procedure p
+            JOIN {s}.map_providers m ON m.{k} = p.{k}
+            WHERE p.total_claims >= 10
+            GROUP BY m.state, p.hcpcs_code
+            HAVING COUNT(DISTINCT p.{k}) >= 5
+        ),
+        ratios AS (
+            SELECT p.{k}, p.hcpcs_code,
+                   (p.total_paid / NULLIF(p.total_claims, 0)) / NULLIF(sa.state_avg, 0) AS ratio,
+                   p.total_paid
+            FROM {s}.agg_provider_procedure p
+            JOIN {s}.map_providers m ON m.{k} = p.{k}
+            JOIN state_avgs sa ON sa.state = m.state AND sa.hcpcs_code = p.hcpcs_code
+            WHERE p.total_claims >= 10 AND sa.state_avg > 0
+        )
+        SELECT {k}, COUNT(CASE WHEN ratio >= 10 THEN 1 END), MAX(ratio),
+               SUM(CASE WHEN ratio >= 10 THEN total_paid ELSE 0 END)
+        FROM ratios
+        GROUP BY {k}
+    """,
+    "fraud-risk: yoy growth": """
+        WITH yearly AS (
+            SELECT {k}, SUBSTRING(month, 1, 4) AS year, SUM(total_paid) AS annual_paid
+            FROM {s}.agg_provider_monthly
+            GROUP BY {k}, SUBSTRING(month, 1, 4)
+        ),
+        yoy AS (
+            SELECT y2.{k}, y2.annual_paid / NULLIF(y1.annual_paid, 0) AS growth
+            FROM yearly y2
+            JOIN yearly y1 ON y1.{k} = y2.{k}
+                AND CAST(y1.year AS INT) = CAST(y2.year AS INT) - 1
+            WHERE y1.annual_paid > 10000 AND y2.annual_paid > 50000
+        )
+        SELECT {k}, MAX(growth), COUNT(CASE WHEN growth >= 3 THEN 1 END)
+        FROM yoy
+        GROUP BY {k}
+    """,
+    "fraud-risk: unusual mix": """
+        WITH state_totals AS (
+            SELECT state, COUNT(DISTINCT {k}) AS total_provs
+            FROM {s}.map_providers
+            GROUP BY state
+        ),
+        proc_prevalence AS (
+            SELECT m.state, p.hcpcs_code, COUNT(DISTINCT p.{k}) AS n_provs
+            FROM {s}.agg_provider_procedure p
+            JOIN {s}.map_providers m ON m.{k} = p.{k}
+            WHERE p.total_claims >= 5
+            GROUP BY m.state, p.hcpcs_code
+        )
+        SELECT p.{k}, COUNT(DISTINCT p.hcpcs_code),
+               COUNT(DISTINCT CASE
+                   WHEN pp.n_provs * 1.0 / st.total_provs < 0.02 THEN p.hcpcs_code
+               END)
+        FROM {s}.agg_provider_procedure p
+        JOIN {s}.map_providers m ON m.{k} = p.{k}
+        JOIN proc_prevalence pp ON pp.state = m.state AND pp.hcpcs_code = p.hcpcs_code
+        JOIN state_totals st ON st.state = m.state
+        WHERE p.total_claims >= 5
+        GROUP BY p.{k}, m.state
+        HAVING COUNT(DISTINCT p.hcpcs_code) >= 3
+    """,
+}
+
+
+def build_varchar_tables(con):
+    """Copy the provider tables into SCHEMA with the NPI string as the key."""
+    con.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    con.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table in KEYED_TABLES:
+        columns = [
+            r[0] for r in con.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = 'main' AND table_name = ? ORDER BY ordinal_position",
+                [table],
+            ).fetchall()
+            if r[0] not in ("npi_id", "npi")
+        ]
+        order = " ORDER BY npi, hcpcs_code, month" if table == "agg_provider_procedure_monthly" else ""
+        con.execute(f"""
+            CREATE TABLE {SCHEMA}.{table} AS
+            SELECT d.npi, {", ".join("t." + c for c in columns)}
+            FROM main.{table} t
+            LEFT JOIN dim_npi d ON d.npi_id = t.npi_id
+            {order}
+        """)
+        print(f"  ✓ {SCHEMA}.{table}")
+
+
+def median_time(con, sql, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        con.execute(sql).fetchall()
+        times.append(time.time() - t0)
+    return statistics.median(times)
+
+
+def key_bytes(con, schema, table, key):
+    return con.execute(f"SELECT {key} FROM {schema}.{table}").arrow().nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query; the median is reported")
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCHEMA} schema afterwards")
+    args = parser.parse_args()
+
+    con = duckdb.connect(DB_PATH)
+    print(f"Connected to {DB_PATH}")
+    print(f"\nBuilding VARCHAR-keyed copies in {SCHEMA}...")
+    build_varchar_tables(con)
+
+    queries = {
+        "state build": (
+            STATE_BUILD.format(s=SCHEMA, k="npi", states="SELECT CAST(npi AS VARCHAR) AS npi, practice_state FROM nppes"),
+            STATE_BUILD.format(s="main", k="npi_id", states=aggregates.NPI_STATES),
+        ),
+    }
+    for name, sql in FRAUD_SIGNALS.items():
+        queries[name] = (sql.format(s=SCHEMA, k="npi"), sql.format(s="main", k="npi_id"))
+
+    results = []
+    for name, (before_sql, after_sql) in queries.items():
+        before = median_time(con, before_sql, args.repeat)
+        after = median_time(con, after_sql, args.repeat)
+        results.append((name, before, after))
+
+    for table in ("agg_provider_procedure", "map_providers"):
+        name = f"index {table}"
+        timings = []
+        for schema, key in ((SCHEMA, "npi"), ("main", "npi_id")):
+            con.execute(f"DROP INDEX IF EXISTS {schema}.bench_idx")
+            t0 = time.time()
+            con.execute(f"CREATE INDEX bench_idx ON {schema}.{table}({key})")
+            timings.append(time.time() - t0)
+            con.execute(f"DROP INDEX {schema}.bench_idx")
+        results.append((name, *timings))
+
+    print(f"\n{'='*60}")
+    print(f"  {'':<28} {'VARCHAR':>9} {'INTEGER':>9}")
+    for name, before, after in results:
+        print(f"  {name:<28} {before:8.2f}s {after:8.2f}s ({before / max(after, 1e-9):.1f}x)")
+
+    print("\n  Key column size in memory:")
+    for table in KEYED_TABLES:
+        before = key_bytes(con, SCHEMA, table, "npi")
+        after = key_bytes(con, "main", table, "npi_id")
+        print(f"  {table:<32} {before / 1e6:8.1f} MB -> {after / 1e6:6.1f} MB")
+
+    if not args.keep:
+        con.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""Generate a synthetic Medicaid spending dataset for benchmarks.
+
+Writes everything 00-05 read, so the pipeline and the API run on a laptop
+with no network and no real data:
+
+  spending       month-partitioned Parquet in 00's layout (or the raw CSV
+                 with --csv, which 00 then converts) plus the spending view
+  nppes          one row per billing and servicing NPI
+  zip_centroids  from a generated gazetteer file in the Census format
+  UPDATED.csv    an LEIE-format exclusion list; 05 loads it into
+                 oig_exclusions (it needs dim_npi and map_providers first)
+  HCPC_ANWEB.txt descriptions of every code in CMS's fixed-width HCPCS
+                 layout, for 03
+
+Shapes follow DATA-SUMMARY.md, scaled by --rows / 227,083,361: ~617K billing
+NPIs at full scale, 10,881 HCPCS codes, 84 months (2018-01 to 2024-12),
+~4.2% blank servicing NPIs, ~0.004% negative payments, beneficiaries >= 11
+with a Pareto tail, ~1.66 claims per beneficiary and log-normal per-code
+prices. Billing volume per NPI and code popularity are heavy-tailed; ZIPs
+fall in each state's real ZIP3 range, and ~2% of practice ZIPs aren't
+ZCTAs. NPIs carry valid Luhn check digits.
+
+Every value is a hash of (row, column, --seed), so output is identical
+across runs and thread counts. Everything lands in --out with its own
+database; the script prints the environment to point 00-05 at it:
+
+    python gen_synthetic.py --rows 10M
+    python gen_synthetic.py --rows 227M --out /Volumes/scratch/synthetic
+"""
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import time
+
+import duckdb
+
+import run_report
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = "/Users/charl/Programming/medicaid/data"
+OUT_DIR = os.path.join(DATA_DIR, "synthetic")
+
+# Full-size dataset, from DATA-SUMMARY.md
+FULL_ROWS = 227_083_361
+FULL_BILLING_NPIS = 617_503
+HCPCS_CODES = 10_881
+MONTHS = 84
+BLANK_SERVICING = 0.042
+NEGATIVE_PAID = 9_239 / FULL_ROWS
+LEIE_ROWS = 82_000
+
+
+def _load(filename):
+    spec = importlib.util.spec_from_file_location(
+        "pipeline_" + os.path.splitext(filename)[0].lstrip("0123456789_"),
+        os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ingest = _load("00_ingest_spending.py")
+geocode = _load("02_geocode.py")
+
+REPORT = run_report.RunReport("gen_synthetic")
+
+# state: (ZIP3 low, ZIP3 high, centre lat, centre lng, spread in degrees, weight)
+# Weights are populations in millions, standing in for provider counts.
+STATES = {
+    "AL": (350, 369, 32.8, -86.8, 2.0, 5.1), "AK": (995, 999, 61.4, -150.0, 4.0, 0.7),
+    "AZ": (850, 865, 34.2, -111.7, 2.5, 7.4), "AR": (716, 729, 34.9, -92.4, 1.8, 3.0),
+    "CA": (900, 961, 36.8, -119.7, 4.0, 39.0), "CO": (800, 816, 39.0, -105.5, 2.2, 5.8),
+    "CT": (60, 69, 41.6, -72.7, 0.6, 3.6), "DE": (197, 199, 39.0, -75.5, 0.5, 1.0),
+    "DC": (200, 205, 38.9, -77.0, 0.1, 0.7), "FL": (320, 349, 28.6, -82.4, 3.0, 22.0),
+    "GA": (300, 319, 32.7, -83.4, 2.0, 11.0), "HI": (967, 968, 20.8, -156.3, 1.5, 1.4),
+    "ID": (832, 838, 44.4, -114.6, 2.5, 1.9), "IL": (600, 629, 40.0, -89.2, 2.5, 12.5),
+    "IN": (460, 479, 39.9, -86.3, 1.8, 6.8), "IA": (500, 528, 42.0, -93.5, 2.0, 3.2),
+    "KS": (660, 679, 38.5, -98.4, 2.5, 2.9), "KY": (400, 427, 37.5, -85.3, 2.0, 4.5),
+    "LA": (700, 714, 31.0, -92.0, 1.8, 4.6), "ME": (39, 49, 45.3, -69.2, 1.5, 1.4),
+    "MD": (206, 219, 39.0, -76.8, 1.0, 6.2), "MA": (10, 27, 42.3, -71.8, 0.8, 7.0),
+    "MI": (480, 499, 43.3, -84.5, 2.5, 10.0), "MN": (550, 567, 46.3, -94.3, 2.5, 5.7),
+    "MS": (386, 397, 32.7, -89.7, 1.8, 2.9), "MO": (630, 658, 38.4, -92.5, 2.2, 6.2),
+    "MT": (590, 599, 47.0, -109.6, 3.5, 1.1), "NE": (680, 693, 41.5, -99.8, 2.5, 2.0),
+    "NV": (889, 898, 39.3, -116.6, 3.0, 3.2), "NH": (30, 38, 43.7, -71.6, 0.8, 1.4),
+    "NJ": (70, 89, 40.2, -74.7, 0.8, 9.3), "NM": (870, 884, 34.4, -106.1, 2.5, 2.1),
+    "NY": (100, 149, 42.9, -75.5, 2.5, 19.6), "NC": (270, 289, 35.5, -79.4, 2.5, 10.7),
+    "ND": (580, 588, 47.5, -100.5, 2.5, 0.8), "OH": (430, 459, 40.3, -82.8, 2.0, 11.8),
+    "OK": (730, 749, 35.6, -97.5, 2.5, 4.0), "OR": (970, 979, 43.9, -120.6, 2.5, 4.2),
+    "PA": (150, 196, 40.9, -77.8, 2.5, 13.0), "RI": (28, 29, 41.7, -71.5, 0.3, 1.1),
+    "SC": (290, 299, 33.9, -80.9, 1.5, 5.3), "SD": (570, 577, 44.4, -100.2, 2.5, 0.9),
+    "TN": (370, 385, 35.9, -86.4, 2.5, 7.1), "TX": (750, 799, 31.5, -99.3, 4.5, 30.0),
+    "UT": (840, 847, 39.3, -111.7, 2.0, 3.4), "VT": (50, 59, 44.1, -72.7, 0.8, 0.6),
+    "VA": (220, 246, 37.5, -78.8, 2.5, 8.7), "WA": (980, 994, 47.4, -120.5, 2.5, 7.8),
+    "WV": (247, 268, 38.6, -80.6, 1.5, 1.8), "WI": (530, 549, 44.6, -89.9, 2.0, 5.9),
+    "WY": (820, 831, 43.0, -107.5, 2.5, 0.6), "PR": (6, 9, 18.2, -66.5, 0.5, 3.2),
+}
+# Share of each ZIP3's 100 ZIP5s that are ZCTAs (~33K nationally)
+ZCTA_SHARE = 0.37
+
+CITIES = ["SPRINGFIELD", "FRANKLIN", "GREENVILLE", "CLINTON", "MADISON", "GEORGETOWN",
+          "SALEM", "FAIRVIEW", "RIVERSIDE", "BRISTOL", "CLAYTON", "DAYTON", "MARION",
+          "ASHLAND", "JACKSON", "OXFORD", "BURLINGTON", "MILTON", "CHESTER", "LEXINGTON",
+          "MANCHESTER", "NEWPORT", "WINCHESTER", "AUBURN", "DOVER", "HUDSON", "KINGSTON",
+          "LEBANON", "MOUNT VERNON", "CENTERVILLE"]
+LAST_NAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS",
+              "RODRIGUEZ", "MARTINEZ", "HERNANDEZ", "LOPEZ", "GONZALEZ", "WILSON", "ANDERSON",
+              "THOMAS", "TAYLOR", "MOORE", "JACKSON", "MARTIN", "LEE", "PEREZ", "THOMPSON",
+              "WHITE", "HARRIS", "SANCHEZ", "CLARK", "RAMIREZ", "LEWIS", "ROBINSON", "PATEL", "NGUYEN"]
+FIRST_NAMES = ["JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA",
+               "DAVID", "ELIZABETH", "WILLIAM", "BARBARA", "RICHARD", "SUSAN", "JOSEPH", "JESSICA",
+               "THOMAS", "SARAH", "CHRISTOPHER", "KAREN", "MARIA", "DANIEL", "NANCY", "MATTHEW",
+               "LISA", "ANTHONY", "BETTY", "MARK", "SANDRA", "PRIYA", "WEI", "AHMED"]
+ORG_SUFFIXES = ["HOME HEALTH LLC", "MEDICAL GROUP", "PEDIATRICS PA", "BEHAVIORAL HEALTH INC",
+                "DENTAL CARE", "FAMILY PRACTICE", "COMMUNITY CLINIC", "PHARMACY INC",
+                "TRANSPORTATION LLC", "THERAPY SERVICES"]
+CREDENTIALS = ["MD", "DO", "NP", "PA-C", "LCSW", "DDS", "PHD", "RN", "LPC"]
+TAXONOMIES = ["207Q00000X", "208000000X", "207R00000X", "363L00000X", "251E00000X",
+              "261QF0400X", "103T00000X", "1223G0001X", "333600000X", "343900000X",
+              "225100000X", "101YM0800X"]
+EXCLUSION_TYPES = ["1128a1", "1128a1", "1128a2", "1128a3", "1128a4", "1128b4", "1128b4",
+                   "1128b4", "1128b5", "1128b7", "1128b8", "1128b14"]
+HCPCS_LETTERS = "ABEGHJKLQSTV"
+PROCEDURE_SERVICES = ["Office visit", "Home health aide visit", "Injection", "Therapeutic exercise",
+                      "Non-emergency transport", "Behavioral health assessment", "Psychotherapy",
+                      "Dental cleaning", "Laboratory panel", "Medical supply kit", "Personal care services",
+                      "Physical therapy evaluation", "Durable medical equipment rental", "Vaccine administration"]
+PROCEDURE_QUALIFIERS = ["established patient", "new patient", "per 15 minutes", "per diem",
+                        "each additional hour", "group session", "per mile", "with interpretation",
+                        "under direct supervision", "pediatric"]
+PROCEDURE_NOTES = ["", "", "including documentation and coordination of care with the patient's other providers",
+                   "when provided in the home or community setting by qualified personnel"]
+
+GAZETTEER_FILE = "2023_Gaz_zcta_national.txt"
+LEIE_FILE = "UPDATED.csv"
+HCPCS_FILE = "HCPC_ANWEB.txt"
+CSV_FILE = "medicaid-provider-spending.csv"
+
+
+def parse_count(text):
+    """'10M', '500K', '1e6' or '227083361' -> int."""
+    text = text.strip().upper()
+    for suffix, factor in (("K", 1_000), ("M", 1_000_000), ("B", 1_000_000_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(float(text))
+
+
+def sql_list(values):
+    return "[" + ", ".join(f"'{v}'" for v in values) + "]"
+
+
+def define_macros(con, seed):
+    """u(i, salt): a uniform [0, 1) draw keyed on (i, salt, seed); npi_of(base): Luhn NPI."""
+    con.execute(f"CREATE OR REPLACE TEMP MACRO u(i, salt) AS hash(i, salt, {seed}) / 18446744073709551616.0")
+    con.execute("""
+        CREATE OR REPLACE TEMP MACRO normal(i, salt) AS
+            sqrt(-2 * ln(greatest(u(i, salt || '_a'), 1e-12))) * cos(2 * pi() * u(i, salt || '_b'))
+    """)
+    # NPI check digit: Luhn over '80840' + the 9-digit base ('80840' contributes 24)
+    con.execute("""
+        CREATE OR REPLACE TEMP MACRO npi_of(base) AS
+            base * 10 + (10 - (24 + list_sum(list_transform(range(9), k ->
+                CASE WHEN k % 2 = 0
+                     THEN ((base // CAST(10 ** k AS BIGINT)) % 10) * 2
+                          - CASE WHEN (base // CAST(10 ** k AS BIGINT)) % 10 >= 5 THEN 9 ELSE 0 END
+                     ELSE (base // CAST(10 ** k AS BIGINT)) % 10
+                END))) % 10) % 10
+    """)
+    # Spread provider indexes over the 9-digit space (7919 is prime, so no collisions)
+    con.execute("CREATE OR REPLACE TEMP MACRO npi_for(idx) AS npi_of(100000000 + (idx * 7919 + 12345) % 200000000)")
+
+
+def build_zctas(con, out_dir):
+    """ZCTAs per state and the Census-format gazetteer file; loads zip_centroids."""
+    states = ", ".join(
+        f"('{s}', {lo}, {hi}, {lat}, {lng}, {spread})"
+        for s, (lo, hi, lat, lng, spread, _) in STATES.items()
+    )
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _zcta AS
+        WITH states(state, lo, hi, lat, lng, spread) AS (VALUES {states}),
+        candidates AS (
+            SELECT s.*, z3.range AS zip3, z3.range * 100 + k.range AS zip5
+            FROM states s, range(s.lo, s.hi + 1) z3, range(100) k
+        )
+        SELECT
+            state, zip3, zip5,
+            -- neighbouring ZIPs sit close together, as in the real numbering
+            ROUND(lat + spread * 1.2 * (u(zip5, 'lat') - 0.5), 6) AS lat,
+            ROUND(lng + spread * (1.4 * ((zip5 - lo * 100) / ((hi - lo + 1) * 100) - 0.5)
+                                  + 0.4 * (u(zip5, 'lng') - 0.5)), 6) AS lng,
+            ROW_NUMBER() OVER (PARTITION BY state ORDER BY zip5) AS rank
+        FROM candidates
+        WHERE u(zip5, 'zcta') < {ZCTA_SHARE}
+    """)
+    path = os.path.join(out_dir, GAZETTEER_FILE)
+    con.execute(f"""
+        COPY (
+            SELECT LPAD(CAST(zip5 AS VARCHAR), 5, '0') AS GEOID,
+                   CAST(1e6 + u(zip5, 'aland') * 1e8 AS BIGINT) AS ALAND,
+                   CAST(u(zip5, 'awater') * 1e6 AS BIGINT) AS AWATER,
+                   ROUND(ALAND / 2589988.11, 3) AS ALAND_SQMI,
+                   ROUND(AWATER / 2589988.11, 3) AS AWATER_SQMI,
+                   lat AS INTPTLAT,
+                   lng AS INTPTLONG
+            FROM _zcta ORDER BY zip5
+        ) TO '{path}' (HEADER, DELIMITER '\t')
+    """)
+    geocode.load_zip_centroids(con, path)
+    return path
+
+
+def build_providers(con, billing, servicing):
+    """_providers: NPIs 0..billing-1 bill, the rest only appear as servicing NPIs."""
+    weights = [w for *_, w in STATES.values()]
+    total = sum(weights)
+    # 1000 buckets of state names, each state getting its weight's share
+    buckets, acc = [], 0.0
+    for state, w in zip(STATES, weights):
+        acc += w / total
+        while len(buckets) < round(acc * 1000):
+            buckets.append(state)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _providers AS
+        SELECT
+            idx,
+            CAST(npi_for(idx) AS VARCHAR) AS npi,
+            idx < {billing} AND u(idx, 'org') < 0.45 AS is_org,
+            {sql_list(buckets)}[1 + CAST(floor(u(idx, 'state') * {len(buckets)}) AS INTEGER)] AS state
+        FROM range({billing + servicing}) t(idx)
+    """)
+
+
+def build_nppes(con, billing):
+    """nppes with the columns 01, 02 and the providers API read."""
+    con.execute("DROP TABLE IF EXISTS nppes")
+    con.execute(f"""
+        CREATE TABLE nppes AS
+        WITH counts AS (SELECT state, COUNT(*) AS n FROM _zcta GROUP BY state),
+        located AS (
+            SELECT p.*,
+                   1 + CAST(floor(u(p.idx, 'zip') * c.n) AS INTEGER) AS zip_rank,
+                   1 + CAST(floor(u(p.idx, 'mail') * c.n) AS INTEGER) AS mail_rank,
+                   u(p.idx, 'pobox') < 0.03 AS po_box
+            FROM _providers p JOIN counts c USING (state)
+            -- a few billing NPIs have since been deactivated and left NPPES
+            WHERE p.idx >= {billing} OR u(p.idx, 'deactivated') >= 0.005
+        )
+        SELECT
+            CAST(l.npi AS BIGINT) AS npi,
+            CASE WHEN l.is_org
+                 THEN {sql_list(LAST_NAMES)}[1 + l.idx % {len(LAST_NAMES)}] || ' '
+                      || {sql_list(ORG_SUFFIXES)}[1 + CAST(floor(u(l.idx, 'suffix') * {len(ORG_SUFFIXES)}) AS INTEGER)]
+            END AS org_name,
+            CASE WHEN NOT l.is_org
+                 THEN {sql_list(FIRST_NAMES)}[1 + CAST(floor(u(l.idx, 'first') * {len(FIRST_NAMES)}) AS INTEGER)]
+            END AS first_name,
+            CASE WHEN NOT l.is_org
+                 THEN {sql_list(LAST_NAMES)}[1 + CAST(floor(u(l.idx, 'last') * {len(LAST_NAMES)}) AS INTEGER)]
+            END AS last_name,
+            CASE WHEN NOT l.is_org
+                 THEN {sql_list(CREDENTIALS)}[1 + CAST(floor(u(l.idx, 'cred') * {len(CREDENTIALS)}) AS INTEGER)]
+            END AS credentials,
+            {sql_list(TAXONOMIES)}[1 + CAST(floor(u(l.idx, 'taxonomy') * {len(TAXONOMIES)}) AS INTEGER)] AS taxonomy_1,
+            CAST(100 + CAST(floor(u(l.idx, 'street') * 9900) AS INTEGER) AS VARCHAR) || ' MAIN ST' AS practice_address_1,
+            {sql_list(CITIES)}[1 + CAST(hash(z.zip3, 'city') % {len(CITIES)} AS INTEGER)] AS practice_city,
+            l.state AS practice_state,
+            CASE
+                WHEN u(l.idx, 'nozip') < 0.005 THEN NULL
+                -- PO box style ZIPs: in the state's range but mostly not ZCTAs
+                WHEN l.po_box THEN LPAD(CAST(z.zip3 * 100 + 99 - z.zip5 % 100 AS VARCHAR), 5, '0')
+                WHEN u(l.idx, 'zip4') < 0.6
+                    THEN LPAD(CAST(z.zip5 AS VARCHAR), 5, '0')
+                         || LPAD(CAST(CAST(floor(u(l.idx, 'plus4') * 10000) AS INTEGER) AS VARCHAR), 4, '0')
+                ELSE LPAD(CAST(z.zip5 AS VARCHAR), 5, '0')
+            END AS practice_zip,
+            CASE
+                WHEN u(l.idx, 'mailzip') < 0.05 THEN NULL
+                WHEN u(l.idx, 'mailzip') < 0.15 THEN LPAD(CAST(m.zip5 AS VARCHAR), 5, '0')
+                ELSE LPAD(CAST(z.zip5 AS VARCHAR), 5, '0')
+            END AS mailing_zip,
+            CAST(2000000000 + CAST(floor(u(l.idx, 'phone') * 7999999999) AS BIGINT) AS VARCHAR) AS practice_phone,
+            DATE '2005-05-23' + CAST(floor(u(l.idx, 'enumerated') * 6800) AS INTEGER) AS enumeration_date,
+            CASE WHEN NOT l.is_org THEN CASE WHEN u(l.idx, 'sex') < 0.6 THEN 'F' ELSE 'M' END END AS sex
+        FROM located l
+        JOIN _zcta z ON z.state = l.state AND z.rank = l.zip_rank
+        JOIN _zcta m ON m.state = l.state AND m.rank = l.mail_rank
+        ORDER BY npi
+    """)
+    return con.execute("SELECT COUNT(*) FROM nppes").fetchone()[0]
+
+
+def code_sql(idx):
+    """HCPCS code of code index idx: CPT-style numeric codes, then letter + 4 digits for level II."""
+    return f"""
+        CASE WHEN {idx} < {HCPCS_CODES * 6 // 10}
+             THEN CAST(10000 + ({idx} * 37) % 90000 AS VARCHAR)
+             ELSE {sql_list(HCPCS_LETTERS)}[1 + {idx} % {len(HCPCS_LETTERS)}]
+                  || LPAD(CAST({idx} // {len(HCPCS_LETTERS)} AS VARCHAR), 4, '0')
+        END"""
+
+
+def spending_sql(rows, billing, servicing):
+    """SELECT producing the raw spending columns plus claim_year."""
+    months = sql_list(f"{2018 + m // 12}-{m % 12 + 1:02d}" for m in range(MONTHS))
+    return f"""
+        WITH codes AS (
+            SELECT idx,
+                   {code_sql("idx")} AS code,
+                   -- per-claim price is log-normal per code (median ~$33)
+                   exp(3.5 + 1.1 * normal(idx, 'price')) AS price
+            FROM range({HCPCS_CODES}) t(idx)
+        ),
+        draws AS (
+            SELECT
+                i,
+                -- heavy-tailed volume: a few billing NPIs get most rows
+                LEAST(CAST(floor({billing} * pow(u(i, 'billing'), 3)) AS BIGINT), {billing - 1}) AS b,
+                u(i, 'servicing') AS us,
+                u(i, 'mix') AS um,
+                u(i, 'code') AS uc,
+                11 + CAST(floor(30 * (pow(greatest(u(i, 'bene'), 1e-9), -0.6) - 1)) AS BIGINT) AS bene
+            FROM range({rows}) t(i)
+        ),
+        keyed AS (
+            SELECT
+                d.*,
+                -- half the rows use globally popular codes, half the provider's own niche
+                CASE WHEN um < 0.5
+                     THEN CAST(floor({HCPCS_CODES} * pow(uc, 4)) AS BIGINT)
+                     ELSE (hash(b, 'specialty', 0) % {HCPCS_CODES} + CAST(floor(40 * uc) AS BIGINT)) % {HCPCS_CODES}
+                END AS c,
+                {billing} + (b * 31 + CAST(floor(20 * u(i, 'servicing_pick')) AS BIGINT)) % {servicing} AS s
+            FROM draws d
+        )
+        SELECT
+            bp.npi AS BILLING_PROVIDER_NPI_NUM,
+            CASE WHEN k.us < {BLANK_SERVICING} THEN NULL
+                 WHEN k.us < 0.45 THEN bp.npi
+                 ELSE sp.npi
+            END AS SERVICING_PROVIDER_NPI_NUM,
+            c.code AS HCPCS_CODE,
+            -- volume grows linearly to 1.5x over the seven years (inverse CDF)
+            {months}[1 + LEAST(CAST(floor({MONTHS} * 2 * (sqrt(1 + 1.25 * u(k.i, 'month')) - 1)) AS INTEGER),
+                               {MONTHS - 1})] AS CLAIM_FROM_MONTH,
+            k.bene AS TOTAL_UNIQUE_BENEFICIARIES,
+            k.bene + CAST(floor(k.bene * 0.66 * -ln(greatest(u(k.i, 'claims'), 1e-12))) AS BIGINT) AS TOTAL_CLAIMS,
+            ROUND(
+                (k.bene + floor(k.bene * 0.66 * -ln(greatest(u(k.i, 'claims'), 1e-12))))
+                * c.price * exp(0.8 * (u(k.i, 'paid') - 0.5))
+                -- recoupments and refunds
+                * CASE WHEN u(k.i, 'negative') < {NEGATIVE_PAID} THEN -0.2 ELSE 1 END,
+            2) AS TOTAL_PAID
+        FROM keyed k
+        JOIN _providers bp ON bp.idx = k.b
+        JOIN _providers sp ON sp.idx = k.s
+        JOIN codes c ON c.idx = k.c
+    """
+
+
+def write_spending(con, rows, billing, servicing, out_dir, as_csv, seed):
+    """Write spending as 00's Parquet layout (or its raw CSV) and create the view."""
+    select = spending_sql(rows, billing, servicing)
+    preserve = con.execute("SELECT current_setting('preserve_insertion_order')").fetchone()[0]
+    con.execute("SET preserve_insertion_order = false")
+    try:
+        if as_csv:
+            csv_path = os.path.join(out_dir, CSV_FILE)
+            con.execute(f"COPY ({select}) TO '{csv_path}' (HEADER)")
+            print(f"  ✓ {csv_path} ({os.path.getsize(csv_path) / 1e9:.2f} GB)")
+            ingest.ingest(con, csv_path, os.path.join(out_dir, "spending"), force=True)
+            return
+
+        parquet_dir = os.path.join(out_dir, "spending")
+        staging = parquet_dir + ".staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        con.execute(f"""
+            COPY (
+                SELECT *, CAST(SUBSTR(CLAIM_FROM_MONTH, 1, 4) AS INTEGER) AS claim_year
+                FROM ({select})
+            ) TO '{staging}' (
+                FORMAT parquet,
+                COMPRESSION zstd,
+                PARTITION_BY (claim_year, CLAIM_FROM_MONTH)
+            )
+        """)
+    finally:
+        con.execute(f"SET preserve_insertion_order = {preserve}")
+
+    months = dict(con.execute(f"""
+        SELECT CLAIM_FROM_MONTH, COUNT(*)
+        FROM read_parquet('{staging}/**/*.parquet', hive_partitioning = true,
+                          hive_types = {{'CLAIM_FROM_MONTH': VARCHAR}})
+        GROUP BY 1 ORDER BY 1
+    """).fetchall())
+    # No source fingerprint: 00 leaves the view alone unless SPENDING_CSV exists
+    with open(ingest.manifest_path(staging), "w") as f:
+        json.dump({
+            "source": "synthetic",
+            "source_fingerprint": None,
+            "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "generator": {"rows": rows, "seed": seed, "billing_npis": billing,
+                          "servicing_npis": servicing, "hcpcs_codes": HCPCS_CODES},
+            "months": months,
+        }, f, indent=2)
+    shutil.rmtree(parquet_dir, ignore_errors=True)
+    os.rename(staging, parquet_dir)
+    ingest.create_view(con, parquet_dir)
+
+
+def write_leie(con, out_dir, billing, servicing, exclusions):
+    """LEIE-format exclusion list: ~11% with NPIs, a few of those billing Medicaid."""
+    path = os.path.join(out_dir, LEIE_FILE)
+    first_outside = billing + servicing
+    con.execute(f"""
+        COPY (
+            SELECT
+                CASE WHEN NOT is_org THEN {sql_list(LAST_NAMES)}[1 + CAST(floor(u(i, 'leie_last') * {len(LAST_NAMES)}) AS INTEGER)] ELSE '' END AS LASTNAME,
+                CASE WHEN NOT is_org THEN {sql_list(FIRST_NAMES)}[1 + CAST(floor(u(i, 'leie_first') * {len(FIRST_NAMES)}) AS INTEGER)] ELSE '' END AS FIRSTNAME,
+                '' AS MIDNAME,
+                CASE WHEN is_org THEN {sql_list(LAST_NAMES)}[1 + CAST(floor(u(i, 'leie_bus') * {len(LAST_NAMES)}) AS INTEGER)] || ' '
+                                      || {sql_list(ORG_SUFFIXES)}[1 + CAST(floor(u(i, 'leie_suffix') * {len(ORG_SUFFIXES)}) AS INTEGER)]
+                     ELSE '' END AS BUSNAME,
+                CASE WHEN is_org THEN 'BUSINESS' ELSE 'IND- LIC HC SERV PRO' END AS GENERAL,
+                CASE WHEN is_org THEN 'HOME HEALTH AGENCY' ELSE 'NURSING PROFESSION' END AS SPECIALTY,
+                '' AS UPIN,
+                CASE
+                    WHEN u(i, 'leie_npi') >= 0.11 THEN '0000000000'
+                    -- excluded NPIs still in the spending data
+                    WHEN u(i, 'leie_match') < 0.08
+                        THEN CAST(npi_for(CAST(floor(u(i, 'leie_billing') * {billing}) AS BIGINT)) AS VARCHAR)
+                    ELSE CAST(npi_for({first_outside} + i) AS VARCHAR)
+                END AS NPI,
+                strftime(DATE '1940-01-01' + CAST(floor(u(i, 'dob') * 20000) AS INTEGER), '%Y%m%d') AS DOB,
+                CAST(100 + CAST(floor(u(i, 'leie_street') * 9900) AS INTEGER) AS VARCHAR) || ' MAIN ST' AS ADDRESS,
+                {sql_list(CITIES)}[1 + CAST(floor(u(i, 'leie_city') * {len(CITIES)}) AS INTEGER)] AS CITY,
+                {sql_list(list(STATES))}[1 + CAST(floor(u(i, 'leie_state') * {len(STATES)}) AS INTEGER)] AS STATE,
+                LPAD(CAST(CAST(floor(u(i, 'leie_zip') * 99999) AS INTEGER) AS VARCHAR), 5, '0') AS ZIP,
+                {sql_list(EXCLUSION_TYPES)}[1 + CAST(floor(u(i, 'excltype') * {len(EXCLUSION_TYPES)}) AS INTEGER)] AS EXCLTYPE,
+                strftime(DATE '1990-01-01' + CAST(floor(u(i, 'excldate') * 12700) AS INTEGER), '%Y%m%d') AS EXCLDATE,
+                CASE WHEN u(i, 'reinstated') < 0.03
+                     THEN strftime(DATE '2010-01-01' + CAST(floor(u(i, 'reindate') * 5400) AS INTEGER), '%Y%m%d')
+                     ELSE '00000000' END AS REINDATE,
+                '00000000' AS WAIVERDATE,
+                '' AS WVRSTATE
+            FROM (SELECT range AS i, u(range, 'leie_org') < 0.2 AS is_org FROM range({exclusions}))
+        ) TO '{path}' (HEADER)
+    """)
+    return path
+
+
+def write_hcpcs(con, out_dir):
+    """HCPCS reference file in the CMS fixed-width layout (03_hcpcs.FIXED_WIDTH).
+
+    Long descriptions over 80 characters continue on records with id 4.
+    """
+    path = os.path.join(out_dir, HCPCS_FILE)
+
+    def pick(values, salt):
+        values = [v.replace("'", "''") for v in values]
+        return f"{sql_list(values)}[1 + CAST(floor(u(idx, '{salt}') * {len(values)}) AS INTEGER)]"
+
+    con.execute(f"""
+        COPY (
+            WITH codes AS (
+                SELECT
+                    {code_sql("idx")} AS code,
+                    {pick(PROCEDURE_SERVICES, 'hcpcs_service')} AS service,
+                    {pick(PROCEDURE_QUALIFIERS, 'hcpcs_qualifier')} AS qualifier,
+                    {pick(PROCEDURE_NOTES, 'hcpcs_note')} AS note
+                FROM range({HCPCS_CODES}) t(idx)
+            ),
+            described AS (
+                SELECT code,
+                       left(service || ' ' || qualifier, 28) AS short,
+                       -- the long description wrapped at word boundaries
+                       regexp_extract_all(
+                           service || ', ' || qualifier || CASE WHEN note <> '' THEN ', ' || note ELSE '' END,
+                           '(.{{1,80}})(?:\\s|$)', 1
+                       ) AS lines
+                FROM codes
+            )
+            SELECT
+                rpad(code, 5, ' ')
+                || lpad(CAST(k * 100 AS VARCHAR), 5, '0')
+                || CASE WHEN k = 1 THEN '3' ELSE '4' END
+                || rpad(lines[k], 80, ' ')
+                || rpad(CASE WHEN k = 1 THEN short ELSE '' END, 28, ' ') AS line
+            FROM described, range(1, len(lines) + 1) t(k)
+            ORDER BY code, k
+        ) TO '{path}' (HEADER false, QUOTE '', DELIMITER '\x01')
+    """)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10M", help="spending rows, e.g. 1M, 50M, 227M (default: 10M)")
+    parser.add_argument("--npis", help=f"billing NPIs (default: {FULL_BILLING_NPIS:,} scaled by --rows)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=OUT_DIR, help="output directory, including the database")
+    parser.add_argument("--csv", action="store_true",
+                        help="write the raw spending CSV and convert it with 00, instead of Parquet directly")
+    parser.add_argument("--memory-limit", default=os.environ.get("DUCKDB_MEMORY_LIMIT"),
+                        help="DuckDB memory_limit, e.g. 4GB")
+    args = parser.parse_args()
+
+    rows = parse_count(args.rows)
+    scale = rows / FULL_ROWS
+    billing = parse_count(args.npis) if args.npis else max(1_000, round(FULL_BILLING_NPIS * scale))
+    # Servicing-only NPIs: individuals working under the billing organisations
+    servicing = billing
+    exclusions = max(2_000, round(LEIE_ROWS * scale))
+
+    out_dir = os.path.abspath(args.out)
+    os.makedirs(out_dir, exist_ok=True)
+    db_path = os.path.join(out_dir, "synthetic.duckdb")
+    con = duckdb.connect(db_path)
+    if args.memory_limit:
+        con.execute(f"SET memory_limit = '{args.memory_limit}'")
+    print(f"Generating {rows:,} spending rows ({scale:.2%} of full size), "
+          f"{billing:,} billing NPIs, seed {args.seed} -> {out_dir}")
+    define_macros(con, args.seed)
+
+    with REPORT.step(con, "zip_centroids", outputs=["zip_centroids", "zip_index"]):
+        gazetteer = build_zctas(con, out_dir)
+    with REPORT.step(con, "nppes", outputs=["nppes"]) as step:
+        build_providers(con, billing, servicing)
+        step.rows_out = build_nppes(con, billing)
+    print(f"  ✓ nppes: {step.rows_out:,} NPIs in {step.wall:.1f}s")
+    with REPORT.step(con, "spending") as step:
+        write_spending(con, rows, billing, servicing, out_dir, args.csv, args.seed)
+        step.rows_out = rows
+    print(f"  ✓ spending: {rows:,} rows in {step.wall:.1f}s")
+    with REPORT.step(con, "leie") as step:
+        leie = write_leie(con, out_dir, billing, servicing, exclusions)
+        step.rows_out = exclusions
+    print(f"  ✓ {leie}: {exclusions:,} exclusions")
+    with REPORT.step(con, "hcpcs") as step:
+        hcpcs = write_hcpcs(con, out_dir)
+        step.rows_out = HCPCS_CODES
+    print(f"  ✓ {hcpcs}: {HCPCS_CODES:,} codes")
+    con.close()
+    REPORT.write(os.path.join(out_dir, "reports"))
+
+    csv_path = os.path.join(out_dir, CSV_FILE)
+    print(f"\nSynthetic dataset ready. Point the pipeline and the API at it with:\n")
+    print(f"  export DUCKDB_PATH={db_path}")
+    print(f"  export SPENDING_CSV={csv_path}")
+    print(f"  export SPENDING_PARQUET_DIR={os.path.join(out_dir, 'spending')}")
+    print(f"  export GAZETTEER_TXT={gazetteer}")
+    print(f"  export OIG_CSV_FILE={leie}")
+    print(f"  export HCPCS_FILE={hcpcs}")
+    print(f"  export ARROW_PATH={os.path.join(out_dir, 'providers.arrow')}")
+    print(f"  python run_pipeline.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,401 @@
 #!/usr/bin/env python3
-"""Run the full data pipeline in order."""
-import subprocess
+"""Run the data pipeline as a dependency graph.
+
+Each step declares the tables and files it reads and writes. A step starts
+once every step producing its inputs has finished, so independent steps
+(e.g. the HCPCS setup and the ZIP centroid load) run concurrently against
+one shared DuckDB instance.
+
+A step is skipped when its inputs have the same fingerprints as at its last
+successful run and its outputs still exist. State is kept next to the
+database, so after a failure the next run picks up at the failed step.
+Remote inputs (the LEIE download) are checked with a HEAD request, so a new
+upstream file reruns the step.
+
+    python run_pipeline.py                 # run whatever is out of date
+    python run_pipeline.py --force hcpcs   # rerun one step (and what it feeds)
+    python run_pipeline.py --force         # rerun everything
+    python run_pipeline.py --dry-run       # show what would run
+
+Every run writes a JSON run report (time, CPU, rows, memory and spill per
+step) to run_report.REPORT_DIR; compare two with run_report.py.
+"""
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import re
 import sys
+import threading
 import time
-import os
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import duckdb
+
+import run_report
 
 SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
-SCRIPTS = [
-    ("01_build_aggregates.py", "Building aggregate tables (this takes a while)..."),
-    ("02_geocode.py", "Geocoding providers..."),
-    ("03_hcpcs.py", "Setting up HCPCS codes..."),
-    ("04_export_arrow.py", "Exporting Arrow file for map..."),
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+STATE_PATH = os.environ.get("PIPELINE_STATE_PATH", DB_PATH + ".pipeline.json")
+# File paths and globs a view reads, e.g. read_parquet('/data/spending/**/*.parquet')
+VIEW_FILES_RE = re.compile(r"read_\w+\(\s*'([^']+)'")
+
+
+def load_script(filename):
+    """Import a numbered pipeline script as a module."""
+    name = "pipeline_" + os.path.splitext(filename)[0].lstrip("0123456789_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ingest = load_script("00_ingest_spending.py")
+aggregates = load_script("01_build_aggregates.py")
+geocode = load_script("02_geocode.py")
+hcpcs = load_script("03_hcpcs.py")
+arrow_export = load_script("04_export_arrow.py")
+oig = load_script("05_load_oig.py")
+fraud = load_script("06_fraud_signals.py")
+search_index = load_script("07_search_index.py")
+
+
+class Step:
+    """One unit of pipeline work: fn(con) reads inputs and writes outputs.
+
+    Inputs and outputs are table/view names, or file paths (anything with a
+    path separator in it). fn may return a list of run report records for
+    its sub-tasks; they are nested under the step in the run report, and
+    their times kept in the state file and compared with the last run.
+    """
+
+    def __init__(self, name, fn, inputs, outputs, message):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.message = message
+
+
+STEPS = [
+    # The Parquet directory too: it can be regenerated without a CSV
+    # (gen_synthetic.py), and the spending view must follow it
+    Step("ingest", ingest.ingest,
+         inputs=[ingest.CSV_PATH, ingest.PARQUET_DIR],
+         outputs=["spending"],
+         message="Ingesting spending CSV to Parquet..."),
+    Step("aggregates", aggregates.build,
+         inputs=["spending", "nppes"],
+         outputs=list(aggregates.AGG_TABLES) + list(aggregates.SKETCH_TABLES) + ["dim_npi"],
+         message="Building aggregate tables (this takes a while)..."),
+    Step("zip_centroids", geocode.load_zip_centroids,
+         inputs=[geocode.GAZETTEER_TXT],
+         outputs=["zip_centroids", "zip_index"],
+         message="Loading ZIP centroids..."),
+    Step("map_providers", geocode.build_map_providers,
+         inputs=["agg_provider_summary", "dim_npi", "nppes", "zip_index"],
+         outputs=["map_providers"],
+         message="Geocoding providers..."),
+    Step("hcpcs", hcpcs.setup_hcpcs,
+         inputs=["agg_procedure_summary"] + ([os.path.abspath(hcpcs.HCPCS_FILE)] if hcpcs.HCPCS_FILE else []),
+         outputs=["hcpcs_codes"],
+         message="Setting up HCPCS codes..."),
+    Step("arrow_export", arrow_export.export_arrow,
+         inputs=["map_providers"],
+         outputs=[arrow_export.ARROW_PATH, os.path.join(arrow_export.ARROW_STATE_DIR, arrow_export.MANIFEST)],
+         message="Exporting Arrow file for map..."),
+    Step("oig", oig.load_oig,
+         inputs=["map_providers", "dim_npi", os.path.abspath(oig.CSV_FILE) if oig.CSV_FILE else oig.CSV_URL],
+         outputs=["oig_exclusions", "oig_matched", "oig_summary"],
+         message="Loading OIG exclusion list..."),
+    Step("fraud_signals", fraud.build_fraud_signals,
+         inputs=["agg_provider_procedure", "agg_provider_monthly", "map_providers", "dim_npi"],
+         outputs=["fraud_signals"],
+         message="Scoring fraud-risk signals..."),
+    Step("search_index", search_index.build_provider_search,
+         inputs=["map_providers"],
+         outputs=["provider_search", "provider_ngrams"],
+         message="Building provider search index..."),
 ]
 
 
+def is_url(resource):
+    return resource.startswith(("http://", "https://"))
+
+
+def is_file(resource):
+    return os.sep in resource and not is_url(resource)
+
+
+def producers(steps):
+    """Map each resource to the step that writes it."""
+    return {out: step.name for step in steps for out in step.outputs}
+
+
+def dependencies(step, produced_by):
+    return {produced_by[r] for r in step.inputs if r in produced_by and produced_by[r] != step.name}
+
+
+def exists(con, resource):
+    if is_file(resource):
+        return os.path.exists(resource)
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [resource]
+    ).fetchone()[0] > 0
+
+
+def files_fingerprint(paths):
+    """Hash of the size and mtime of every file under paths (files, dirs or globs)."""
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(os.path.join(d, f) for d, _, names in os.walk(path) for f in names)
+        else:
+            files.update(glob.glob(path, recursive=True))
+    if not files:
+        return None
+    h = hashlib.sha1()
+    for f in sorted(files):
+        st = os.stat(f)
+        h.update(f"{f}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return f"{len(files)}:{h.hexdigest()[:12]}"
+
+
+def url_fingerprint(url, state):
+    """ETag / Last-Modified / Content-Length of a remote file.
+
+    When the server can't be reached, the fingerprint recorded at the last
+    run is reused, so an offline run skips the step rather than failing it.
+    """
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=30) as r:
+            headers = [r.headers.get(name) for name in ("ETag", "Last-Modified", "Content-Length")]
+    except OSError as e:
+        print(f"  Can't check {url} ({e}); assuming it is unchanged")
+        recorded = [s["inputs"][url] for s in state["steps"].values() if url in s.get("inputs", {})]
+        return recorded[0] if recorded else None
+    return "|".join(h or "" for h in headers)
+
+
+def fingerprint(con, resource, state, produced_by):
+    """A string that changes whenever the resource does (None if missing).
+
+    Pipeline outputs are stamped with the run that produced them. Files and
+    directories use the size + mtime of every file in them, remote files
+    their ETag / Last-Modified. Source tables (e.g. nppes) use their schema,
+    row count and the sum of their row hashes; source views the files they
+    read.
+    """
+    if resource in produced_by:
+        return state["outputs"].get(resource) if exists(con, resource) else None
+    if is_url(resource):
+        return url_fingerprint(resource, state)
+    if is_file(resource):
+        return files_fingerprint([resource])
+    row = con.execute("""
+        SELECT sql, 'table' FROM duckdb_tables() WHERE table_name = ?
+        UNION ALL
+        SELECT sql, 'view' FROM duckdb_views() WHERE view_name = ?
+    """, [resource, resource]).fetchone()
+    if row is None:
+        return None
+    sql, kind = row
+    schema = hashlib.sha1(sql.encode()).hexdigest()[:12]
+    if kind == "view":
+        return f"{schema}:{files_fingerprint(VIEW_FILES_RE.findall(sql))}"
+    count, rows = con.execute(f'SELECT COUNT(*), SUM(hash(t)) FROM "{resource}" t').fetchone()
+    return f"{count}:{rows}:{schema}"
+
+
+def load_state():
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    return {"steps": {}, "outputs": {}}
+
+
+def save_state(state):
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, STATE_PATH)
+
+
+def up_to_date(con, step, state, produced_by):
+    last = state["steps"].get(step.name)
+    if not last or last.get("status") != "ok":
+        return False
+    if not all(exists(con, out) for out in step.outputs):
+        return False
+    current = {r: fingerprint(con, r, state, produced_by) for r in step.inputs}
+    return current == last["inputs"]
+
+
+class _StepOutput:
+    """sys.stdout replacement that prefixes each line with the printing step."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_prefix(self, prefix):
+        self.local.prefix = prefix
+        self.local.buffer = ""
+
+    def write(self, text):
+        prefix = getattr(self.local, "prefix", None)
+        if prefix is None:
+            return self.stream.write(text)
+        self.local.buffer += text
+        *lines, self.local.buffer = self.local.buffer.split("\n")
+        with self.lock:
+            for line in lines:
+                self.stream.write(f"[{prefix}] {line}\n")
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def report_timings(timings, previous):
+    """Print sub-task timings next to the last successful run's."""
+    for name, seconds in timings.items():
+        line = f"    {name:<32} {seconds:8.1f}s"
+        if name in previous:
+            saved = previous[name] - seconds
+            line += f"  (was {previous[name]:.1f}s, {'saved' if saved >= 0 else 'lost'} {abs(saved):.1f}s)"
+        print(line)
+
+
+def run_step(con, step, out, report):
+    """Run step on its own cursor as a report step; returns the report Step."""
+    out.set_prefix(step.name)
+    cursor = con.cursor()
+    try:
+        with report.step(cursor, step.name, step.inputs, step.outputs) as record:
+            substeps = step.fn(cursor)
+            if isinstance(substeps, list):
+                record.steps.extend(substeps)
+        return record
+    finally:
+        cursor.close()
+        out.set_prefix(None)
+
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", nargs="*", metavar="STEP",
+                        help="rerun these steps (all steps if none given) even if up to date")
+    parser.add_argument("--jobs", type=int, default=4, help="max steps running at once")
+    parser.add_argument("--dry-run", action="store_true", help="print what would run and exit")
+    args = parser.parse_args()
+
+    names = {s.name for s in STEPS}
+    forced = names if args.force == [] else set(args.force or [])
+    unknown = forced - names
+    if unknown:
+        parser.error(f"unknown step(s): {', '.join(sorted(unknown))}")
+
+    con = duckdb.connect(DB_PATH)
+    aggregates.configure(con, aggregates.MEMORY_LIMIT, aggregates.TEMP_DIR)
+    state = load_state()
+    produced_by = producers(STEPS)
+    deps = {s.name: dependencies(s, produced_by) for s in STEPS}
+    steps = {s.name: s for s in STEPS}
+
+    if args.dry_run:
+        will_run = set()
+        for s in STEPS:  # STEPS is in dependency order
+            after = f" (after {', '.join(sorted(deps[s.name]))})" if deps[s.name] else ""
+            if s.name in forced:
+                status = "forced"
+            elif deps[s.name] & will_run:
+                status = "upstream changes"
+            elif not up_to_date(con, s, state, produced_by):
+                status = "out of date"
+            else:
+                print(f"  {s.name:<16} up to date{after}")
+                continue
+            will_run.add(s.name)
+            print(f"  {s.name:<16} will run: {status}{after}")
+        con.close()
+        return
+
+    out = _StepOutput(sys.stdout)
+    sys.stdout = out
+    report = run_report.RunReport("run_pipeline")
     total_start = time.time()
+    pending = dict(steps)
+    finished, failed = set(), set()
 
-    for script, msg in SCRIPTS:
-        print(f"\n{'='*60}")
-        print(f"  {msg}")
-        print(f"{'='*60}")
-        path = os.path.join(SCRIPTS_DIR, script)
-        result = subprocess.run([sys.executable, path], cwd=os.path.dirname(SCRIPTS_DIR))
-        if result.returncode != 0:
-            print(f"\n✗ {script} failed with exit code {result.returncode}")
-            sys.exit(1)
+    def execute(step):
+        record = run_step(con, step, out, report)
+        return record.wall, run_report.timings(record.steps)
+
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        running = {}
+        while pending or running:
+            for name, step in list(pending.items()):
+                if deps[name] & failed:
+                    print(f"\n✗ {name} skipped: upstream step failed")
+                    failed.add(name)
+                    del pending[name]
+                    continue
+                if not deps[name] <= finished:
+                    continue
+                del pending[name]
+                if name not in forced and up_to_date(con, step, state, produced_by):
+                    print(f"  ⏭  {name}: up to date")
+                    finished.add(name)
+                    continue
+                print(f"\n{'='*60}\n  {step.message}\n{'='*60}")
+                running[pool.submit(execute, step)] = step
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                stamp = datetime.now(timezone.utc).isoformat()
+                try:
+                    elapsed, timings = future.result()
+                except Exception as e:
+                    print(f"\n✗ {step.name} failed: {e}")
+                    failed.add(step.name)
+                    state["steps"][step.name] = {"status": "failed", "finished_at": stamp}
+                else:
+                    print(f"\n  ✓ {step.name} finished in {elapsed:.1f}s")
+                    previous = state["steps"].get(step.name, {}).get("timings", {})
+                    report_timings(timings, previous)
+                    finished.add(step.name)
+                    # Stamp outputs first so downstream steps see them change
+                    for resource in step.outputs:
+                        state["outputs"][resource] = f"{step.name}@{stamp}"
+                    state["steps"][step.name] = {
+                        "status": "ok",
+                        "finished_at": stamp,
+                        "inputs": {r: fingerprint(con, r, state, produced_by) for r in step.inputs},
+                        "timings": {k: round(v, 2) for k, v in timings.items()},
+                    }
+                save_state(state)
+
+    sys.stdout = out.stream
+    con.close()
 
     total_elapsed = time.time() - total_start
+    print()
+    report.write()
     print(f"\n{'='*60}")
+    if failed:
+        print(f"  ✗ Pipeline failed: {', '.join(sorted(failed))}")
+        print(f"  Rerun to resume from the failed step(s).")
+        print(f"{'='*60}")
+        sys.exit(1)
     print(f"  Pipeline complete in {total_elapsed/60:.1f} minutes!")
     print(f"{'='*60}")
 
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""Machine-readable run reports for the pipeline scripts, and a comparer.
+
+Every pipeline script (and run_pipeline.py) records its steps in a RunReport
+and writes it as JSON under REPORT_DIR when it finishes:
+
+    reports/01_build_aggregates-20260101T120000.json
+
+Each step records:
+
+  wall_s, cpu_s    elapsed and process CPU seconds (DuckDB's worker threads
+                   run in-process, so CPU time includes them)
+  rows_in          rows scanned (DuckDB's profiler) or input table rows
+  rows_out         rows written / output table rows
+  rows_per_s       rows_in per wall second (rows_out if nothing was read)
+  peak_rss_mb      highest resident set size seen while the step ran
+  spill_bytes      largest size of DuckDB's temp_directory while it ran
+  threads          DuckDB's threads setting
+
+Steps nest: a step opened inside another lands in its "steps" list. Memory,
+spill and CPU are process-wide, so with run_pipeline.py --jobs > 1 they
+include whatever ran alongside the step.
+
+Compare two reports (or the latest two of one script) and flag steps that
+got slower, hungrier or spilled more by more than --threshold:
+
+    python run_report.py reports/run_pipeline-A.json reports/run_pipeline-B.json
+    python run_report.py 01_build_aggregates --threshold 0.1
+
+Exits 1 if anything regressed.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import duckdb
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+REPORT_DIR = os.environ.get("PIPELINE_REPORT_DIR", os.path.join(os.path.dirname(DB_PATH), "reports"))
+# Seconds between RSS / temp directory samples
+SAMPLE_INTERVAL = 0.1
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Counters DuckDB's profiler reports for each query
+_PROFILING_SETTINGS = json.dumps({"CUMULATIVE_ROWS_SCANNED": "true", "ROWS_RETURNED": "true"})
+
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+def peak_rss():
+    """The process's RSS high-water mark so far, in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def dir_bytes(path):
+    """Total size of the files directly under path (0 if it doesn't exist)."""
+    try:
+        return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+    except OSError:
+        return 0
+
+
+def table_rows(con, names):
+    """Summed row counts of the tables/views in names that exist; None if none do.
+
+    File paths (anything with a path separator) are ignored.
+    """
+    total = None
+    for name in names:
+        if os.sep in name:
+            continue
+        exists = con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [name]
+        ).fetchone()[0]
+        if exists:
+            total = (total or 0) + con.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+    return total
+
+
+class _Sampler(threading.Thread):
+    """Polls RSS and the spill directory size until stopped, keeping the peaks."""
+
+    def __init__(self, temp_dir):
+        super().__init__(daemon=True)
+        self.temp_dir = temp_dir
+        self.peak_rss = 0
+        self.peak_spill = 0
+        self.done = threading.Event()
+        self.sample()
+
+    def sample(self):
+        rss = current_rss()
+        self.peak_rss = max(self.peak_rss, rss if rss is not None else peak_rss())
+        if self.temp_dir:
+            self.peak_spill = max(self.peak_spill, dir_bytes(self.temp_dir))
+
+    def run(self):
+        while not self.done.wait(SAMPLE_INTERVAL):
+            self.sample()
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        self.sample()
+
+
+class Step:
+    """One timed step; set rows_in / rows_out on it, or run SQL through execute()."""
+
+    def __init__(self, con, name):
+        self.con = con
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+        self.steps = []
+        self.record = None
+
+    def execute(self, sql, params=None):
+        """Run sql with DuckDB's profiler on and add the rows it scanned to rows_in.
+
+        Returns the query's rows (for CREATE / INSERT, the rows written).
+        """
+        profile = os.path.join(tempfile.gettempdir(), f"duckdb-profile-{os.getpid()}-{id(self)}.json")
+        self.con.execute(f"SET custom_profiling_settings = '{_PROFILING_SETTINGS}'")
+        self.con.execute(f"SET profiling_output = '{profile}'")
+        self.con.execute("PRAGMA enable_profiling = 'json'")
+        try:
+            rows = self.con.execute(sql, params).fetchall()
+        finally:
+            self.con.execute("PRAGMA disable_profiling")
+        try:
+            with open(profile) as f:
+                scanned = json.load(f).get("cumulative_rows_scanned", 0)
+            os.remove(profile)
+        except (OSError, ValueError):
+            scanned = 0
+        self.rows_in = (self.rows_in or 0) + scanned
+        return rows
+
+    @property
+    def wall(self):
+        return self.record["wall_s"] if self.record else None
+
+
+class RunReport:
+    """The steps of one script run; step() nests per thread, write() saves JSON."""
+
+    def __init__(self, script):
+        self.script = script
+        self.started_at = datetime.now(timezone.utc)
+        self.t0 = time.time()
+        self.steps = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def step(self, con, name, inputs=(), outputs=()):
+        """Context manager timing one step run on con.
+
+        inputs / outputs are table names whose row counts become rows_in /
+        rows_out (counted outside the timed region) unless the step sets
+        them itself.
+        """
+        return _StepContext(self, con, name, inputs, outputs)
+
+    def to_dict(self):
+        return {
+            "script": self.script,
+            "started_at": self.started_at.isoformat(),
+            "wall_s": round(time.time() - self.t0, 3),
+            "argv": sys.argv[1:],
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "duckdb_version": duckdb.__version__,
+            "steps": self.steps,
+        }
+
+    def write(self, report_dir=None):
+        """Save the report as <script>-<UTC timestamp>.json and return its path."""
+        report_dir = report_dir or REPORT_DIR
+        os.makedirs(report_dir, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(report_dir, f"{self.script}-{stamp}.json")
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"  ✓ Run report: {path}")
+        return path
+
+
+class _StepContext:
+    def __init__(self, report, con, name, inputs, outputs):
+        self.report = report
+        self.step = Step(con, name)
+        self.inputs = [r for r in inputs if os.sep not in r]
+        self.outputs = [r for r in outputs if os.sep not in r]
+
+    def __enter__(self):
+        con = self.step.con
+        self.rows_in = table_rows(con, self.inputs) if self.inputs else None
+        self.threads, self.memory_limit, temp_dir = con.execute("""
+            SELECT current_setting('threads'), current_setting('memory_limit'),
+                   current_setting('temp_directory')
+        """).fetchone()
+        self.report._stack().append(self.step)
+        self.started_at = datetime.now(timezone.utc)
+        self.sampler = _Sampler(os.path.abspath(temp_dir) if temp_dir else None)
+        self.sampler.start()
+        self.cpu0 = time.process_time()
+        self.t0 = time.time()
+        return self.step
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.time() - self.t0
+        cpu = time.process_time() - self.cpu0
+        self.sampler.stop()
+        stack = self.report._stack()
+        stack.pop()
+        step = self.step
+        if exc_type is None and self.outputs and step.rows_out is None:
+            step.rows_out = table_rows(step.con, self.outputs)
+        if step.rows_in is None:
+            step.rows_in = self.rows_in
+        rows = step.rows_in or step.rows_out
+        step.record = {
+            "name": step.name,
+            "status": "ok" if exc_type is None else "failed",
+            "started_at": self.started_at.isoformat(),
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "rows_in": step.rows_in,
+            "rows_out": step.rows_out,
+            "rows_per_s": round(rows / max(wall, 1e-9)) if rows else None,
+            "peak_rss_mb": round(self.sampler.peak_rss / (1024 * 1024), 1),
+            "spill_bytes": self.sampler.peak_spill,
+            "threads": int(self.threads),
+            "memory_limit": self.memory_limit,
+        }
+        if step.steps:
+            step.record["steps"] = step.steps
+        with self.report.lock:
+            (stack[-1].steps if stack else self.report.steps).append(step.record)
+        return False
+
+
+def flatten(steps, prefix="", paths=True):
+    """(name, record) for every step depth-first; paths joins parent names with '/'."""
+    for record in steps:
+        name = prefix + record["name"] if paths else record["name"]
+        yield name, record
+        yield from flatten(record.get("steps", []), name + "/" if paths else "", paths)
+
+
+def timings(steps):
+    """{name: wall seconds} for step records and everything nested in them."""
+    return {name: r["wall_s"] for name, r in flatten(steps, paths=False)}
+
+
+# metric: (label, True if bigger is worse)
+METRICS = {
+    "wall_s": ("wall", True),
+    "cpu_s": ("cpu", True),
+    "rows_per_s": ("rows/s", False),
+    "peak_rss_mb": ("peak RSS", True),
+    "spill_bytes": ("spill", True),
+}
+
+
+def regressions(old, new, threshold, min_seconds, min_mb):
+    """Metrics of new that are worse than old by more than threshold (a fraction).
+
+    Steps shorter than min_seconds in both runs are too noisy to judge on
+    time; memory and spill changes under min_mb are ignored.
+    """
+    flagged = []
+    timed = max(old["wall_s"], new["wall_s"]) >= min_seconds
+    for metric, (label, bigger_is_worse) in METRICS.items():
+        a, b = old.get(metric), new.get(metric)
+        if a is None or b is None:
+            continue
+        if metric in ("wall_s", "cpu_s", "rows_per_s") and not timed:
+            continue
+        if metric == "peak_rss_mb" and abs(b - a) < min_mb:
+            continue
+        if metric == "spill_bytes" and abs(b - a) < min_mb * 1024 * 1024:
+            continue
+        worse = b > a * (1 + threshold) if bigger_is_worse else b * (1 + threshold) < a
+        if worse:
+            flagged.append(f"{label} {_fmt(metric, a)} -> {_fmt(metric, b)}")
+    return flagged
+
+
+def _fmt(metric, value):
+    if metric in ("wall_s", "cpu_s"):
+        return f"{value:.1f}s"
+    if metric == "rows_per_s":
+        return f"{value:,.0f}"
+    if metric == "peak_rss_mb":
+        return f"{value:,.0f} MB"
+    return f"{value / 1e6:,.0f} MB"
+
+
+def latest_reports(script, report_dir=REPORT_DIR, count=2):
+    """Paths of the newest count reports written by script, oldest first."""
+    paths = sorted(glob.glob(os.path.join(report_dir, f"{script}-*.json")))
+    if len(paths) < count:
+        raise SystemExit(f"Need {count} reports for {script} in {report_dir}, found {len(paths)}")
+    return paths[-count:]
+
+
+def compare(old_path, new_path, threshold=0.2, min_seconds=1.0, min_mb=64):
+    """Print the two reports' steps side by side; return the number of regressed steps."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_steps = dict(flatten(old["steps"]))
+    new_steps = dict(flatten(new["steps"]))
+
+    print(f"  old: {old_path} ({old['started_at']})")
+    print(f"  new: {new_path} ({new['started_at']})")
+    width = max(map(len, [*old_steps, *new_steps, "step"]))
+    print(f"\n  {'step':<{width}} {'old':>9} {'new':>9} {'change':>8}")
+    regressed = 0
+    for name, record in new_steps.items():
+        before = old_steps.get(name)
+        if before is None:
+            print(f"  {name:<{width}} {'-':>9} {record['wall_s']:8.1f}s  new")
+            continue
+        change = (record["wall_s"] - before["wall_s"]) / max(before["wall_s"], 1e-9)
+        print(f"  {name:<{width}} {before['wall_s']:8.1f}s {record['wall_s']:8.1f}s {change:+8.0%}")
+        if before.get("status") != "ok" or record.get("status") != "ok":
+            continue
+        flagged = regressions(before, record, threshold, min_seconds, min_mb)
+        if flagged:
+            regressed += 1
+            print(f"    ✗ {'; '.join(flagged)}")
+    for name in old_steps.keys() - new_steps.keys():
+        print(f"  {name:<{width}} {old_steps[name]['wall_s']:8.1f}s {'-':>9}  not run")
+
+    print(f"\n  Total: {old['wall_s']:.1f}s -> {new['wall_s']:.1f}s")
+    if regressed:
+        print(f"  ✗ {regressed} step(s) regressed by more than {threshold:.0%}")
+    else:
+        print(f"  ✓ No step regressed by more than {threshold:.0%}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("reports", nargs="+", metavar="REPORT",
+                        help="old and new report files, or one script name to compare its latest two")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="flag changes worse than this fraction (default: 0.2)")
+    parser.add_argument("--min-seconds", type=float, default=1.0,
+                        help="ignore time changes in steps shorter than this")
+    parser.add_argument("--min-mb", type=float, default=64,
+                        help="ignore memory / spill changes smaller than this")
+    parser.add_argument("--dir", default=REPORT_DIR, help="where to look up reports by script name")
+    args = parser.parse_args()
+
+    if len(args.reports) == 1:
+        old_path, new_path = latest_reports(args.reports[0], args.dir)
+    elif len(args.reports) == 2:
+        old_path, new_path = args.reports
+    else:
+        parser.error("give two report files or one script name")
+    if compare(old_path, new_path, args.threshold, args.min_seconds, args.min_mb):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Physical layout of the aggregate tables: row order and ART indexes.
+
+DuckDB keeps min/max zonemaps per row group (~122k rows). A table stored
+sorted by its lookup key answers `WHERE key = ?` by reading just the row
+groups whose range covers the key. That needs nothing extra on disk and
+works for ranges too. An ART index only helps an unsorted table with
+equality filters matching a few thousand rows at most (DuckDB's
+index_scan_max_count), and it slows the build and grows the file.
+
+Each table has two stock layouts:
+
+  indexed  the original one: rows in build order, plus ART indexes
+  sorted   rows ordered by the table's main lookup key, no indexes
+
+bench_layout.py times the router queries for each table against these and
+some variants, and writes the winner per table to LAYOUT_PATH.
+AGG_LAYOUT=auto (the default) uses that file and falls back to indexed for
+any table it doesn't list. AGG_LAYOUT=indexed or sorted forces one layout
+everywhere.
+
+agg_provider_procedure_monthly is not listed because its build always
+writes it sorted by (npi_id, hcpcs_code, month).
+
+Layouts apply on full rebuilds. An incremental refresh keeps the indexes
+but appends the new months to the end of each table, so rebuild now and
+then to get the sort order back.
+"""
+import json
+import os
+
+DB_PATH = os.environ.get("DUCKDB_PATH", "/Users/charl/Programming/medicaid/medicaid.duckdb")
+LAYOUT_PATH = os.environ.get("AGG_LAYOUT_PATH", DB_PATH + ".layout.json")
+MODES = ("auto", "indexed", "sorted")
+MODE = os.environ.get("AGG_LAYOUT", "auto")
+
+# The original layout: {table: {index name: columns}}
+INDEXED = {
+    "agg_provider_summary": {"idx_prov_summary_npi": "npi_id"},
+    "agg_provider_monthly": {"idx_prov_monthly_npi": "npi_id"},
+    "agg_provider_procedure": {"idx_prov_proc_npi": "npi_id"},
+    "agg_procedure_summary": {"idx_proc_summary_code": "hcpcs_code"},
+    "agg_procedure_monthly": {"idx_proc_monthly_code": "hcpcs_code"},
+    "agg_state_monthly": {"idx_state_monthly_state": "state"},
+    "map_providers": {
+        "idx_map_prov_npi": "npi",
+        "idx_map_prov_npi_id": "npi_id",
+        "idx_map_prov_state": "state",
+    },
+}
+
+# Main lookup key of each table, as an ORDER BY list
+SORTED = {
+    "agg_provider_summary": "npi_id",
+    "agg_provider_monthly": "npi_id, month",
+    "agg_provider_procedure": "hcpcs_code, total_paid DESC",
+    "agg_procedure_summary": "hcpcs_code",
+    "agg_procedure_monthly": "hcpcs_code, month",
+    "agg_state_monthly": "state, month",
+    "map_providers": "state, total_paid DESC",
+}
+
+
+def stock(table, mode):
+    """The indexed or sorted layout of table, as {"order_by", "indexes"}."""
+    if mode == "sorted":
+        return {"order_by": SORTED[table], "indexes": {}}
+    return {"order_by": None, "indexes": dict(INDEXED[table])}
+
+
+def chosen(path=None):
+    """Per-table layouts picked by bench_layout.py ({} if it hasn't run)."""
+    path = path or LAYOUT_PATH
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["tables"]
+
+
+def layout(table, mode=None):
+    """The layout table is built with under mode (default MODE)."""
+    mode = mode or MODE
+    if mode not in MODES:
+        raise ValueError(f"AGG_LAYOUT must be one of {', '.join(MODES)}, got {mode!r}")
+    if mode == "auto":
+        picked = chosen().get(table)
+        if picked:
+            return {"order_by": picked["order_by"], "indexes": picked["indexes"]}
+        mode = "indexed"
+    return stock(table, mode)
+
+
+def sort(con, table, order_by):
+    """Rewrite table in ORDER BY order (drops its indexes)."""
+    con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {table} ORDER BY {order_by}")
+
+
+def sort_table(con, table):
+    """Sort a freshly built table if its layout asks for it; returns the key."""
+    if table not in SORTED:
+        return None
+    order_by = layout(table)["order_by"]
+    if order_by:
+        sort(con, table, order_by)
+    return order_by
+
+
+def create_indexes(con, table, indexes):
+    """Make table's ART indexes exactly `indexes`, dropping any others."""
+    schema, _, name = table.rpartition(".")
+    existing = {
+        r[0] for r in con.execute(
+            "SELECT index_name FROM duckdb_indexes() WHERE table_name = ?"
+            + (" AND database_name = ?" if schema else " AND database_name = current_database()"),
+            [name] + ([schema] if schema else []),
+        ).fetchall()
+    }
+    for index in existing - set(indexes):
+        con.execute(f"DROP INDEX {schema + '.' if schema else ''}{index}")
+    for index, columns in indexes.items():
+        con.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table}({columns})")
+
+
+def index_table(con, table):
+    """Bring table's indexes in line with its layout."""
+    create_indexes(con, table, layout(table)["indexes"])
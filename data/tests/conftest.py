@@ -0,0 +1,64 @@
+"""Fixtures for the pipeline script tests: the numbered scripts as modules
+and small in-memory databases in the shapes they read."""
+import importlib.util
+import os
+import sys
+
+import duckdb
+import pytest
+
+SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts"))
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+def load_script(filename):
+    """Import a numbered pipeline script as a module (as run_pipeline.py does)."""
+    name = "pipeline_" + os.path.splitext(filename)[0].lstrip("0123456789_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def aggregates():
+    return load_script("01_build_aggregates.py")
+
+
+@pytest.fixture(scope="session")
+def oig():
+    return load_script("05_load_oig.py")
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def spending(con):
+    """A few thousand spending rows with the awkward cases of the real file:
+    repeated npi x hcpcs x month keys (one per servicing NPI), a blank
+    billing NPI, billing NPIs missing from nppes and negative payments."""
+    con.execute("""
+        CREATE TABLE spending AS
+        SELECT
+            CASE WHEN i % 97 = 0 THEN NULL ELSE CAST(1000000000 + i % 50 AS VARCHAR) END
+                AS BILLING_PROVIDER_NPI_NUM,
+            CAST(2000000000 + i % 7 AS VARCHAR) AS SERVICING_PROVIDER_NPI_NUM,
+            'C' || (i % 13) AS HCPCS_CODE,
+            '2023-' || LPAD(CAST(1 + i % 12 AS VARCHAR), 2, '0') AS CLAIM_FROM_MONTH,
+            CAST(11 + i % 40 AS BIGINT) AS TOTAL_UNIQUE_BENEFICIARIES,
+            CAST(12 + i % 61 AS BIGINT) AS TOTAL_CLAIMS,
+            (i % 1000) * 1.37 - CASE WHEN i % 211 = 0 THEN 900 ELSE 0 END AS TOTAL_PAID
+        FROM range(8000) t(i)
+    """)
+    # Billing NPIs ending 40-49 have no nppes row
+    con.execute("""
+        CREATE TABLE nppes AS
+        SELECT 1000000000 + i AS npi, ['CA', 'NY', 'TX'][1 + i % 3] AS practice_state
+        FROM range(40) t(i)
+    """)
+    return con
@@ -0,0 +1,20 @@
+"""The single-scan build against the original seven-scan SQL."""
+
+
+def test_single_scan_matches_baseline(spending, aggregates):
+    aggregates.build_baseline(spending)
+    aggregates.build_single_scan(spending)
+    for table in aggregates.AGG_TABLES:
+        assert aggregates.diff_tables(spending, aggregates.BASELINE_SCHEMA, table) == (0, []), table
+
+
+def test_diff_reports_changed_values_and_types(spending, aggregates):
+    aggregates.build_baseline(spending)
+    aggregates.build_single_scan(spending)
+    spending.execute("UPDATE agg_procedure_summary SET unique_providers = unique_providers + 1 WHERE hcpcs_code = 'C1'")
+    spending.execute("ALTER TABLE agg_provider_monthly ALTER total_claims TYPE BIGINT")
+
+    assert aggregates.diff_tables(spending, aggregates.BASELINE_SCHEMA, "agg_procedure_summary") == (1, [])
+    rows, types = aggregates.diff_tables(spending, aggregates.BASELINE_SCHEMA, "agg_provider_monthly")
+    assert rows == 0
+    assert types == ["total_claims BIGINT (baseline HUGEINT)"]
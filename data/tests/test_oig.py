@@ -0,0 +1,75 @@
+"""Incremental LEIE refresh against a full reload of the same file."""
+import pytest
+
+HEADER = "LASTNAME,FIRSTNAME,BUSNAME,SPECIALTY,NPI,STATE,EXCLTYPE,EXCLDATE,REINDATE"
+
+
+def row(npi, last="DOE", excldate="20200101", reindate="00000000", excltype="1128a1"):
+    return f"{last},JANE,,NURSING,{npi},CA,{excltype},{excldate},{reindate}"
+
+
+# 1000000001-1000000005 billed Medicaid; 1999999999 never did
+FIRST = [
+    row("1000000001"),
+    row("1000000002"),
+    row("1000000002"),  # an exact duplicate stays a separate row
+    row("1000000003"),
+    row("1000000004"),
+    row("1999999999"),
+    row("0000000000"),  # no NPI
+]
+SECOND = [
+    row("1000000001"),
+    row("1000000002"),
+    row("1000000002"),
+    row("1000000003", reindate="20240301"),  # reinstated
+    # 1000000004 no longer listed
+    row("1000000005", excldate="20240201"),  # new
+    row("1999999999", excltype="1128b4"),  # changed
+    row("0000000000"),
+]
+
+
+@pytest.fixture
+def providers(con):
+    con.execute("""
+        CREATE TABLE dim_npi AS
+        SELECT CAST(i AS INTEGER) AS npi_id, CAST(1000000000 + i AS VARCHAR) AS npi FROM range(1, 6) t(i)
+    """)
+    con.execute("""
+        CREATE TABLE map_providers AS
+        SELECT npi_id, 'PROVIDER ' || npi_id AS name, 'CA' AS state, 'FRESNO' AS city,
+               1000.0 * npi_id AS total_paid, 10 * npi_id AS total_claims
+        FROM dim_npi
+    """)
+    return con
+
+
+def leie(tmp_path, name, rows):
+    path = tmp_path / name
+    path.write_text("\n".join([HEADER] + rows) + "\n")
+    return str(path)
+
+
+def exclusions(con):
+    return con.execute("SELECT * FROM oig_exclusions ORDER BY row_hash").fetchall()
+
+
+def test_refresh_matches_full_reload(providers, oig, tmp_path, capsys):
+    oig.load_oig(providers, leie(tmp_path, "first.csv", FIRST), full=True)
+    oig.load_oig(providers, leie(tmp_path, "second.csv", SECOND))
+    refreshed = exclusions(providers)
+    assert "2 added, 3 removed (1 reinstated, 1 no longer listed)" in capsys.readouterr().out
+
+    oig.load_oig(providers, leie(tmp_path, "second.csv", SECOND), full=True)
+    assert refreshed == exclusions(providers)
+    assert sorted(r[1] for r in refreshed) == ["1000000001", "1000000002", "1000000002", "1000000005", "1999999999"]
+
+
+def test_reinstated_providers_are_not_matched(providers, oig, tmp_path):
+    oig.load_oig(providers, leie(tmp_path, "first.csv", FIRST), full=True)
+    oig.load_oig(providers, leie(tmp_path, "second.csv", SECOND))
+
+    matched = providers.execute("SELECT pos, npi FROM oig_matched ORDER BY pos").fetchall()
+    assert matched == [(1, "1000000005"), (2, "1000000002"), (3, "1000000002"), (4, "1000000001")]
+    assert providers.execute("SELECT matched, listed FROM oig_summary").fetchone() == (4, 5)
@@ -41,6 +41,7 @@ export interface ProviderDetail extends ProviderSummary {
   zip: string;
   lat: number | null;
   lng: number | null;
+  geo_confidence: 'exact' | 'mailing' | 'nearest' | 'none';
   unique_procedures: number;
   first_month: string;
   last_month: string;